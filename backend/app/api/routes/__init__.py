@@ -0,0 +1,101 @@
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query, Request
+from pydantic import ValidationError
+from typing import List, Optional
+from app.core.config import settings
+from app.models.schemas import PatientInput, FinalResult
+from app.services.admission import AdmissionRejected, client_rate_limiter
+from app.services.pipeline import run_triage
+from app.services.routing import model_router
+from app.services.ingestion import (
+    CaseTooLargeError, IngestedCase, InvalidImageError, TooManyImagesError, UploadTooLargeError, ingest_case
+)
+from app.services.tokens import PromptTooLargeError, TokenBudget
+from app.services.triage_rules import triage_rules
+import json
+
+router = APIRouter()
+
+def case_uploads(file: Optional[UploadFile], files: List[UploadFile]) -> List[UploadFile]:
+    """The single `file` field and the repeated `files` field of a form, as one list."""
+    return ([file] if file else []) + [upload for upload in files if upload]
+
+async def read_case_upload(uploads: List[UploadFile]) -> IngestedCase:
+    """Ingests every image of a case, mapping ingestion failures to HTTP errors."""
+    try:
+        return await ingest_case(uploads)
+    except (UploadTooLargeError, TooManyImagesError, CaseTooLargeError) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+def fit_user_text(text: Optional[str], budget: TokenBudget) -> Optional[str]:
+    """Applies an LLM token budget to free text from a form, mapping a rejection to 413."""
+    if not text:
+        return text
+    try:
+        return budget.fit_text(text)
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def too_busy(e: AdmissionRejected) -> HTTPException:
+    """429 with a Retry-After hint for work the admission controller turned away."""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after})
+
+def client_id(request: Request) -> str:
+    if settings.client_id_header:
+        value = request.headers.get(settings.client_id_header)
+        if value:
+            return value
+    return request.client.host if request.client else "unknown"
+
+def rate_limit(work: str):
+    """Route dependency charging the caller's token bucket; an empty bucket is answered with 429."""
+    def check(request: Request):
+        try:
+            client_rate_limiter.check(client_id(request), work)
+        except AdmissionRejected as e:
+            raise too_busy(e)
+    return check
+
+def patient_input_params(
+    cancer_type: str,
+    age: int,
+    symptoms: str, # JSON string
+    risk_factors: str, # JSON string
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180)
+) -> PatientInput:
+    """Query-string case fields shared by /analyze and /jobs/analyze."""
+    try:
+        symptoms_list = json.loads(symptoms)
+        risk_factors_list = json.loads(risk_factors)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON format for symptoms or risk_factors")
+
+    try:
+        return PatientInput(
+            cancer_type=cancer_type,
+            age=age,
+            symptoms=symptoms_list,
+            risk_factors=risk_factors_list,
+            latitude=latitude,
+            longitude=longitude
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid case: {e}")
+
+@router.post("/analyze", response_model=FinalResult, dependencies=[Depends(rate_limit("triage"))])
+async def analyze_case(
+    input_data: PatientInput = Depends(patient_input_params),
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File(default=[])
+):
+    uploads = case_uploads(file, files)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Please provide at least one image.")
+    case = await read_case_upload(uploads)
+    return await run_triage(input_data, case.perception_inputs())
+
+@router.get("/analyze/stats")
+async def triage_stats():
+    return {"triage_rules": triage_rules.stats(), "model_router": model_router.stats()}
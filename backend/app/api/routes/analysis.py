@@ -1,51 +1,61 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
-from PIL import Image
-import io
-from app.services.gemini_service import check_relevance, analyze_oncology
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.api.routes import case_uploads, fit_user_text, rate_limit, read_case_upload, too_busy
+from app.services.admission import AdmissionRejected
+from app.services.gemini_service import input_budget
+from app.services.pipeline import run_ai_analysis, stream_ai_analysis
+from app.services.relevance import relevance_prefilter
+from app.services.routing import model_router
 
 router = APIRouter()
 
-@router.post("/ai-analyze")
-async def analyze_case(
-    file: Optional[UploadFile] = File(None),
-    text: Optional[str] = Form(None)
-):
-    if not file and not text:
+async def _content_parts(uploads: List[UploadFile], text: Optional[str]) -> list:
+    if not uploads and not text:
         raise HTTPException(status_code=400, detail="Please provide at least an image or text input.")
 
     content_parts = []
     
-    # Process text
+    # Process text (trimmed or rejected if over the LLM input budget)
+    text = fit_user_text(text, input_budget)
     if text:
         content_parts.append(text)
         
-    # Process image
-    if file:
-        try:
-            image_data = await file.read()
-            image = Image.open(io.BytesIO(image_data))
-            content_parts.append(image)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
-
-    # 1. Guardrail Check
-    is_relevant, reason = await check_relevance(content_parts)
-    
-    if not is_relevant:
-        return {
-            "is_relevant": False,
-            "reason": reason,
-            "analysis": None,
-            "chart_data": None
-        }
-
-    # 2. Oncology Analysis
-    analysis_text, chart_data = await analyze_oncology(content_parts)
-
-    return {
-        "is_relevant": True,
-        "reason": "Analysis successful",
-        "analysis": analysis_text,
-        "chart_data": chart_data
-    }
+    # Process images (near-duplicates dropped; a large scan contributes its overview plus its most informative regions)
+    if uploads:
+        case = await read_case_upload(uploads)
+        content_parts.extend(case.blobs())
+
+    return content_parts
+
+@router.post("/ai-analyze", dependencies=[Depends(rate_limit("ai_analysis"))])
+async def analyze_case(
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File(default=[]),
+    text: Optional[str] = Form(None)
+):
+    content_parts = await _content_parts(case_uploads(file, files), text)
+
+    # Guardrail check + oncology analysis (serial or speculative, see settings.ai_analysis_mode)
+    try:
+        return await run_ai_analysis(content_parts)
+    except AdmissionRejected as e:
+        raise too_busy(e)
+
+@router.post("/ai-analyze/stream", dependencies=[Depends(rate_limit("ai_analysis"))])
+async def analyze_case_stream(
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File(default=[]),
+    text: Optional[str] = Form(None)
+):
+    """Same analysis as /ai-analyze, delivered as server-sent events while Gemini generates it."""
+    content_parts = await _content_parts(case_uploads(file, files), text)
+    return StreamingResponse(
+        stream_ai_analysis(content_parts),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/ai-analyze/stats")
+async def analysis_stats():
+    return {"relevance_prefilter": relevance_prefilter.stats(), "model_router": model_router.stats()}
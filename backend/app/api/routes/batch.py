@@ -0,0 +1,115 @@
+from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import List
+from app.api.routes import rate_limit
+from app.core.config import settings
+from app.models.schemas import BatchCase, BatchCaseResult
+from app.services.ingestion import InvalidImageError, UploadTooLargeError, ingest_image
+from app.services.perception import perception_service
+from app.services.risk import risk_service
+from app.services.pipeline import complete_triage
+import asyncio
+import collections
+import json
+
+router = APIRouter()
+
+@router.post("/analyze/batch", dependencies=[Depends(rate_limit("batch"))])
+async def analyze_batch(
+    cases: str = Form(..., description="JSON array of cases (PatientInput fields plus optional image_ref)"),
+    files: List[UploadFile] = File(default=[])
+):
+    """
+    Triage a cohort in one request. Each case names its image by upload filename
+    (`image_ref`); if no case sets `image_ref` and the number of files equals the
+    number of cases, images are paired by position.
+
+    Results stream back as NDJSON, one `BatchCaseResult` per line, in completion
+    order, so a slow case never holds up the rest. Images are read as their
+    cases come up; one that can't be read fails only its own cases.
+    """
+    try:
+        raw_cases = json.loads(cases)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON format for cases")
+    if not isinstance(raw_cases, list) or not raw_cases:
+        raise HTTPException(status_code=400, detail="cases must be a non-empty JSON array")
+    if len(raw_cases) > settings.batch_max_cases:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.batch_max_cases} cases")
+
+    try:
+        batch = [BatchCase(**c) for c in raw_cases]
+    except (TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid case in batch: {e}")
+
+    positional = len(files) == len(batch) and all(c.image_ref is None for c in batch)
+    if positional:
+        uploads = list(files)
+    else:
+        by_name = {}
+        for upload in files:
+            if upload.filename in by_name:
+                raise HTTPException(status_code=400, detail=f"Duplicate upload filename {upload.filename!r}")
+            by_name[upload.filename] = upload
+        uploads = []
+        for index, case in enumerate(batch):
+            if case.image_ref not in by_name:
+                raise HTTPException(status_code=400, detail=f"Case {index}: no uploaded image matches image_ref {case.image_ref!r}")
+            uploads.append(by_name[case.image_ref])
+
+    return StreamingResponse(
+        _stream_results(batch, uploads),
+        media_type="application/x-ndjson"
+    )
+
+
+async def _stream_results(batch, uploads):
+    """
+    Runs each case start to finish (ingest, perception, risk, cognitive,
+    hospital) under the batch semaphore, so only BATCH_MAX_CONCURRENCY images
+    are held in memory at a time and the first result does not wait for the
+    rest of the cohort. An image shared by several cases is ingested once;
+    cases that reach risk scoring together are scored in one NumPy chunk.
+    """
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+    references = collections.Counter(id(upload) for upload in uploads)
+    ingesting = {}
+
+    async def images_for(upload):
+        key = id(upload)
+        if key not in ingesting:
+            ingesting[key] = asyncio.ensure_future(ingest_image(upload))
+        try:
+            return (await asyncio.shield(ingesting[key])).perception_inputs()
+        finally:
+            references[key] -= 1
+            if not references[key]:
+                ingesting.pop(key).cancel()
+
+    async def run_case(index):
+        case = batch[index]
+        async with semaphore:
+            try:
+                images = await images_for(uploads[index])
+                # 1. Perception Layer: every region of a large scan, aggregated as in /analyze
+                perception = await perception_service.predict_case_async(images, case.cancer_type)
+                # 2. Risk Aggregation Layer (cases finishing together are scored as one NumPy chunk)
+                preliminary = await risk_service.calculate_preliminary_cri_async(case, perception)
+                result = await complete_triage(case, perception, preliminary)
+                return BatchCaseResult(index=index, result=result)
+            except (UploadTooLargeError, InvalidImageError) as e:
+                return BatchCaseResult(index=index, error=f"Invalid image file: {e}")
+            except Exception as e:
+                print(f"Batch case {index} failed: {e}")
+                return BatchCaseResult(index=index, error=str(e))
+
+    tasks = [asyncio.create_task(run_case(i)) for i in range(len(batch))]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            outcome = await finished
+            yield outcome.model_dump_json(exclude_none=True) + "\n"
+    finally:
+        # Client disconnected mid-stream: stop the remaining cases
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse
+from typing import List, Optional, Sequence
+from app.api.routes import case_uploads, fit_user_text, patient_input_params, rate_limit, read_case_upload
+from app.models.schemas import PatientInput
+from app.services.gemini_service import input_budget
+from app.services.jobs import job_queue, JobQueueFullError, PENDING, RUNNING, FAILED
+
+router = APIRouter(prefix="/jobs")
+
+# Polling hint for clients while a job is still pending/running
+RETRY_AFTER_S = 2
+
+async def _submit(kind: str, payload: dict, images: Sequence[bytes]) -> JSONResponse:
+    try:
+        job_id = await job_queue.submit(kind, payload, images)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": PENDING},
+        headers={"Location": f"/api/v1/jobs/{job_id}"}
+    )
+
+@router.post("/analyze", status_code=202, dependencies=[Depends(rate_limit("triage"))])
+async def submit_triage(
+    input_data: PatientInput = Depends(patient_input_params),
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File(default=[])
+):
+    """Queues the /analyze pipeline and returns a job id immediately."""
+    uploads = case_uploads(file, files)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Please provide at least one image.")
+    case = await read_case_upload(uploads)
+    # Every image of the case (for a large scan, each selected region), as /analyze perceives them
+    return await _submit("triage", input_data.model_dump(), case.perception_inputs())
+
+@router.post("/ai-analyze", status_code=202, dependencies=[Depends(rate_limit("ai_analysis"))])
+async def submit_ai_analysis(
+    file: Optional[UploadFile] = File(None),
+    files: List[UploadFile] = File(default=[]),
+    text: Optional[str] = Form(None)
+):
+    """Queues the /ai-analyze guardrail + analysis and returns a job id immediately."""
+    uploads = case_uploads(file, files)
+    if not uploads and not text:
+        raise HTTPException(status_code=400, detail="Please provide at least an image or text input.")
+
+    payload = {"text": fit_user_text(text, input_budget)}
+    blobs = (await read_case_upload(uploads)).blobs() if uploads else []
+    # The same parts /ai-analyze sends: each image's overview plus, for a scan, its selected regions
+    payload["mime_types"] = [blob["mime_type"] for blob in blobs]
+    return await _submit("ai-analysis", payload, [blob["data"] for blob in blobs])
+
+async def _get_job(job_id: str) -> dict:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/stats")
+async def job_stats():
+    return job_queue.stats()
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    job = await _get_job(job_id)
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] in (PENDING, RUNNING):
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job_id, "status": job["status"]},
+            headers={"Retry-After": str(RETRY_AFTER_S)}
+        )
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    return job["result"]
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.services.results import result_recorder
+
+router = APIRouter(prefix="/results")
+
+MAX_PAGE_SIZE = 1000
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+async def _query(method, **filters) -> dict:
+    # Reads hit SQLite; keep them off the event loop
+    try:
+        return await asyncio.to_thread(method, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/triage")
+async def list_triage_results(
+    cancer_type: Optional[str] = None,
+    triage_level: Optional[str] = None,
+    min_cri: Optional[int] = Query(None, ge=0, le=100),
+    max_cri: Optional[int] = Query(None, ge=0, le=100),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Recorded triage results, newest first. Pass `next_cursor` back as
+    `cursor` for the next page; it stays valid while new results arrive.
+    """
+    return await _query(
+        result_recorder.store.query_triage, cancer_type=cancer_type, triage_level=triage_level,
+        min_cri=min_cri, max_cri=max_cri, since=_timestamp(since), until=_timestamp(until),
+        limit=limit, cursor=cursor
+    )
+
+@router.get("/ai-analyses")
+async def list_ai_analyses(
+    is_relevant: Optional[bool] = None,
+    content_key: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Recorded /ai-analyze outcomes, newest first, paginated like /results/triage."""
+    return await _query(
+        result_recorder.store.query_ai_analyses, is_relevant=is_relevant, content_key=content_key,
+        since=_timestamp(since), until=_timestamp(until), limit=limit, cursor=cursor
+    )
+
+@router.get("/stats")
+async def result_stats():
+    return result_recorder.stats()
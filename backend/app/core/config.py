@@ -0,0 +1,189 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid integer for {name}, using default {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid number for {name}, using default {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_choice(name: str, default: str, choices: tuple) -> str:
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        print(f"Unknown {name} '{value}', using default {default}")
+        return default
+    return value
+
+
+def _env_map(name: str) -> dict:
+    pairs = (item.split("=", 1) for item in os.getenv(name, "").split(",") if "=" in item)
+    return {key.strip(): value.strip() for key, value in pairs if key.strip() and value.strip()}
+
+
+class Settings:
+    """
+    Runtime tunables, read once from the environment (or backend/.env).
+    """
+    def __init__(self):
+        # Image ingestion
+        self.max_upload_bytes = _env_int("MAX_UPLOAD_BYTES", 25 * 1024 * 1024)
+        self.upload_chunk_bytes = _env_int("UPLOAD_CHUNK_BYTES", 1024 * 1024)
+        self.image_max_side = _env_int("IMAGE_MAX_SIDE", 1024)
+        self.image_format = os.getenv("IMAGE_FORMAT", "JPEG")
+        self.image_quality = _env_int("IMAGE_QUALITY", 90)
+        # DICOM / TIFF uploads: memory-mapped and read tile by tile, reduced to a few informative regions
+        self.tiled_ingestion = _env_bool("TILED_INGESTION", True)
+        self.max_scan_bytes = _env_int("MAX_SCAN_BYTES", 4 * 1024 * 1024 * 1024)
+        self.scan_tile_size = _env_int("SCAN_TILE_SIZE", 512)
+        self.scan_regions = _env_int("SCAN_REGIONS", 4)
+        self.scan_max_tiles_scored = _env_int("SCAN_MAX_TILES_SCORED", 4096)
+        # Smaller TIFFs (ordinary photos) are decoded whole like any other image
+        self.scan_min_pixels = _env_int("SCAN_MIN_PIXELS", 4096 * 4096)
+        # Multi-image cases: decoded in parallel, near-duplicates (dHash within the distance) dropped
+        self.max_case_images = _env_int("MAX_CASE_IMAGES", 32)
+        # Bytes a case's uploads may hold in memory together (memory-mapped scans don't count)
+        self.max_case_bytes = _env_int("MAX_CASE_BYTES", 100 * 1024 * 1024)
+        self.ingest_workers = _env_int("INGEST_WORKERS", 4)
+        self.image_dedup = _env_bool("IMAGE_DEDUP", True)
+        self.image_dedup_max_distance = _env_int("IMAGE_DEDUP_MAX_DISTANCE", 6)
+
+        # Perception layer (PerceptionService): "numpy", "onnx" or "mock"
+        self.perception_backend = os.getenv("PERCEPTION_BACKEND", "numpy").strip().lower()
+        self.perception_model_dir = os.getenv("PERCEPTION_MODEL_DIR") or None
+        self.perception_models = [m.strip() for m in os.getenv("PERCEPTION_MODELS", "brain,lung,breast,default").split(",") if m.strip()]
+        self.perception_max_batch = _env_int("PERCEPTION_MAX_BATCH", 16)
+        self.perception_max_wait_ms = _env_float("PERCEPTION_MAX_WAIT_MS", 5.0)
+        self.perception_workers = _env_int("PERCEPTION_WORKERS", 2)
+        # How per-image results of one case become its confidence: "max", "mean" or "noisy_or"
+        self.perception_aggregation = _env_choice("PERCEPTION_AGGREGATION", "max", ("max", "mean", "noisy_or"))
+
+        # Gemini access. gemini_API_KEY is the older spelling used by the AI analysis service.
+        self.gemini_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("gemini_API_KEY") or None
+        # Local Gemini stand-in (tools/gemini_stub.py); when set, all LLM calls go there
+        self.gemini_stub_url = os.getenv("GEMINI_STUB_URL") or None
+        # Build the Gemini clients during startup instead of on the first AI request
+        self.llm_warmup = _env_bool("LLM_WARMUP", False)
+
+        # Model tiers and the router between them (app/services/routing.py): guardrails, triage and short
+        # text go to the flash tier, image analyses and inputs of LLM_ROUTE_PRO_MIN_TOKENS or more to pro.
+        # A tier over its error rate or p95 hands its calls to the other one.
+        self.llm_flash_model = os.getenv("LLM_FLASH_MODEL", "gemini-1.5-flash")
+        self.llm_pro_model = os.getenv("LLM_PRO_MODEL", "gemini-1.5-pro")
+        self.llm_routing = _env_bool("LLM_ROUTING", True)
+        self.llm_route_pro_min_tokens = _env_int("LLM_ROUTE_PRO_MIN_TOKENS", 2000)
+        self.llm_route_window = _env_int("LLM_ROUTE_WINDOW", 200)
+        self.llm_route_window_s = _env_float("LLM_ROUTE_WINDOW_S", 60.0)
+        self.llm_route_min_samples = _env_int("LLM_ROUTE_MIN_SAMPLES", 20)
+        self.llm_route_max_error_rate = _env_float("LLM_ROUTE_MAX_ERROR_RATE", 0.2)
+        self.llm_route_max_p95_s = _env_float("LLM_ROUTE_MAX_P95_S", 30.0)
+
+        # Prompt templates (data/prompts/<name>/<version>.*.txt); unpinned prompts use the latest version,
+        # e.g. PROMPT_VERSIONS="guardrail=v1,cognitive_triage=v2"
+        self.prompt_versions = _env_map("PROMPT_VERSIONS")
+        # Budget for user-supplied text per LLM call (estimated tokens, 0 = no cap): "trim" or "reject"
+        self.llm_max_input_tokens = _env_int("LLM_MAX_INPUT_TOKENS", 8000)
+        self.llm_budget_policy = os.getenv("LLM_BUDGET_POLICY", "trim").strip().lower()
+
+        # Resilience for Gemini calls (app/services/resilience.py)
+        self.llm_circuit_failures = _env_int("LLM_CIRCUIT_FAILURES", 5)
+        self.llm_circuit_reset_s = _env_float("LLM_CIRCUIT_RESET_S", 30.0)
+        self.llm_hedge_percentile = _env_float("LLM_HEDGE_PERCENTILE", 0.0)  # 0 disables hedging
+        self.llm_hedge_min_samples = _env_int("LLM_HEDGE_MIN_SAMPLES", 20)
+        self.llm_max_retries = _env_int("LLM_MAX_RETRIES", 1)
+        self.llm_retry_backoff_s = _env_float("LLM_RETRY_BACKOFF_S", 0.1)
+        self.llm_retry_budget_ratio = _env_float("LLM_RETRY_BUDGET_RATIO", 0.1)
+
+        # Cognitive layer (CognitiveService)
+        self.cognitive_max_concurrency = _env_int("COGNITIVE_MAX_CONCURRENCY", 8)
+        self.cognitive_timeout_s = _env_float("COGNITIVE_TIMEOUT_S", 20.0)
+
+        # Admission control in front of the LLM stages (app/services/admission.py): triage is prioritized by
+        # preliminary_cri (0-100), /ai-analyze by ADMISSION_AI_PRIORITY; the lowest priority is shed first
+        self.admission_control = _env_bool("ADMISSION_CONTROL", True)
+        self.admission_max_concurrency = _env_int("ADMISSION_MAX_CONCURRENCY", 16)
+        self.admission_max_queue = _env_int("ADMISSION_MAX_QUEUE", 64)
+        self.admission_queue_timeout_s = _env_float("ADMISSION_QUEUE_TIMEOUT_S", 10.0)
+        self.admission_ai_priority = _env_float("ADMISSION_AI_PRIORITY", 50.0)
+        # Per-client token buckets on the LLM-bound routes (0 disables); clients are told apart by
+        # CLIENT_ID_HEADER when set (e.g. a gateway's authenticated client id), else by address
+        self.client_rate_per_s = _env_float("CLIENT_RATE_PER_S", 5.0)
+        self.client_burst = _env_int("CLIENT_BURST", 20)
+        self.client_id_header = os.getenv("CLIENT_ID_HEADER") or None
+
+        # Batch triage (/analyze/batch)
+        self.batch_max_cases = _env_int("BATCH_MAX_CASES", 5000)
+        self.batch_max_concurrency = _env_int("BATCH_MAX_CONCURRENCY", 16)
+        # How long a finished case waits for others to share its NumPy risk-scoring chunk
+        self.batch_score_wait_ms = _env_float("BATCH_SCORE_WAIT_MS", 2.0)
+
+        # Hospital registry (HospitalService)
+        self.hospital_candidates = _env_int("HOSPITAL_CANDIDATES", 8)
+        self.hospital_reload_interval_s = _env_float("HOSPITAL_RELOAD_INTERVAL_S", 5.0)
+
+        # Cognitive result cache
+        self.cognitive_cache_size = _env_int("COGNITIVE_CACHE_SIZE", 2048)
+        self.cognitive_cache_ttl_s = _env_float("COGNITIVE_CACHE_TTL_S", 6 * 3600.0)
+        self.cognitive_cache_path = os.getenv("COGNITIVE_CACHE_PATH") or None
+
+        # AI analysis (/ai-analyze): "serial" runs the guardrail before the analysis,
+        # "speculative" starts both together and cancels the analysis if the guardrail rejects.
+        self.ai_analysis_mode = os.getenv("AI_ANALYSIS_MODE", "speculative").strip().lower()
+        # Identical in-flight /ai-analyze requests (same image bytes and normalized text) share one run
+        self.ai_analysis_coalescing = _env_bool("AI_ANALYSIS_COALESCING", True)
+
+        # Local relevance pre-classifier ahead of the LLM guardrail (text-only inputs)
+        self.relevance_prefilter_enabled = _env_bool("RELEVANCE_PREFILTER", True)
+        self.relevance_classifier = os.getenv("RELEVANCE_CLASSIFIER", "lexicon")
+        self.relevance_accept_threshold = _env_float("RELEVANCE_ACCEPT_THRESHOLD", 0.9)
+        self.relevance_reject_threshold = _env_float("RELEVANCE_REJECT_THRESHOLD", 0.1)
+
+        # Rule-based fast path between the risk and cognitive stages (/analyze)
+        self.triage_fast_path_enabled = _env_bool("TRIAGE_FAST_PATH", True)
+        self.triage_rules_path = os.getenv("TRIAGE_RULES_PATH") or None
+        # Append every LLM-answered triage case here (JSONL) for tools/eval_triage_rules.py
+        self.triage_record_path = os.getenv("TRIAGE_RECORD_PATH") or None
+
+        # Submit-and-poll job queue (/jobs/*)
+        self.job_workers = _env_int("JOB_WORKERS", 4)
+        self.job_db_path = os.getenv("JOB_DB_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "jobs.sqlite3"
+        )
+        self.job_max_pending = _env_int("JOB_MAX_PENDING", 10000)
+        self.job_retention_s = _env_float("JOB_RETENTION_S", 24 * 3600.0)
+        # A running job older than this is taken to be orphaned by a dead worker and run again
+        self.job_lease_s = _env_float("JOB_LEASE_S", 600.0)
+        # Jobs shed by admission control are retried after Retry-After plus a growing backoff, at most this long
+        self.job_max_defer_s = _env_float("JOB_MAX_DEFER_S", 60.0)
+
+        # Write-behind history of triage and /ai-analyze outcomes (/results/*)
+        self.results_persist = _env_bool("RESULTS_PERSIST", True)
+        self.results_db_path = os.getenv("RESULTS_DB_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "results.sqlite3"
+        )
+        self.results_flush_interval_s = _env_float("RESULTS_FLUSH_INTERVAL_S", 1.0)
+        self.results_batch_size = _env_int("RESULTS_BATCH_SIZE", 500)
+        self.results_max_buffer = _env_int("RESULTS_MAX_BUFFER", 50000)
+        self.results_flush_timeout_s = _env_float("RESULTS_FLUSH_TIMEOUT_S", 10.0)
+
+
+settings = Settings()
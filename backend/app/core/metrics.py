@@ -0,0 +1,346 @@
+import asyncio
+import bisect
+import contextvars
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Pipeline stages span sub-millisecond CPU work up to multi-second LLM calls
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """Base for a labelled metric family in the Prometheus text format."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *labels: str) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "oncodetect_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]
+))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "oncodetect_http_request_duration_seconds", "HTTP request latency until the response starts.",
+    ["method", "route", "status"]
+))
+LLM_FALLBACKS = registry.register(Counter(
+    "oncodetect_llm_fallbacks_total", "LLM calls answered by a fallback instead of the model.", ["service", "reason"]
+))
+LLM_PARSE_FAILURES = registry.register(Counter(
+    "oncodetect_llm_parse_failures_total", "LLM responses whose JSON could not be parsed.", ["service"]
+))
+LLM_STRUCTURED_OUTPUTS = registry.register(Counter(
+    "oncodetect_llm_structured_outputs_total",
+    "LLM answers by parse outcome: schema (valid structured JSON), recovered (by the fallback parser) or failed.",
+    ["service", "outcome"]
+))
+LLM_TOKENS = registry.register(Counter(
+    "oncodetect_llm_tokens_total", "Tokens reported by Gemini usage metadata.", ["service", "kind"]
+))
+LLM_CALL_TOKENS = registry.register(Histogram(
+    "oncodetect_llm_call_tokens", "Tokens per LLM call, from Gemini usage metadata.", ["service", "kind"],
+    buckets=TOKEN_BUCKETS
+))
+LLM_INPUT_TOKENS = registry.register(Histogram(
+    "oncodetect_llm_input_tokens_estimated", "Estimated tokens of user-supplied text per LLM call, before budgeting.",
+    ["service"], buckets=TOKEN_BUCKETS
+))
+LLM_BUDGET_ACTIONS = registry.register(Counter(
+    "oncodetect_llm_budget_actions_total", "User inputs trimmed or rejected by the token budget.", ["service", "action"]
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "oncodetect_cache_requests_total", "Result cache lookups.", ["cache", "result"]
+))
+LLM_RESILIENCE_EVENTS = registry.register(Counter(
+    "oncodetect_llm_resilience_events_total", "Retries, hedges and circuit short-circuits per LLM call type.",
+    ["call", "event"]
+))
+CIRCUIT_STATE = registry.register(Gauge(
+    "oncodetect_circuit_state", "Circuit breaker state per upstream model (0 closed, 1 half-open, 2 open).",
+    ["upstream"]
+))
+TRIAGE_PATH = registry.register(Counter(
+    "oncodetect_triage_path_total", "Triage decisions by path: rule-based fast path or the cognitive LLM.",
+    ["path", "rule"]
+))
+COALESCED_REQUESTS = registry.register(Counter(
+    "oncodetect_coalesced_requests_total",
+    "Requests that started a call (leader) or joined an identical in-flight one (follower).",
+    ["operation", "role"]
+))
+LLM_CALLS_SAVED = registry.register(Counter(
+    "oncodetect_llm_calls_saved_total", "Upstream LLM calls avoided by joining an identical in-flight request.",
+    ["operation"]
+))
+RESULT_RECORDS = registry.register(Counter(
+    "oncodetect_result_records_total", "Results written to the results store, or dropped before reaching it.",
+    ["table", "outcome"]
+))
+RESULT_FLUSH_SECONDS = registry.register(Histogram(
+    "oncodetect_result_flush_duration_seconds", "Time to write one batch to the results store."
+))
+LLM_ROUTE_DECISIONS = registry.register(Counter(
+    "oncodetect_llm_route_decisions_total", "Model tier picked per LLM call, and why.", ["task", "tier", "reason"]
+))
+LLM_TIER_SECONDS = registry.register(Histogram(
+    "oncodetect_llm_tier_duration_seconds", "LLM call latency per model tier (successful calls).", ["tier", "task"]
+))
+LLM_TIER_CALLS = registry.register(Counter(
+    "oncodetect_llm_tier_calls_total", "LLM calls per model tier by outcome (ok, error).", ["tier", "task", "outcome"]
+))
+ADMISSION_QUEUE_WAIT = registry.register(Histogram(
+    "oncodetect_admission_queue_wait_seconds",
+    "Time LLM-bound work waited for an admission slot, by outcome (admitted, shed, timeout).", ["work", "outcome"]
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "oncodetect_admission_rejections_total",
+    "LLM-bound work not admitted: rate_limited, queue_full, shed (evicted by more urgent work) or timeout.",
+    ["work", "reason"]
+))
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "oncodetect_admission_queue_depth", "Work waiting for an admission slot.", ["controller"]
+))
+ADMISSION_IN_FLIGHT = registry.register(Gauge(
+    "oncodetect_admission_in_flight", "Work holding an admission slot.", ["controller"]
+))
+CASE_IMAGES = registry.register(Counter(
+    "oncodetect_case_images_total", "Images uploaded with a case, kept or dropped as a near-duplicate.", ["outcome"]
+))
+STARTUP_SECONDS = registry.register(Gauge(
+    "oncodetect_startup_seconds", "Cold-start cost of this worker by phase (import, startup, llm_sdk_import, llm_warmup).",
+    ["phase"]
+))
+
+# Stages recorded while handling the current request, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as pipeline stage `name` (works around `await`s too)."""
+    start = time.perf_counter()
+    cancelled = False
+    try:
+        yield
+    except asyncio.CancelledError:
+        # Cancelled work (e.g. a discarded speculative call) is not a stage sample
+        cancelled = True
+        raise
+    finally:
+        if not cancelled:
+            observe_stage(name, time.perf_counter() - start)
+
+
+def record_usage(service: str, response):
+    """Adds prompt/output token counts from a Gemini response's usage_metadata, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, attr, 0) or 0
+        if count:
+            LLM_TOKENS.inc(service, kind, amount=count)
+            LLM_CALL_TOKENS.observe(count, service, kind)
+
+
+def server_timing(timings: List[Tuple[str, float]], total_s: float) -> str:
+    # Repeated stages (e.g. per-case stages in a batch) are summed into one entry
+    merged: Dict[str, float] = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    entries.append(f"total;dur={total_s * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _route_label(scope) -> str:
+    """Path template of the matched route ("/api/v1/jobs/{job_id}"), keeping label cardinality bounded."""
+    if "route" not in scope:
+        return "unmatched"
+    # Rebuilt from the request path: routes under an include_router prefix don't carry the full template
+    values = {str(v): k for k, v in scope.get("path_params", {}).items()}
+    segments = [f"{{{values[s]}}}" if s in values else s for s in scope["path"].split("/")]
+    return "/".join(segments)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (streaming responses pass straight through): records
+    request latency and adds a Server-Timing header listing the stages that
+    completed before the response started.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], _route_label(scope), str(message["status"]))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, elapsed).encode("latin-1")))
+                # Lets cross-origin pages (the frontend) read the entries via the Resource Timing API
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
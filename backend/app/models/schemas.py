@@ -1,11 +1,13 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
 
 class PatientInput(BaseModel):
     cancer_type: str = Field(..., description="Type of cancer suspected (e.g., brain, lung, breast)")
     age: int = Field(..., ge=0, le=120, description="Patient age")
     symptoms: List[str] = Field(..., description="List of reported symptoms")
     risk_factors: List[str] = Field(..., description="List of patient risk factors")
+    latitude: Optional[float] = Field(None, ge=-90, le=90, description="Patient latitude, for nearest-hospital lookup")
+    longitude: Optional[float] = Field(None, ge=-180, le=180, description="Patient longitude, for nearest-hospital lookup")
 
 class PerceptionOutput(BaseModel):
     prediction: str = Field(..., description="Predicted class from ML model")
@@ -20,11 +22,51 @@ class LLMInput(BaseModel):
     risk_factors: List[str]
 
 class LLMOutput(BaseModel):
-    triage_level: str = Field(..., description="Low, Moderate, High, or Critical")
+    triage_level: str = Field(..., description="Low, Moderate, High, or Critical",
+                              json_schema_extra={"enum": ["Low", "Moderate", "High", "Critical"]})
     risk_adjustment: int = Field(..., ge=-10, le=10, description="Adjustment score from -10 to +10")
     explanation: str = Field(..., description="Reasoning for the triage level")
     recommendation: str = Field(..., description="Suggested next steps")
 
+class RelevanceOutput(BaseModel):
+    is_relevant: bool = Field(..., description="Whether the input is oncology or medical content")
+    reason: str = Field(..., description="Brief explanation why")
+
+class ChartValue(BaseModel):
+    label: str
+    value: float
+
+class ChartData(BaseModel):
+    """
+    Chart inputs for the AI analysis page. Gemini response schemas have no
+    free-form maps, so the model returns label/value lists; `as_chart` gives
+    the {label: value} mapping the API has always served.
+    """
+    cancer_types_probability: List[ChartValue] = Field(
+        ..., description="Probability from 0.0 to 1.0 for Benign/Normal, Malignant (General) and any specific types"
+    )
+    risk_factors: List[ChartValue] = Field(
+        ..., description="Score from 0 to 10 for Age, Family History, Lifestyle and Visual Evidence"
+    )
+
+    @field_validator("cancer_types_probability", "risk_factors", mode="before")
+    @classmethod
+    def _from_mapping(cls, value):
+        # Free-text answers (the fallback path) use the {label: value} form
+        if isinstance(value, dict):
+            return [{"label": label, "value": v} for label, v in value.items()]
+        return value
+
+    def as_chart(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "cancer_types_probability": {item.label: item.value for item in self.cancer_types_probability},
+            "risk_factors": {item.label: item.value for item in self.risk_factors},
+        }
+
+class OncologyAnalysis(BaseModel):
+    analysis: str = Field(..., description="Detailed analysis, probability assessment and recommendations, as Markdown")
+    chart_data: ChartData = Field(..., description="Data for the malignancy probability and risk factor charts")
+
 class FinalResult(BaseModel):
     cancer_type: str
     ml_confidence: float
@@ -34,3 +76,11 @@ class FinalResult(BaseModel):
     explanation: str
     recommendation: str
     hospital_recommendation: Optional[str] = None
+
+class BatchCase(PatientInput):
+    image_ref: Optional[str] = Field(None, description="Filename of the uploaded image for this case")
+
+class BatchCaseResult(BaseModel):
+    index: int = Field(..., description="Position of the case in the submitted batch")
+    result: Optional[FinalResult] = None
+    error: Optional[str] = None
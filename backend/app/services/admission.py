@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTIONS
+
+
+class AdmissionRejected(Exception):
+    """LLM-bound work that was not admitted: rate-limited, shed from a full queue, or timed out waiting."""
+    def __init__(self, reason: str, retry_after_s: float):
+        super().__init__(f"Server busy ({reason.replace('_', ' ')}), retry in {max(1, math.ceil(retry_after_s))}s")
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+    @property
+    def retry_after(self) -> str:
+        """Value for a Retry-After header (whole seconds, at least 1)."""
+        return str(max(1, math.ceil(self.retry_after_s)))
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled at `rate_per_s`; each request takes one."""
+    def __init__(self, rate_per_s: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate_per_s = rate_per_s
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._clock = clock
+        self._updated = clock()
+
+    def try_take(self) -> float:
+        """Takes a token; returns 0 on success, else the seconds until one will be available."""
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate_per_s
+
+
+class ClientRateLimiter:
+    """
+    A token bucket per client. Only the `max_clients` most recently seen
+    clients are tracked, so a flood of distinct ids can't grow it without bound
+    (an evicted client simply starts over with a full bucket).
+    """
+    def __init__(self, rate_per_s: float, burst: float, max_clients: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_s > 0
+
+    def check(self, client: str, work: str):
+        """Charges `client` one token; raises AdmissionRejected("rate_limited") when its bucket is empty."""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate_per_s, self.burst, self._clock)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            wait_s = bucket.try_take()
+        if wait_s > 0:
+            ADMISSION_REJECTIONS.inc(work, "rate_limited")
+            raise AdmissionRejected("rate_limited", wait_s)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class AdmissionTicket:
+    """A held admission slot; `release` hands it to the most urgent waiter. Safe to release twice."""
+    def __init__(self, controller: Optional["AdmissionController"], waited_s: float):
+        self._controller = controller
+        self.waited_s = waited_s
+        self._started = time.perf_counter()
+
+    def release(self):
+        if self._controller is not None:
+            controller, self._controller = self._controller, None
+            controller._release(time.perf_counter() - self._started)
+
+
+class AdmissionController:
+    """
+    Priority admission in front of the LLM stages. At most `max_concurrency`
+    units of work hold a slot; the rest wait in a priority queue (most urgent
+    first, FIFO among equals) of at most `max_queue` entries. When the queue is
+    full, its least urgent waiter is shed to make room for more urgent work,
+    or the newcomer is rejected if nothing queued ranks below it. Waiters give
+    up after `queue_timeout_s`. `max_queue` may be 0 (no waiting: work that
+    finds every slot taken is rejected at once). Rejections carry a Retry-After estimate based
+    on the queue depth and how long slots are typically held.
+    """
+    def __init__(self, name: str, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout_s: Optional[float] = None, enabled: Optional[bool] = None):
+        self.name = name
+        self.enabled = settings.admission_control if enabled is None else enabled
+        self.max_concurrency = settings.admission_max_concurrency if max_concurrency is None else max_concurrency
+        self.max_queue = settings.admission_max_queue if max_queue is None else max_queue
+        # Admission is switched off with `enabled`; a controller that can never admit anything is a misconfiguration
+        if self.max_concurrency < 1:
+            raise ValueError(f"Admission controller '{name}': max_concurrency must be at least 1, got {self.max_concurrency}")
+        if self.max_queue < 0:
+            raise ValueError(f"Admission controller '{name}': max_queue must not be negative, got {self.max_queue}")
+        self.queue_timeout_s = settings.admission_queue_timeout_s if queue_timeout_s is None else queue_timeout_s
+        self.in_flight = 0
+        # Entries: [-priority, sequence, future, work, timeout handle]; only live waiters are kept
+        self._queue: List[list] = []
+        self._sequence = itertools.count()
+        self._loop = None
+        self._hold_s = 1.0  # moving average of slot hold time
+        self._report()
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def retry_after_s(self) -> float:
+        return (len(self._queue) / self.max_concurrency + 1) * self._hold_s
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    async def acquire(self, priority: float, work: str) -> AdmissionTicket:
+        """
+        Waits for a slot. Raises AdmissionRejected ("queue_full", "shed" or
+        "timeout") if the work is not admitted.
+        """
+        if not self.enabled:
+            return AdmissionTicket(None, 0.0)
+        loop = self._bind_loop()
+        if self.in_flight < self.max_concurrency and not self._queue:
+            self.in_flight += 1
+            self._report()
+            ADMISSION_QUEUE_WAIT.observe(0.0, work, "admitted")
+            return AdmissionTicket(self, 0.0)
+
+        if len(self._queue) >= self.max_queue:
+            lowest = max(self._queue, default=None)  # least urgent, newest among equals
+            if lowest is None or -lowest[0] >= priority:
+                ADMISSION_REJECTIONS.inc(work, "queue_full")
+                raise AdmissionRejected("queue_full", self.retry_after_s())
+            self._drop(lowest)
+            ADMISSION_REJECTIONS.inc(lowest[3], "shed")
+            lowest[2].set_exception(AdmissionRejected("shed", self.retry_after_s()))
+
+        future = loop.create_future()
+        entry = [-priority, next(self._sequence), future, work, None]
+        entry[4] = loop.call_later(self.queue_timeout_s, self._expire, entry)
+        heapq.heappush(self._queue, entry)
+        self._report()
+
+        start = time.perf_counter()
+        try:
+            await future
+        except AdmissionRejected as e:
+            ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - start, work, e.reason)
+            raise
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just as the caller went away: pass it on
+                self._release(0.0)
+            elif entry in self._queue:
+                self._drop(entry)
+            raise
+        waited_s = time.perf_counter() - start
+        ADMISSION_QUEUE_WAIT.observe(waited_s, work, "admitted")
+        return AdmissionTicket(self, waited_s)
+
+    @asynccontextmanager
+    async def slot(self, priority: float, work: str) -> AsyncIterator[float]:
+        """`acquire` + `release` around a block; yields the seconds spent waiting."""
+        ticket = await self.acquire(priority, work)
+        try:
+            yield ticket.waited_s
+        finally:
+            ticket.release()
+
+    def _release(self, held_s: float):
+        self._hold_s = 0.8 * self._hold_s + 0.2 * held_s
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            entry[4].cancel()
+            if not entry[2].done():
+                # Hand the slot straight to the most urgent waiter; in_flight stays the same
+                entry[2].set_result(None)
+                self._report()
+                return
+        self.in_flight = max(0, self.in_flight - 1)
+        self._report()
+
+    def _expire(self, entry: list):
+        if entry in self._queue and not entry[2].done():
+            self._drop(entry)
+            ADMISSION_REJECTIONS.inc(entry[3], "timeout")
+            entry[2].set_exception(AdmissionRejected("timeout", self.retry_after_s()))
+
+    def _drop(self, entry: list):
+        entry[4].cancel()
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        self._report()
+
+    def _bind_loop(self):
+        # Futures are bound to the loop they are created on, so start afresh if the
+        # controller outlives its event loop (tests, reloads)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = []
+            self.in_flight = 0
+        return loop
+
+    def _report(self):
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue), self.name)
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+
+
+# Shared by every LLM-bound stage: triage and /ai-analyze draw on the same Gemini quota
+llm_admission = AdmissionController("llm")
+client_rate_limiter = ClientRateLimiter(settings.client_rate_per_s, settings.client_burst)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from app.models.schemas import LLMInput
+
+
+def llm_input_key(data: LLMInput, confidence_step: float = 0.05) -> str:
+    """
+    Canonical content hash of an LLMInput. Inputs that differ only in casing,
+    whitespace, list order or sub-bucket ML confidence map to the same key.
+    """
+    bucket = round(round(data.ml_confidence / confidence_step) * confidence_step, 4)
+    normalized = {
+        "cancer_type": data.cancer_type.strip().lower(),
+        "ml_confidence": bucket,
+        "preliminary_cri": data.preliminary_cri,
+        "symptoms": sorted(s.strip().lower() for s in data.symptoms),
+        "risk_factors": sorted(r.strip().lower() for r in data.risk_factors),
+        "age": data.age,
+    }
+    canonical = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL, a size limit and optional JSON
+    persistence. Values must be JSON-serializable when `persist_path` is set.
+    """
+    def __init__(self, max_size: int = 1024, ttl_s: float = 3600.0,
+                 persist_path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.persist_path = persist_path
+        self._clock = clock
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if persist_path:
+            self.load()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def save(self):
+        """Atomically writes unexpired entries (LRU order preserved) to `persist_path`."""
+        if not self.persist_path:
+            return
+        now = self._clock()
+        with self._lock:
+            entries = [[k, exp, v] for k, (exp, v) in self._data.items() if exp > now]
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"Error saving cache to {self.persist_path}: {e}")
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path) or self.max_size <= 0:
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading cache from {self.persist_path}: {e}")
+            return
+        now = self._clock()
+        with self._lock:
+            for key, expires_at, value in entries[-self.max_size:]:
+                if expires_at > now:
+                    self._data[key] = (expires_at, value)
@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.core.metrics import COALESCED_REQUESTS
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def content_parts_key(content_parts: list, *extra: str) -> Optional[str]:
+    """
+    Content hash of Gemini content parts: text parts are normalized (casing,
+    whitespace), image blobs are hashed by their bytes and MIME type. None if
+    a part is neither (nothing to hash it by).
+    """
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(b"x\0" + value.encode("utf-8") + b"\0")
+    for part in content_parts:
+        if isinstance(part, str):
+            digest.update(b"t\0" + normalize_text(part).encode("utf-8") + b"\0")
+        elif isinstance(part, dict) and isinstance(part.get("data"), bytes):
+            data = part["data"]
+            digest.update(b"b\0" + part.get("mime_type", "").encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(data).digest())
+        else:
+            return None
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving while it is in
+    flight wait for the same result (or exception) instead of starting their
+    own. The call belongs to no single caller: one waiter cancelling leaves it
+    running for the others, and it is only cancelled once every waiter is gone.
+    Nothing is kept after the call finishes (that's what the caches are for).
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns (result, shared); `shared` is True when another caller's call was joined."""
+        call = self._calls.get(key)
+        shared = call is not None and call.task.get_loop() is asyncio.get_running_loop()
+        if shared:
+            COALESCED_REQUESTS.inc(self.name, "follower")
+        else:
+            COALESCED_REQUESTS.inc(self.name, "leader")
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Last waiter went away (cancelled): nobody wants the result any more
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -1,92 +1,246 @@
-import os
 import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from app.models.schemas import LLMInput, LLMOutput
-from dotenv import load_dotenv
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS, LLM_FALLBACKS, record_usage, stage
+from app.services.admission import AdmissionController, AdmissionRejected, llm_admission
+from app.services.cache import TTLCache, llm_input_key
+from app.services.llm import llm_provider
+from app.services.prompts import PromptTemplate, load_prompt
+from app.services.resilience import CircuitOpenError, ResilientCall
+from app.services.routing import FLASH, TIERS, TRIAGE, model_router
+from app.services.structured import parse_structured, structured_config
+from app.services.tokens import PromptTooLargeError, TokenBudget, estimate_tokens
+from app.services.triage_rules import record_case
 
-load_dotenv()
+# The tier triage usually runs on; the router may move a call to the other one
+MODEL_NAME = model_router.model_name(FLASH)
+TRIAGE_PROMPT = load_prompt("cognitive_triage")
+_UNSET = object()
+# Built once: the answer must be JSON matching LLMOutput
+GENERATION_CONFIG = structured_config(LLMOutput)
 
-import google.generativeai as genai
+class LocalQueueTimeout(Exception):
+    """No in-flight slot freed up within the deadline; the model was never called."""
+
+def model_options(prompt: PromptTemplate = TRIAGE_PROMPT) -> dict:
+    """Client options for the triage model: the static instructions go in once as its system instruction."""
+    return {"system_instruction": prompt.system}
 
 class CognitiveService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-        else:
-            self.model = None
+    def __init__(self, max_concurrency: Optional[int] = None, timeout_s: Optional[float] = None,
+                 cache: Optional[TTLCache] = None, admission: Optional[AdmissionController] = None):
+        # Clients per tier, resolved on first use through the shared provider (see `model`)
+        self._model = _UNSET
+        self._models = {}
+        # Circuit breaker / hedging / retries around the model call, per tier
+        self.tier_resilience = {tier: ResilientCall("cognitive", model_router.model_name(tier)) for tier in TIERS}
+        self.resilience = self.tier_resilience[FLASH]
+        self.prompt = TRIAGE_PROMPT
+        self.budget = TokenBudget("cognitive")
+        # Priority queue shared with the other LLM stages; cases are ranked by preliminary_cri
+        self.admission = admission or llm_admission
+
+        # 0 is a real setting: no LLM calls at all, or no time to wait for one
+        self.max_concurrency = settings.cognitive_max_concurrency if max_concurrency is None else max_concurrency
+        self.timeout_s = settings.cognitive_timeout_s if timeout_s is None else timeout_s
+        self._semaphore = None
+        self._semaphore_loop = None
+
+        if cache is None:
+            cache = TTLCache(
+                max_size=settings.cognitive_cache_size,
+                ttl_s=settings.cognitive_cache_ttl_s,
+                persist_path=settings.cognitive_cache_path
+            )
+        self.cache = cache
+
+    @property
+    def model(self):
+        """
+        The flash-tier LLM client, or None when no API key / stand-in is
+        configured. Built lazily. A client assigned here answers every tier.
+        """
+        return self._client(FLASH)
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+
+    def _client(self, tier: str):
+        if self._model is not _UNSET:
+            return self._model
+        if not llm_provider.enabled():
+            return None
+        if tier not in self._models:
+            self._models[tier] = llm_provider.model(model_router.model_name(tier), **model_options(self.prompt))
+        return self._models[tier]
 
     def analyze(self, data: LLMInput) -> LLMOutput:
         if not self.model:
             return self._mock_response(data)
 
-        system_prompt = """You are a medical triage decision-support assistant.
-
-Your role is to assist in risk stratification for cancer-related cases.
-You must NOT diagnose cancer or confirm medical conditions.
-You must NOT provide treatment or medication advice.
-
-You will analyze structured inputs including:
-- Machine learning confidence scores
-- Patient symptoms
-- Risk factors
-
-Your task is to:
-1. Assess consistency between imaging confidence and symptoms
-2. Assign a triage level (Low, Moderate, High, Critical)
-3. Provide a conservative risk explanation
-4. Recommend urgency of medical consultation
-
-If uncertainty exists, you must choose the safer, more conservative option."""
-
-        user_prompt = f"""
-Analyze the following patient data:
-
-{{
-  "cancer_type": "{data.cancer_type}",
-  "ml_confidence": {data.ml_confidence},
-  "preliminary_cri": {data.preliminary_cri},
-  "symptoms": {json.dumps(data.symptoms)},
-  "age": {data.age},
-  "risk_factors": {json.dumps(data.risk_factors)}
-}}
-
-Steps to follow:
-1. Check if symptoms align with the given cancer type
-2. Evaluate whether ML confidence and symptoms are consistent
-3. Select ONE triage level: Low, Moderate, High, Critical
-4. Suggest a small adjustment to the risk score (-10 to +10)
-5. Provide a short explanation (2–3 sentences)
-6. Recommend urgency of consultation
-
-Do not use diagnostic language.
-Do not exceed the scope of decision support.
-
-Respond ONLY in valid JSON with this exact format:
-{{
-  "triage_level": "High",
-  "risk_adjustment": 5,
-  "explanation": "The imaging confidence is high and the reported symptoms are neurologically consistent, suggesting elevated risk that requires timely evaluation.",
-  "recommendation": "Consult a specialist within 24–48 hours."
-}}
-"""
+        key = self._cache_key(data)
+        cached = self._from_cache(key)
+        if cached:
+            return cached
+        try:
+            prompt = self._build_prompt(data)
+        except PromptTooLargeError:
+            return self._fallback(data, "oversized")
 
+        breaker = self.resilience.breaker
+        if not breaker.allow():
+            return self._fallback(data, "circuit_open")
         try:
-            response = self.model.generate_content(
-                f"{system_prompt}\n\n{user_prompt}",
-                generation_config=genai.types.GenerationConfig(
-                    response_mime_type="application/json"
+            with stage("cognitive_llm"):
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=self._generation_config()
                 )
-            )
-            
-            content = response.text
-            parsed = json.loads(content)
-            return LLMOutput(**parsed)
-            
         except Exception as e:
             print(f"LLM Error: {e}")
+            breaker.record_failure()
+            return self._fallback(data, "error")
+        breaker.record_success()
+
+        try:
+            return self._store(key, data, self._parse_response(response))
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            return self._fallback(data, "error")
+
+    async def analyze_async(self, data: LLMInput) -> LLMOutput:
+        """
+        Non-blocking variant of `analyze` for use inside request handlers.
+        Cases wait for an admission slot in order of `preliminary_cri`; one
+        that is shed or times out in the queue gets the deterministic mock
+        response. At most `max_concurrency` LLM calls are in flight at once; a
+        case that waits longer than `timeout_s` for one of those slots, or
+        whose call is not answered within `timeout_s`, falls back too, as does
+        every call while the circuit breaker is open. With `max_concurrency`
+        0 no call is ever made.
+        """
+        if not self.model or self.max_concurrency <= 0:
             return self._mock_response(data)
 
+        key = self._cache_key(data)
+        cached = self._from_cache(key)
+        if cached:
+            return cached
+        try:
+            prompt = self._build_prompt(data)
+        except PromptTooLargeError:
+            return self._fallback(data, "oversized")
+
+        route = model_router.route(TRIAGE, estimate_tokens(prompt))
+        try:
+            async with self.admission.slot(data.preliminary_cri, "triage"):
+                async with self._in_flight_slot():
+                    # Only the upstream call itself counts against the breaker and the tier's health
+                    response = await model_router.call(
+                        route, self.tier_resilience[route.tier],
+                        lambda: self._call_model_async(prompt, route.tier), deadline_s=self.timeout_s
+                    )
+            return self._store(key, data, self._parse_response(response))
+        except AdmissionRejected:
+            return self._fallback(data, "shed")
+        except LocalQueueTimeout:
+            print(f"No LLM slot free within {self.timeout_s}s, using fallback")
+            return self._fallback(data, "busy")
+        except CircuitOpenError:
+            return self._fallback(data, "circuit_open")
+        except asyncio.TimeoutError:
+            print(f"LLM Timeout after {self.timeout_s}s, using fallback")
+            return self._fallback(data, "timeout")
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            return self._fallback(data, "error")
+
+    @asynccontextmanager
+    async def _in_flight_slot(self) -> AsyncIterator[None]:
+        """
+        Holds one of the `max_concurrency` slots for a call with its retries
+        and hedge. Waiting for it is local queueing, not upstream latency, so
+        it has its own `timeout_s` bound (LocalQueueTimeout) outside the
+        call's deadline and circuit breaker.
+        """
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.timeout_s)
+        except asyncio.TimeoutError:
+            raise LocalQueueTimeout() from None
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def _call_model_async(self, prompt: str, tier: str = FLASH):
+        with stage("cognitive_llm"):
+            return await self._client(tier).generate_content_async(
+                prompt,
+                generation_config=self._generation_config()
+            )
+
+    def _fallback(self, data: LLMInput, reason: str) -> LLMOutput:
+        LLM_FALLBACKS.inc("cognitive", reason)
+        return self._mock_response(data)
+
+    def _cache_key(self, data: LLMInput) -> str:
+        # Answers to an older prompt version are not reused (the persisted cache outlives deploys)
+        return f"{self.prompt.fingerprint}:{llm_input_key(data)}"
+
+    def _from_cache(self, key: str) -> Optional[LLMOutput]:
+        cached = self.cache.get(key)
+        CACHE_REQUESTS.inc("cognitive", "hit" if cached else "miss")
+        return LLMOutput(**cached) if cached else None
+
+    def _store(self, key: str, data: LLMInput, output: LLMOutput) -> LLMOutput:
+        # Only genuine LLM answers are cached (or recorded); fallbacks are cheap and should be retried.
+        self.cache.set(key, output.model_dump())
+        if settings.triage_record_path:
+            try:
+                record_case(settings.triage_record_path, data, output)
+            except OSError as e:
+                print(f"Could not record triage case: {e}")
+        return output
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives are bound to the loop they are first used on,
+        # so rebuild the limiter if the service outlives its event loop (tests, reloads).
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _generation_config(self):
+        # Plain dict: accepted by the SDK and avoids importing it just for the config type
+        return GENERATION_CONFIG
+
+    def _parse_response(self, response) -> LLMOutput:
+        record_usage("cognitive", response)
+        # Raises StructuredOutputError (counted as a parse failure) when no valid LLMOutput is found
+        return parse_structured("cognitive", response.text, LLMOutput)
+
+    def _build_prompt(self, data: LLMInput) -> str:
+        """
+        Per-call user message; the static instructions are the model's system
+        instruction. Free-text symptoms and risk factors share the token budget.
+        """
+        items = self.budget.fit_items(data.symptoms + data.risk_factors)
+        symptoms, risk_factors = items[:len(data.symptoms)], items[len(data.symptoms):]
+        return self.prompt.render(
+            cancer_type=data.cancer_type,
+            ml_confidence=data.ml_confidence,
+            preliminary_cri=data.preliminary_cri,
+            symptoms=json.dumps(symptoms),
+            age=data.age,
+            risk_factors=json.dumps(risk_factors)
+        )
+
     def _mock_response(self, data: LLMInput) -> LLMOutput:
         # Fallback if no API key or error
         # Simple logic to simulate LLM reasoning
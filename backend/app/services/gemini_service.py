@@ -1,21 +1,22 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-from PIL import Image
-import json
-import re
-
-# Load environment variables
-load_dotenv()
-
-# Configure Google Gemini
-API_KEY = os.getenv("gemini_API_KEY")
-if not API_KEY:
+import time
+from app.core.metrics import LLM_FALLBACKS, record_usage, stage
+from app.models.schemas import OncologyAnalysis, RelevanceOutput
+from app.services.llm import llm_provider, stub_enabled
+from app.services.prompts import load_prompt
+from app.services.resilience import CircuitOpenError, ResilientCall
+from app.services.routing import ANALYSIS, FLASH, GUARDRAIL, PRO, TIERS, Route, model_router
+from app.services.streaming import parse_analysis
+from app.services.structured import StructuredOutputError, parse_structured, structured_config
+from app.services.tokens import TokenBudget, estimate_parts
+
+# Configure Google Gemini (the SDK itself is imported lazily by llm_provider)
+API_KEY = llm_provider.api_key
+if not API_KEY and not stub_enabled():
     print("Warning: Gemini API Key not found in environment variables.")
 
-# Initialize Gemini if API key is present
-if API_KEY:
-    genai.configure(api_key=API_KEY)
+def llm_enabled() -> bool:
+    # The local stand-in (GEMINI_STUB_URL) needs no key
+    return bool(API_KEY) or stub_enabled()
 
 # Generation Configs
 generation_config = {
@@ -33,54 +34,82 @@ safety_settings = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
 
-# Initialize Models
-# Note: Using the same model for both as in the original code, but could be different.
-model_flash = genai.GenerativeModel(model_name="gemini-1.5-flash", generation_config=generation_config, safety_settings=safety_settings)
-model_pro = genai.GenerativeModel(model_name="gemini-1.5-flash", generation_config=generation_config, safety_settings=safety_settings)
+# Model tiers (flash / pro) are picked per call by the router; each call kind answers in JSON
+# constrained to its Pydantic schema, so no scraping of free text
+MODELS = model_router.models
+MODEL_OPTIONS = {
+    GUARDRAIL: {"generation_config": structured_config(RelevanceOutput, generation_config), "safety_settings": safety_settings},
+    ANALYSIS: {"generation_config": structured_config(OncologyAnalysis, generation_config), "safety_settings": safety_settings},
+}
+
+# Versioned prompt templates (data/prompts/); each is the system instruction of its client,
+# so requests carry only the user's content parts
+PROMPTS = {GUARDRAIL: load_prompt("guardrail"), ANALYSIS: load_prompt("oncology_analysis")}
+GUARDRAIL_PROMPT = PROMPTS[GUARDRAIL]
+ANALYSIS_PROMPT = PROMPTS[ANALYSIS]
+
+# Caps the free text a user can send to /ai-analyze (applied by the routes, before coalescing)
+input_budget = TokenBudget("ai_analysis")
+
+# Clients per (call kind, tier), built on first use by the shared provider.
+# Tests may assign stand-ins directly: model_flash answers every guardrail call, model_pro every analysis.
+_clients = {}
+model_flash = None
+model_pro = None
+
+def _model_options(call: str) -> dict:
+    return {**MODEL_OPTIONS[call], "system_instruction": PROMPTS[call].system}
+
+def _client(call: str, tier: str):
+    stand_in = model_flash if call == GUARDRAIL else model_pro
+    if stand_in is not None:
+        return stand_in
+    if (call, tier) not in _clients:
+        _clients[call, tier] = llm_provider.model(MODELS[tier], **_model_options(call))
+    return _clients[call, tier]
+
+# Circuit breaker / hedging / retries per call kind and tier; the breaker is shared per upstream model
+guardrail_calls = {tier: ResilientCall(GUARDRAIL, MODELS[tier]) for tier in TIERS}
+analysis_calls = {tier: ResilientCall(ANALYSIS, MODELS[tier]) for tier in TIERS}
+# Each call kind's usual tier
+guardrail_call = guardrail_calls[FLASH]
+analysis_call = analysis_calls[PRO]
+
+def warmup_models() -> list:
+    """(model_name, options) pairs for LLMProvider.warmup: both call kinds on both tiers."""
+    return [(MODELS[tier], _model_options(call)) for call in (GUARDRAIL, ANALYSIS) for tier in TIERS]
+
+def _route(call: str, content_parts) -> Route:
+    has_image = any(not isinstance(part, str) for part in content_parts)
+    return model_router.route(call, estimate_parts(content_parts), has_image)
 
 async def check_relevance(content_parts):
     """
     Checks if the input content is related to cancer/oncology/medical analysis.
     Returns: (bool, str) -> (is_relevant, reason)
     """
-    if not API_KEY:
+    if not llm_enabled():
         return False, "API Key missing"
 
-    prompt = """
-    You are a content filter for a specialized Oncologist AI application.
-    Analyze the provided input (text and/or image).
-    Determine if the content is related to:
-    1. Cancer or Oncology (reports, scans, symptoms, questions).
-    2. General medical issues that might require a doctor's review.
-    3. Biological research related to diseases.
-
-    If it is completely unrelated (e.g., a picture of a cat, a car, a generic coding question), answer NO.
-    If it is possibly related, answer YES.
-
-    Output format JSON:
-    {
-        "is_relevant": true/false,
-        "reason": "Brief explanation why."
-    }
-    """
-    
     try:
-        # Gemini python lib supports async generate_content now, or we can run in threadpool if needed.
-        # For simplicity in this port, we'll keep it synchronous but wrap in async def or use async_generate_content if available.
-        # The library's async support is `generate_content_async`.
-        response = await model_flash.generate_content_async([prompt, *content_parts])
-        
-        # Clean up JSON
-        text = response.text.strip()
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            data = json.loads(json_str)
-            return data.get("is_relevant", False), data.get("reason", "Unknown")
-        else:
-            return True, "Could not strict parse check, defaulting to proceed."
+        route = _route(GUARDRAIL, content_parts)
+        with stage("guardrail"):
+            response = await model_router.call(
+                route, guardrail_calls[route.tier],
+                lambda: _client(GUARDRAIL, route.tier).generate_content_async(list(content_parts))
+            )
+        record_usage("guardrail", response)
+        decision = parse_structured("guardrail", response.text, RelevanceOutput)
+        return decision.is_relevant, decision.reason
+    except StructuredOutputError:
+        LLM_FALLBACKS.inc("guardrail", "parse_error")
+        return True, "Could not parse guardrail answer, proceeding with caution."
+    except CircuitOpenError:
+        LLM_FALLBACKS.inc("guardrail", "circuit_open")
+        return True, "Guardrail unavailable, proceeding with caution."
     except Exception as e:
         print(f"Error in guardrail: {e}")
+        LLM_FALLBACKS.inc("guardrail", "error")
         return True, "Guardrail error, proceeding with caution."
 
 async def analyze_oncology(content_parts):
@@ -88,54 +117,62 @@ async def analyze_oncology(content_parts):
     Main Oncologist Analysis.
     Returns: (str, dict) -> (analysis_text, chart_data)
     """
-    if not API_KEY:
+    if not llm_enabled():
         return "API Key missing cannot analyze.", None
 
-    system_prompt = """
-    You are an expert Oncologist and Cancer Researcher with decades of experience. 
-    Your role is to analyze medical inputs (text, patient reports, imaging scans, histology slides) and provide a professional assessment.
-
-    **YOUR TASKS:**
-    1.  **Detailed Analysis**: Explain what you see in the image or text. Use medical terminology but explain it clearly. Format this part as Markdown.
-    2.  **Probability Assessment**: Estimate the probability of malignancy/cancer based *only* on the provided evidence. 
-        *Disclaimer: You must state this is an AI assessment and not a confirmed diagnosis.*
-    3.  **Recommendations**: Suggest next steps (biopsy, MRI, CT, blood work, etc.).
-    4.  **Charts Data**: You MUST provide data for visual charts at the end of your response in a strict JSON block.
-
-    **JSON OUTPUT FORMAT (Must be at the very end):**
-    ```json
-    {
-        "cancer_types_probability": {
-            "Benign/Normal": 0.0 to 1.0,
-            "Malignant (General)": 0.0 to 1.0,
-            "Specific Type A (if applicable)": 0.0 to 1.0,
-            "Specific Type B (if applicable)": 0.0 to 1.0
-        },
-        "risk_factors": {
-            "Age": 0-10,
-            "Family History": 0-10,
-            "Lifestyle": 0-10,
-            "Visual Evidence": 0-10
-        }
-    }
-    ```
-    """
-    
     try:
-        response = await model_pro.generate_content_async([system_prompt, *content_parts])
-        full_text = response.text
-        
-        # Extract JSON
-        chart_data = None
-        match = re.search(r'```json\n(.*?)\n```', full_text, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-            try:
-                chart_data = json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
-        
-        return full_text, chart_data
+        route = _route(ANALYSIS, content_parts)
+        with stage("analysis"):
+            response = await model_router.call(
+                route, analysis_calls[route.tier],
+                lambda: _client(ANALYSIS, route.tier).generate_content_async(list(content_parts))
+            )
+        record_usage("analysis", response)
+        # Markdown and chart data arrive as separate fields (free-text answers are still parsed)
+        return parse_analysis(response.text)
 
+    except CircuitOpenError:
+        LLM_FALLBACKS.inc("analysis", "circuit_open")
+        return "Error during analysis: Gemini is temporarily unavailable, please retry shortly.", None
     except Exception as e:
+        LLM_FALLBACKS.inc("analysis", "error")
         return f"Error during analysis: {str(e)}", None
+
+async def analyze_oncology_stream(content_parts):
+    """
+    Streaming variant of `analyze_oncology`: yields the raw response text
+    chunk by chunk as Gemini generates it. The caller decodes it with
+    AnalysisStreamParser.
+    """
+    if not llm_enabled():
+        yield "API Key missing cannot analyze."
+        return
+
+    # A stream can't be hedged or retried once text has been sent; only the breaker applies
+    route = _route(ANALYSIS, content_parts)
+    breaker = analysis_calls[route.tier].breaker
+    if not breaker.allow():
+        LLM_FALLBACKS.inc("analysis", "circuit_open")
+        raise CircuitOpenError("Gemini is temporarily unavailable, please retry shortly.")
+    start = time.perf_counter()
+    with stage("analysis_stream"):
+        try:
+            response = await _client(ANALYSIS, route.tier).generate_content_async(list(content_parts), stream=True)
+            last = None
+            async for chunk in response:
+                last = chunk
+                text = chunk.text
+                if text:
+                    yield text
+        except Exception:
+            breaker.record_failure()
+            model_router.record(route, time.perf_counter() - start, ok=False)
+            raise
+        except BaseException:
+            # Cancelled or closed early by the consumer: no verdict on upstream health
+            breaker.release_probe()
+            raise
+    breaker.record_success()
+    model_router.record(route, time.perf_counter() - start, ok=True)
+    # Usage metadata on the final chunk covers the whole response
+    record_usage("analysis", last)
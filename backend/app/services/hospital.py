@@ -1,6 +1,157 @@
+import heapq
 import json
+import math
 import os
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import stage
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Multiplier applied to distance when ranking; busier sites look "further away"
+AVAILABILITY_WEIGHTS = {"High": 1.0, "Medium": 1.25, "Low": 1.6}
+MIN_AVAILABILITY_WEIGHT = min(AVAILABILITY_WEIGHTS.values())
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """
+    Static 3-d tree over points on the unit sphere. Chord length is monotonic in
+    great-circle distance, so Euclidean k-nearest on the unit vectors is an exact
+    geographic k-nearest.
+    """
+    def __init__(self, points: np.ndarray, leaf_size: int = 32):
+        self.points = points
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(points))
+        # node: (split_dim, split_value, left, right, start, end); split_dim -1 marks a leaf
+        self.nodes: List[tuple] = []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start: int, end: int) -> int:
+        node_id = len(self.nodes)
+        self.nodes.append(None)
+        if end - start <= self.leaf_size:
+            self.nodes[node_id] = (-1, 0.0, -1, -1, start, end)
+            return node_id
+
+        idx = self.order[start:end]
+        subset = self.points[idx]
+        dim = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+        mid = (end - start) // 2
+        part = np.argpartition(subset[:, dim], mid)
+        self.order[start:end] = idx[part]
+        split = float(self.points[self.order[start + mid], dim])
+
+        left = self._build(start, start + mid)
+        right = self._build(start + mid, end)
+        self.nodes[node_id] = (dim, split, left, right, start, end)
+        return node_id
+
+    def query(self, point: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """Returns up to k (chord_distance, point_index) pairs, nearest first."""
+        if not self.nodes or k <= 0:
+            return []
+        best: List[Tuple[float, int]] = []  # max-heap of (-squared_distance, index)
+        stack = [(0, 0.0)]
+        while stack:
+            node_id, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            dim, split, left, right, start, end = self.nodes[node_id]
+            if dim < 0:
+                idx = self.order[start:end]
+                sq = ((self.points[idx] - point) ** 2).sum(axis=1)
+                for d, i in zip(sq.tolist(), idx.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                continue
+            diff = float(point[dim]) - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return [(math.sqrt(-d), i) for d, i in sorted(best, reverse=True)]
+
+
+class HospitalIndex:
+    """
+    Immutable snapshot of the registry: specialty -> hospitals inverted index,
+    one KD-tree per specialty for k-nearest lookups, and the static
+    distance_km ranking used when the patient location is unknown.
+    """
+    def __init__(self, hospitals: List[dict]):
+        self.hospitals = hospitals
+        self.by_specialty: Dict[str, List[int]] = {}
+        for i, h in enumerate(hospitals):
+            for specialty in h.get("specialties", []):
+                self.by_specialty.setdefault(specialty, []).append(i)
+
+        # Static ranking (no patient location): nearest by the registry's distance_km
+        self.closest_static = {
+            specialty: min(ids, key=lambda i: hospitals[i].get("distance_km", 999))
+            for specialty, ids in self.by_specialty.items()
+        }
+
+        self.trees: Dict[str, Tuple[KDTree, np.ndarray]] = {}
+        for specialty, ids in self.by_specialty.items():
+            located = [i for i in ids if "latitude" in hospitals[i] and "longitude" in hospitals[i]]
+            if not located:
+                continue
+            ids_arr = np.asarray(located)
+            lat = [hospitals[i]["latitude"] for i in located]
+            lon = [hospitals[i]["longitude"] for i in located]
+            self.trees[specialty] = (KDTree(to_unit_vectors(lat, lon)), ids_arr)
+
+    def nearest(self, specialties: List[str], lat: float, lon: float, k: int) -> List[Tuple[float, int]]:
+        """k nearest hospitals offering any of `specialties`, as (distance_km, hospital_index)."""
+        point = to_unit_vectors(lat, lon)
+        found = {}
+        for specialty in specialties:
+            if specialty not in self.trees:
+                continue
+            tree, ids = self.trees[specialty]
+            for chord, local in tree.query(point, k):
+                found[int(ids[local])] = chord
+        ranked = sorted((chord, i) for i, chord in found.items())[:k]
+        return [(chord_to_km(chord), i) for chord, i in ranked]
+
+    def best_weighted(self, specialties: List[str], lat: float, lon: float, k: int = 8) -> Optional[Tuple[float, int]]:
+        """
+        Hospital with the lowest availability-weighted distance. Widens the
+        k-nearest search until no unseen hospital could still win.
+        """
+        total = sum(len(self.by_specialty.get(s, [])) for s in specialties)
+        while True:
+            candidates = self.nearest(specialties, lat, lon, k)
+            if not candidates:
+                return None
+            best = min(
+                candidates,
+                key=lambda c: c[0] * AVAILABILITY_WEIGHTS.get(self.hospitals[c[1]].get("availability"), 1.0)
+            )
+            best_score = best[0] * AVAILABILITY_WEIGHTS.get(self.hospitals[best[1]].get("availability"), 1.0)
+            # Any hospital beyond the k-th nearest scores at least its distance * min weight
+            if len(candidates) < k or k >= total or candidates[-1][0] * MIN_AVAILABILITY_WEIGHT >= best_score:
+                return best
+            k *= 2
+
 
 class HospitalService:
     def __init__(self, data_path: str = None):
@@ -9,7 +160,21 @@ class HospitalService:
             current_dir = os.path.dirname(os.path.abspath(__file__))
             data_path = os.path.join(current_dir, "..", "..", "data", "hospitals.json")
         self.data_path = data_path
-        self.hospitals = self._load_data()
+        self._signature = self._file_signature()
+        self.index = HospitalIndex(self._load_data())
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def hospitals(self) -> List[dict]:
+        return self.index.hospitals
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.data_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
 
     def _load_data(self):
         try:
@@ -19,17 +184,63 @@ class HospitalService:
             print(f"Error loading hospital data: {e}")
             return []
 
-    def recommend(self, cancer_type: str) -> Optional[str]:
-        # Filter by specialty
-        candidates = [h for h in self.hospitals if cancer_type in h.get("specialties", []) or "general" in h.get("specialties", [])]
-        
-        if not candidates:
-            return "No specific hospital recommendation found nearby."
-            
-        # Sort by distance (mock logic)
-        candidates.sort(key=lambda x: x.get("distance_km", 999))
-        
-        best = candidates[0]
-        return f"Recommended: {best['name']} ({best['distance_km']} km away) - Specialized in {cancer_type}."
+    def reload_if_changed(self) -> bool:
+        """
+        Rebuilds the index when hospitals.json changed on disk and swaps it in
+        atomically; in-flight lookups keep using the snapshot they started with.
+        A file that fails to parse leaves the current index in place.
+        """
+        signature = self._file_signature()
+        if signature == self._signature:
+            return False
+        try:
+            with open(self.data_path, "r") as f:
+                hospitals = json.load(f)
+            new_index = HospitalIndex(hospitals)
+        except Exception as e:
+            print(f"Hospital data reload failed, keeping previous registry: {e}")
+            return False
+        self.index = new_index
+        self._signature = signature
+        print(f"Reloaded hospital registry ({len(hospitals)} sites)")
+        return True
+
+    def start_watching(self, interval_s: Optional[float] = None):
+        """Polls the registry file in a daemon thread and hot-reloads it on change."""
+        interval_s = interval_s or settings.hospital_reload_interval_s
+        if interval_s <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval_s):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="hospital-registry-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    def recommend(self, cancer_type: str, latitude: Optional[float] = None, longitude: Optional[float] = None) -> Optional[str]:
+        with stage("hospital"):
+            index = self.index
+            # Filter by specialty
+            specialties = [cancer_type, "general"]
+
+            if latitude is not None and longitude is not None:
+                found = index.best_weighted(specialties, latitude, longitude, k=settings.hospital_candidates)
+                if found is not None:
+                    distance_km, i = found
+                    best = index.hospitals[i]
+                    return f"Recommended: {best['name']} ({distance_km:.1f} km away) - Specialized in {cancer_type}."
+
+            candidates = [index.closest_static[s] for s in specialties if s in index.closest_static]
+            if not candidates:
+                return "No specific hospital recommendation found nearby."
+
+            # Sort by distance (mock logic)
+            best = index.hospitals[min(candidates, key=lambda i: (index.hospitals[i].get("distance_km", 999), i))]
+            return f"Recommended: {best['name']} ({best['distance_km']} km away) - Specialized in {cancer_type}."
 
 hospital_service = HospitalService()
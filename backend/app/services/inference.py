@@ -0,0 +1,190 @@
+import asyncio
+import io
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+LABELS = ("normal", "suspected", "inconclusive")
+INPUT_SIZE = 64
+
+
+def preprocess(image_data: bytes, size: int = INPUT_SIZE) -> np.ndarray:
+    """Decodes an image to a (size, size) float32 grayscale array scaled to 0-1."""
+    image = Image.open(io.BytesIO(image_data))
+    image.draft("L", (size, size))
+    image = image.convert("L").resize((size, size), Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+class InferenceBackend(ABC):
+    """
+    A loaded model. `run` takes a (N, H, W) float32 batch and returns (N, len(LABELS))
+    class probabilities. Implementations must be safe to call from worker threads.
+    """
+    name = "base"
+    input_size = INPUT_SIZE
+
+    @abstractmethod
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        ...
+
+
+class NumpyBackend(InferenceBackend):
+    """
+    Pure-NumPy forward pass of the bundled perception CNN:
+    conv3x3 -> ReLU -> global avg+max pool -> dense -> softmax.
+    Weights come from an .npz with conv_w (K, 3, 3), conv_b (K,), fc_w (C, 2K), fc_b (C,).
+    """
+    name = "numpy"
+
+    def __init__(self, model_path: str):
+        weights = np.load(model_path)
+        self.conv_w = weights["conv_w"].astype(np.float32)
+        self.conv_b = weights["conv_b"].astype(np.float32)
+        self.fc_w = weights["fc_w"].astype(np.float32)
+        self.fc_b = weights["fc_b"].astype(np.float32)
+        self._kernel = self.conv_w.reshape(len(self.conv_w), -1).T  # (9, K)
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        n = batch.shape[0]
+        windows = np.lib.stride_tricks.sliding_window_view(batch, (3, 3), axis=(1, 2))
+        conv = windows.reshape(n, -1, 9) @ self._kernel + self.conv_b  # (N, pixels, K)
+        activation = np.maximum(conv, 0.0)
+        features = np.concatenate([activation.mean(axis=1), activation.max(axis=1)], axis=1)
+        logits = features @ self.fc_w.T + self.fc_b
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime CPU session; the model takes a (N, 1, H, W) float32 input."""
+    name = "onnx"
+
+    def __init__(self, model_path: str, intra_op_threads: int = 1):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch[:, None, :, :]})[0]
+
+
+BACKENDS = {
+    NumpyBackend.name: (NumpyBackend, ".npz"),
+    OnnxBackend.name: (OnnxBackend, ".onnx"),
+}
+
+
+def load_backend(kind: str, model_dir: str, model_name: str) -> InferenceBackend:
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown perception backend: {kind}")
+    backend_cls, extension = BACKENDS[kind]
+    return backend_cls(os.path.join(model_dir, f"{model_name}{extension}"))
+
+
+class MicroBatcher:
+    """
+    Groups concurrent `submit` calls into one `run_batch` call. A batch is
+    dispatched once it reaches `max_batch_size` items or the oldest item has
+    waited `max_wait_ms`. At most `max_in_flight` batches run at once (match it
+    to the executor's worker count) so that, under load, requests accumulate
+    into full batches instead of queueing inside the executor.
+    `run_batch` runs on `executor`, off the event loop,
+    and must return one result per input, in order; an Exception instance in
+    the results fails only that item's caller.
+    """
+    def __init__(self, run_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 executor: Optional[Executor] = None, max_in_flight: int = 1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_in_flight = max(1, max_in_flight)
+        self.batches = 0
+        self.items = 0
+        self._loop = None
+        self._queue = None
+        self._full = None
+        self._slots = None
+        self._collector = None
+        self._dispatches = set()
+
+    async def submit(self, item: Any) -> Any:
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((item, future))
+        if queue.qsize() >= self.max_batch_size - 1:
+            self._full.set()
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # Bound to the running loop; rebuilt if the batcher outlives it (tests, reloads).
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._collector = loop.create_task(self._collect())
+        return self._queue
+
+    async def _collect(self):
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch_size - 1:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait_s)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            await self._run(batch)
+        finally:
+            self._slots.release()
+
+    async def _run(self, batch):
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
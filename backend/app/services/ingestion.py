@@ -0,0 +1,348 @@
+import asyncio
+import functools
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import UploadFile
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+from app.core.metrics import CASE_IMAGES, stage
+from app.services.tiling import (
+    SNIFF_BYTES, TIFF, MappedFile, UnsupportedScanError, open_scan, select_regions, sniff_format
+)
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# Decode, resize and re-encode work for uploads, kept apart from perception's and the server's threads
+_decode_pool = ThreadPoolExecutor(max_workers=settings.ingest_workers, thread_name_prefix="ingest")
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+class TooManyImagesError(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"A case takes at most {limit} images")
+        self.limit = limit
+
+
+class CaseTooLargeError(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Case uploads exceed the {limit} byte limit")
+        self.limit = limit
+
+
+class CaseBudget:
+    """Bytes the uploads of one case may read into memory, shared by its concurrent reads."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def charge(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise CaseTooLargeError(self.limit)
+
+
+@dataclass
+class IngestedImage:
+    """
+    An upload decoded, downscaled and re-encoded to the service-wide target.
+    For large scans (DICOM series, whole-slide TIFFs) `image` is an overview
+    and `regions` holds the few most informative tiles or frames, which is
+    all perception and Gemini get to see.
+    """
+    image: Image.Image
+    data: bytes
+    mime_type: str
+    original_size: Tuple[int, int]
+    original_bytes: int
+    regions: List["IngestedImage"] = field(default_factory=list)
+    scan: Optional[dict] = None
+    dhash: int = 0
+
+    def as_blob(self) -> dict:
+        # Inline-data part accepted by the Gemini SDK; avoids a second encode on its side.
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def blobs(self) -> List[dict]:
+        return [self.as_blob()] + [region.as_blob() for region in self.regions]
+
+    def perception_inputs(self) -> List[bytes]:
+        return [region.data for region in self.regions] or [self.data]
+
+
+@dataclass
+class IngestedCase:
+    """
+    Every image uploaded with one case, in upload order, minus near-duplicates:
+    `duplicates` holds the upload positions that were dropped.
+    """
+    images: List[IngestedImage]
+    received: int
+    duplicates: List[int] = field(default_factory=list)
+
+    def blobs(self) -> List[dict]:
+        return [blob for image in self.images for blob in image.blobs()]
+
+    def perception_inputs(self) -> List[bytes]:
+        return [data for image in self.images for data in image.perception_inputs()]
+
+
+async def read_upload(file: UploadFile, max_bytes: Optional[int] = None, chunk_size: Optional[int] = None,
+                      budget: Optional[CaseBudget] = None) -> bytes:
+    """
+    Reads an upload in chunks, failing fast once it grows past `max_bytes` or
+    the case's `budget`.
+    """
+    max_bytes = max_bytes or settings.max_upload_bytes
+    chunk_size = chunk_size or settings.upload_chunk_bytes
+
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    if budget is not None and file.size is not None:
+        budget.charge(file.size)
+
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+        if budget is not None and file.size is None:
+            budget.charge(len(chunk))
+    return bytes(buffer)
+
+
+def _to_8bit(image: Image.Image) -> Image.Image:
+    # 16-bit / float scans (common for CT and MRI exports) would clip on a plain convert("L")
+    pixels = np.asarray(image, dtype=np.float64)
+    low, high = float(pixels.min()), float(pixels.max())
+    if high > low:
+        pixels = (pixels - low) * (255.0 / (high - low))
+    else:
+        pixels = np.zeros_like(pixels)
+    return Image.fromarray(pixels.astype(np.uint8), mode="L")
+
+
+def normalize_image(data: bytes, max_side: Optional[int] = None, fmt: Optional[str] = None,
+                    quality: Optional[int] = None) -> IngestedImage:
+    """
+    Decodes `data` and fits it within `max_side` x `max_side`, re-encoded as `fmt`.
+    Blocking; run it off the event loop.
+    """
+    max_side = max_side or settings.image_max_side
+    fmt = (fmt or settings.image_format).upper()
+    quality = quality or settings.image_quality
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_size = image.size
+        # JPEG: let the decoder produce a 1/2, 1/4 or 1/8 scale image directly
+        image.draft("RGB" if image.mode not in ("L", "1") else "L", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        # Integer-factor box reduce first, then a high-quality resample for the remainder
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+    return _encode(image, original_size, len(data), fmt, quality)
+
+
+def _encode(image: Image.Image, original_size: Tuple[int, int], original_bytes: int, fmt: str,
+            quality: int) -> IngestedImage:
+    if image.mode in ("I", "I;16", "I;16B", "I;16L", "F"):
+        image = _to_8bit(image)
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+
+    fingerprint = dhash(image)
+    out = io.BytesIO()
+    save_kwargs = {"quality": quality} if fmt in ("JPEG", "WEBP") else {}
+    image.save(out, format=fmt, **save_kwargs)
+    return IngestedImage(
+        image=image,
+        data=out.getvalue(),
+        mime_type=MIME_TYPES.get(fmt, f"image/{fmt.lower()}"),
+        original_size=original_size,
+        original_bytes=original_bytes,
+        dhash=fingerprint
+    )
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a
+    (hash_size + 1) x hash_size grayscale thumbnail, set where brightness
+    increases. Re-encoding, rescaling and small exposure changes flip only a
+    few of the 64 bits, so near-duplicate frames end up a small Hamming
+    distance apart.
+    """
+    thumb = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def deduplicate(images: Sequence[IngestedImage], max_distance: int) -> Tuple[List[IngestedImage], List[int]]:
+    """
+    Keeps the first of every group of images whose hashes are within
+    `max_distance` bits of an image already kept; returns the kept images and
+    the positions of the dropped ones.
+    """
+    kept, dropped = [], []
+    for i, image in enumerate(images):
+        if any(hamming(image.dhash, other.dhash) <= max_distance for other in kept):
+            dropped.append(i)
+        else:
+            kept.append(image)
+    return kept, dropped
+
+
+def _encode_pixels(pixels: np.ndarray, original_bytes: int, max_side: int, fmt: str, quality: int) -> IngestedImage:
+    image = Image.fromarray(pixels)
+    original_size = image.size
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return _encode(image, original_size, original_bytes, fmt, quality)
+
+
+def ingest_scan(fileobj: BinaryIO, kind: str, max_side: Optional[int] = None, fmt: Optional[str] = None,
+                quality: Optional[int] = None) -> IngestedImage:
+    """
+    Memory-maps a DICOM or TIFF upload and reduces it to an overview plus the
+    most informative regions (see tiling.select_regions), reading it tile by
+    tile. Peak memory is independent of the file size. Blocking; run it off
+    the event loop. Raises UnsupportedScanError for layouts it can't read lazily.
+    """
+    max_side = max_side or settings.image_max_side
+    fmt = (fmt or settings.image_format).upper()
+    quality = quality or settings.image_quality
+
+    mapped = MappedFile(fileobj, settings.upload_chunk_bytes)
+    size, source = len(mapped), None
+    try:
+        source = open_scan(mapped.buffer, kind, settings.scan_tile_size)
+        selection = select_regions(
+            source, count=settings.scan_regions, max_scored=settings.scan_max_tiles_scored, overview_side=max_side
+        )
+    finally:
+        if source is not None:
+            source.close()
+        mapped.close()
+
+    regions = [_encode_pixels(pixels, size, max_side, fmt, quality) for _, _, pixels in selection.regions]
+    if selection.overview is not None:
+        ingested = _encode_pixels(selection.overview, size, max_side, fmt, quality)
+    else:
+        # A series has no single overview: its best frame stands in
+        ingested = IngestedImage(**{**vars(regions[0]), "regions": []})
+    ingested.original_size = selection.size
+    ingested.regions = regions
+    ingested.scan = {
+        "source": selection.source,
+        "size": list(selection.size),
+        "frames": selection.frames,
+        "tiles_total": selection.tiles_total,
+        "tiles_scored": selection.tiles_scored,
+        "regions": [
+            {"frame": tile.frame, "x": tile.x, "y": tile.y, "width": tile.width, "height": tile.height, "score": score}
+            for tile, score, _ in selection.regions
+        ],
+    }
+    return ingested
+
+
+def _needs_tiling(fileobj: BinaryIO) -> bool:
+    """
+    Whether a TIFF is big enough for the tiled reader. Ordinary TIFF photos
+    are decoded whole like any other image, so triage sees all of them rather
+    than a few tile crops. Only the header is read.
+    """
+    try:
+        with Image.open(fileobj) as image:
+            width, height = image.size
+    except Exception:
+        # Layouts Pillow can't open (BigTIFF, decompression bombs) are exactly the tiled reader's job
+        return True
+    finally:
+        fileobj.seek(0)
+    return width * height > settings.scan_min_pixels
+
+
+async def _in_decode_pool(fn, *args) -> IngestedImage:
+    return await asyncio.get_running_loop().run_in_executor(_decode_pool, functools.partial(fn, *args))
+
+
+async def ingest_image(file: UploadFile, budget: Optional[CaseBudget] = None) -> IngestedImage:
+    """
+    Size-capped chunked read followed by off-loop decode and normalization.
+    DICOM uploads and TIFFs over SCAN_MIN_PIXELS (or MAX_UPLOAD_BYTES) are
+    read tile by tile from a memory map instead (up to MAX_SCAN_BYTES); ones
+    the tiled reader can't handle fall back to the in-memory path if they are
+    small enough for it. Only in-memory reads are charged to `budget`.
+    """
+    head = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    kind = sniff_format(head) if settings.tiled_ingestion else None
+    if kind == TIFF and (file.size is None or file.size <= settings.max_upload_bytes):
+        if not await _in_decode_pool(_needs_tiling, file.file):
+            kind = None
+    if kind is not None:
+        if file.size is not None and file.size > settings.max_scan_bytes:
+            raise UploadTooLargeError(settings.max_scan_bytes)
+        try:
+            with stage("scan_tiling"):
+                return await _in_decode_pool(ingest_scan, file.file, kind)
+        except UnsupportedScanError as e:
+            if file.size is not None and file.size > settings.max_upload_bytes:
+                raise InvalidImageError(str(e)) from e
+            await file.seek(0)
+
+    with stage("upload_read"):
+        data = await read_upload(file, budget=budget)
+    with stage("image_decode"):
+        return await _in_decode_pool(normalize_image, data)
+
+
+async def ingest_case(files: Sequence[UploadFile]) -> IngestedCase:
+    """
+    Ingests every image of a case at once (decoded in parallel on the ingest
+    pool), then drops near-duplicate frames so perception and Gemini only see
+    each view once. Failures name the offending upload. Together the uploads
+    may read at most MAX_CASE_BYTES into memory.
+    """
+    if len(files) > settings.max_case_images:
+        raise TooManyImagesError(settings.max_case_images)
+    budget = CaseBudget(settings.max_case_bytes)
+
+    async def ingest(file: UploadFile) -> IngestedImage:
+        try:
+            return await ingest_image(file, budget)
+        except InvalidImageError as e:
+            raise InvalidImageError(f"{file.filename}: {e}" if file.filename else str(e)) from e
+
+    images = list(await asyncio.gather(*(ingest(file) for file in files)))
+    duplicates: List[int] = []
+    if settings.image_dedup and len(images) > 1:
+        with stage("image_dedup"):
+            images, duplicates = deduplicate(images, settings.image_dedup_max_distance)
+    CASE_IMAGES.inc("kept", amount=len(images))
+    if duplicates:
+        CASE_IMAGES.inc("duplicate", amount=len(duplicates))
+    return IngestedCase(images=images, received=len(files), duplicates=duplicates)
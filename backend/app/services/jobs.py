@@ -0,0 +1,333 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.models.schemas import PatientInput
+from app.services.admission import AdmissionRejected
+from app.services.pipeline import run_ai_analysis, run_triage
+from app.services.resilience import backoff_s
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_images (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """SQLite persistence for jobs. Blocking; JobQueue calls it from worker threads."""
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def create(self, job_id: str, kind: str, payload: dict, images: Sequence[bytes] = ()):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, PENDING, json.dumps(payload), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO job_images (job_id, position, data) VALUES (?, ?, ?)",
+                [(job_id, position, data) for position, data in enumerate(images)]
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def images(self, job_id: str) -> List[bytes]:
+        rows = self._execute("SELECT data FROM job_images WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+        return [row["data"] for row in rows]
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Moves a pending job to running. Atomic across every process sharing
+        the file: of several workers claiming the same job, exactly one wins.
+        """
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, time.time(), job_id, PENDING)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, job_id: str):
+        """Hands a claimed job back, to be claimed again later."""
+        self._execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?", (PENDING, job_id, RUNNING)
+        )
+
+    def mark_done(self, job_id: str, result: dict):
+        # The images are only needed to run the job; drop them to keep the store small
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job_id)
+            )
+            conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+
+    def mark_failed(self, job_id: str, error: str):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+            conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+
+    def count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def requeue_stale(self, lease_s: float) -> list:
+        """
+        Running jobs claimed more than `lease_s` ago are taken to be orphaned
+        by a worker that died, and go back to pending; returns their ids.
+        Jobs other live workers are running are left alone.
+        """
+        cutoff = time.time() - lease_s
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND started_at < ? ORDER BY created_at", (RUNNING, cutoff)
+            ).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+                (PENDING, RUNNING, cutoff)
+            )
+        return [row["id"] for row in rows]
+
+    def recover_unfinished(self, lease_s: float) -> list:
+        """Stale running jobs go back to pending; returns every pending id, oldest first."""
+        self.requeue_stale(lease_s)
+        rows = self._execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (PENDING,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def purge_finished(self, older_than_s: float) -> int:
+        cutoff = time.time() - older_than_s
+        cursor = self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+        )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Called with the job's payload and its images, in submission order
+JobHandler = Callable[[dict, List[bytes]], Awaitable[dict]]
+
+
+class JobQueue:
+    """
+    Submit-and-poll execution for long LLM-bound work. Jobs are persisted in a
+    JobStore before `submit` returns, and a fixed pool of `workers` asyncio
+    tasks drains them, so bursts queue up instead of holding HTTP connections.
+    Several processes may share one store: a job is run by whichever worker
+    claims it first, and one left running for longer than `lease_s` (its
+    worker died) is picked up again by the periodic sweep. A job whose LLM
+    work is shed by admission control is not failed: it goes back to pending
+    and is retried after the Retry-After hint plus a jittered backoff that
+    grows with each deferral, up to `max_defer_s`.
+    """
+    def __init__(self, store: JobStore, workers: int = 4, max_pending: int = 10000,
+                 lease_s: Optional[float] = None, max_defer_s: Optional[float] = None):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lease_s = settings.job_lease_s if lease_s is None else lease_s
+        self.max_defer_s = settings.job_max_defer_s if max_defer_s is None else max_defer_s
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._sweeper: Optional[asyncio.Task] = None
+        # Deferral count and pending re-queue timer per shed job
+        self._deferrals: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        await asyncio.to_thread(self.store.purge_finished, settings.job_retention_s)
+        for job_id in await asyncio.to_thread(self.store.recover_unfinished, self.lease_s):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        tasks = self._tasks + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._sweeper = None
+        # Deferred jobs are pending in the store and are picked up again on next start
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._deferrals.clear()
+        # Jobs cut off mid-run stay "running" in the store and are picked up again once their lease runs out
+
+    async def submit(self, kind: str, payload: dict, images: Sequence[bytes] = ()) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        if self._queue.qsize() >= self.max_pending:
+            raise JobQueueFullError(f"{self.max_pending} jobs already pending")
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, kind, payload, images)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "deferred": len(self._timers),
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job worker {worker_id} failed to process {job_id}: {e}")
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.lease_s / 4))
+            try:
+                for job_id in await asyncio.to_thread(self.store.requeue_stale, self.lease_s):
+                    self._queue.put_nowait(job_id)
+            except sqlite3.Error as e:
+                print(f"Job sweep failed: {e}")
+
+    async def _run(self, job_id: str):
+        # Another worker (in this process or another one) may already have it
+        if not await asyncio.to_thread(self.store.claim, job_id):
+            return
+        job = await asyncio.to_thread(self.store.get, job_id)
+        images = await asyncio.to_thread(self.store.images, job_id)
+        try:
+            result = await self.handlers[job["kind"]](job["payload"], images)
+        except asyncio.CancelledError:
+            raise
+        except AdmissionRejected as e:
+            await asyncio.to_thread(self.store.release, job_id)
+            self._defer(job_id, e.retry_after_s)
+            return
+        except Exception as e:
+            print(f"Job {job_id} ({job['kind']}) failed: {e}")
+            self._deferrals.pop(job_id, None)
+            await asyncio.to_thread(self.store.mark_failed, job_id, str(e))
+            return
+        self._deferrals.pop(job_id, None)
+        await asyncio.to_thread(self.store.mark_done, job_id, result)
+
+    def _defer(self, job_id: str, retry_after_s: float):
+        attempt = self._deferrals.get(job_id, 0)
+        self._deferrals[job_id] = attempt + 1
+        delay = min(self.max_defer_s, retry_after_s + backoff_s(attempt, max(retry_after_s, 0.1), self.max_defer_s))
+
+        def requeue():
+            self._timers.pop(job_id, None)
+            self._queue.put_nowait(job_id)
+
+        self._timers[job_id] = asyncio.get_running_loop().call_later(delay, requeue)
+
+
+async def _triage_job(payload: dict, images: List[bytes]) -> dict:
+    # Every image of the case (or region of a scan), aggregated as in /analyze
+    result = await run_triage(PatientInput(**payload), images)
+    return result.model_dump()
+
+
+async def _ai_analysis_job(payload: dict, images: List[bytes]) -> dict:
+    content_parts = []
+    if payload.get("text"):
+        content_parts.append(payload["text"])
+    content_parts.extend(
+        {"mime_type": mime_type, "data": data} for mime_type, data in zip(payload.get("mime_types", []), images)
+    )
+    return await run_ai_analysis(content_parts)
+
+
+job_queue = JobQueue(
+    JobStore(settings.job_db_path),
+    workers=settings.job_workers,
+    max_pending=settings.job_max_pending,
+    lease_s=settings.job_lease_s
+)
+job_queue.register("triage", _triage_job)
+job_queue.register("ai-analysis", _ai_analysis_job)
@@ -0,0 +1,190 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class StubResponse:
+    """The slice of a Gemini response the services read: `.text` and `.usage_metadata`."""
+    def __init__(self, text: str, usage: Optional[dict] = None):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(**usage) if usage else None
+
+
+class StubStreamResponse:
+    """Async-iterable of StubResponse chunks, like `generate_content_async(stream=True)`."""
+    def __init__(self, chunks: AsyncIterator[StubResponse]):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._chunks
+
+
+def _encode_part(part: Any) -> dict:
+    if isinstance(part, str):
+        return {"text": part}
+    if isinstance(part, dict) and "data" in part:
+        return {"mime_type": part.get("mime_type"), "data": base64.b64encode(part["data"]).decode("ascii")}
+    # PIL images and other SDK-only part types: the stand-in only needs to know one was sent
+    return {"mime_type": "application/octet-stream", "data": ""}
+
+
+def _encode_config(generation_config: Any) -> Optional[dict]:
+    if generation_config is None or isinstance(generation_config, dict):
+        return generation_config
+    return {k: v for k, v in vars(generation_config).items() if v is not None}
+
+
+class StubModel:
+    """
+    Drop-in for `genai.GenerativeModel` that talks to the local Gemini
+    stand-in (tools/gemini_stub.py) over HTTP. Used for load tests and
+    benchmarks where real API calls would be slow, costly and noisy.
+    """
+    def __init__(self, base_url: str, model_name: str, transport=None, timeout_s: float = 60.0,
+                 system_instruction: Optional[str] = None):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._timeout = timeout_s
+        self._transport = transport
+        self._async_client = None
+        self._async_client_loop = None
+        self._sync_client = httpx.Client(base_url=self.base_url, timeout=timeout_s)
+
+    def _request_body(self, contents, generation_config, stream: bool) -> dict:
+        parts: List[Any] = contents if isinstance(contents, list) else [contents]
+        return {
+            "model": self.model_name,
+            "system_instruction": self.system_instruction,
+            "contents": [_encode_part(p) for p in parts],
+            "generation_config": _encode_config(generation_config),
+            "stream": stream,
+        }
+
+    def _client(self):
+        import httpx
+
+        # httpx.AsyncClient pools connections per event loop; rebuild it if the loop changed (tests)
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self._timeout, transport=self._transport, limits=limits
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    def generate_content(self, contents, generation_config=None, **kwargs) -> StubResponse:
+        response = self._sync_client.post("/v1/generate", json=self._request_body(contents, generation_config, False))
+        response.raise_for_status()
+        payload = response.json()
+        return StubResponse(payload["text"], payload.get("usage"))
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False, **kwargs):
+        client = self._client()
+        body = self._request_body(contents, generation_config, stream)
+        if not stream:
+            response = await client.post("/v1/generate", json=body)
+            response.raise_for_status()
+            payload = response.json()
+            return StubResponse(payload["text"], payload.get("usage"))
+
+        request = client.build_request("POST", "/v1/generate", json=body)
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+
+        async def chunks():
+            try:
+                async for line in response.aiter_lines():
+                    if line:
+                        payload = json.loads(line)
+                        yield StubResponse(payload["text"], payload.get("usage"))
+            finally:
+                await response.aclose()
+
+        return StubStreamResponse(chunks())
+
+
+def stub_enabled() -> bool:
+    return bool(settings.gemini_stub_url)
+
+
+class LLMProvider:
+    """
+    Single owner of the Gemini clients. Nothing is imported or configured
+    until the first `model()` call, so workers that never serve an AI route
+    skip the `google.generativeai` import entirely. Clients are built once
+    per (model name, options) and shared by every service.
+    """
+    def __init__(self, api_key: Optional[str] = None, stub_url: Optional[str] = None):
+        self.api_key = api_key
+        self.stub_url = stub_url
+        self.sdk_import_s: Optional[float] = None
+        self.warmup_s: Optional[float] = None
+        self._genai = None
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return bool(self.api_key or self.stub_url)
+
+    def _sdk(self):
+        if self._genai is None:
+            start = time.perf_counter()
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self.sdk_import_s = time.perf_counter() - start
+            self._genai = genai
+        return self._genai
+
+    def model(self, model_name: str, **kwargs):
+        """
+        Client for `model_name`: a StubModel when GEMINI_STUB_URL is set,
+        otherwise a `genai.GenerativeModel` built with `kwargs`
+        (generation_config, safety_settings, system_instruction). The static
+        system instruction lives on the client, so it is configured once
+        rather than rebuilt into every request's contents.
+        """
+        key = f"{model_name}:{json.dumps(kwargs, sort_keys=True, default=str)}"
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                if self.stub_url:
+                    model = StubModel(self.stub_url, model_name, system_instruction=kwargs.get("system_instruction"))
+                else:
+                    model = self._sdk().GenerativeModel(model_name=model_name, **kwargs)
+                self._models[key] = model
+            return model
+
+    async def warmup(self, models: List[Tuple[str, dict]]):
+        """Builds `models` ((name, kwargs) pairs) off the event loop so the first AI request doesn't pay for it."""
+        if not self.enabled():
+            return
+        start = time.perf_counter()
+        for model_name, kwargs in models:
+            await asyncio.to_thread(self.model, model_name, **kwargs)
+        self.warmup_s = time.perf_counter() - start
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled(),
+            "backend": "stub" if self.stub_url else "gemini",
+            "sdk_loaded": self._genai is not None,
+            "sdk_import_s": round(self.sdk_import_s, 4) if self.sdk_import_s is not None else None,
+            "warmup_s": round(self.warmup_s, 4) if self.warmup_s is not None else None,
+            "clients": len(self._models),
+        }
+
+
+llm_provider = LLMProvider(api_key=settings.gemini_api_key, stub_url=settings.gemini_stub_url)
@@ -1,17 +1,141 @@
+import asyncio
+import os
 import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import stage
 from app.models.schemas import PerceptionOutput
+from app.services.inference import LABELS, InferenceBackend, MicroBatcher, load_backend, preprocess
+
+DEFAULT_MODEL = "default"
+# Which image speaks for a whole case: any suspicious image outranks inconclusive or normal ones
+SEVERITY = {"suspected": 2, "inconclusive": 1, "normal": 0}
+
+
+def aggregate(outputs: Sequence[PerceptionOutput], method: Optional[str] = None) -> PerceptionOutput:
+    """
+    Folds the per-image results of one case into one. The most severe label
+    wins; its confidence comes from the images that carry it: the highest
+    ("max"), their average ("mean") or the chance that at least one of them is
+    right, 1 - prod(1 - c) ("noisy_or", which is why near-duplicates must be
+    gone before this point). Any other method is treated as "max".
+    """
+    method = method or settings.perception_aggregation
+    if len(outputs) == 1:
+        return outputs[0]
+    label = max((o.prediction for o in outputs), key=lambda p: SEVERITY.get(p, 0))
+    confidences = [o.confidence for o in outputs if o.prediction == label]
+    if method == "mean":
+        confidence = sum(confidences) / len(confidences)
+    elif method == "noisy_or":
+        confidence = 1.0 - float(np.prod([1.0 - c for c in confidences]))
+    else:
+        confidence = max(confidences)
+    return PerceptionOutput(prediction=label, confidence=round(min(confidence, 1.0), 2))
+
 
 class PerceptionService:
+    """
+    CPU image classifier, one model per cancer type (falling back to the
+    "default" model). Models are loaded once and reused; concurrent
+    `predict_async` calls for the same model are micro-batched into a single
+    forward pass on a worker pool.
+    """
+    def __init__(self, backend: Optional[str] = None, model_dir: Optional[str] = None):
+        self.backend_kind = backend or settings.perception_backend
+        if model_dir is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            model_dir = settings.perception_model_dir or os.path.join(current_dir, "..", "..", "data", "models")
+        self.model_dir = model_dir
+        self.models: Dict[str, InferenceBackend] = {}
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.executor = ThreadPoolExecutor(max_workers=settings.perception_workers, thread_name_prefix="perception")
+
+    def load(self):
+        """Loads every bundled model up front (called at startup)."""
+        if self.backend_kind == "mock":
+            return
+        for cancer_type in settings.perception_models:
+            self._model_for(cancer_type)
+
     def predict(self, image_data: bytes, cancer_type: str) -> PerceptionOutput:
-        # Mock logic to simulate CNN inference
-        # In a real scenario, this would load a model and run inference
-        
-        # Simulate high confidence for demo purposes if specific keywords in filename or mocking
-        # For now, return a random but generally high confidence for "suspected" cases
-        
+        with stage("perception"):
+            if self.backend_kind == "mock":
+                return self._mock_predict()
+            model_name = self._model_name(cancer_type)
+            return self._run_batch(model_name, [image_data])[0]
+
+    async def predict_async(self, image_data: bytes, cancer_type: str) -> PerceptionOutput:
+        with stage("perception"):
+            if self.backend_kind == "mock":
+                return self._mock_predict()
+            return await self._batcher_for(self._model_name(cancer_type)).submit(image_data)
+
+    async def predict_case_async(self, images: Sequence[bytes], cancer_type: str) -> PerceptionOutput:
+        """
+        Classifies every image of a case (the uploads, or the representative
+        regions of a large scan), micro-batched together, and aggregates the
+        results into one (see `aggregate`).
+        """
+        if len(images) == 1:
+            return await self.predict_async(images[0], cancer_type)
+        outputs = await asyncio.gather(*(self.predict_async(image, cancer_type) for image in images))
+        return aggregate(outputs)
+
+    def stats(self) -> dict:
+        return {name: batcher.stats() for name, batcher in self.batchers.items()}
+
+    def _model_name(self, cancer_type: str) -> str:
+        cancer_type = cancer_type.strip().lower()
+        return cancer_type if cancer_type in settings.perception_models else DEFAULT_MODEL
+
+    def _model_for(self, model_name: str) -> InferenceBackend:
+        model = self.models.get(model_name)
+        if model is None:
+            model = load_backend(self.backend_kind, self.model_dir, f"perception_{model_name}")
+            self.models[model_name] = model
+        return model
+
+    def _batcher_for(self, model_name: str) -> MicroBatcher:
+        batcher = self.batchers.get(model_name)
+        if batcher is None:
+            batcher = MicroBatcher(
+                lambda items: self._run_batch(model_name, items),
+                max_batch_size=settings.perception_max_batch,
+                max_wait_ms=settings.perception_max_wait_ms,
+                executor=self.executor,
+                max_in_flight=settings.perception_workers
+            )
+            self.batchers[model_name] = batcher
+        return batcher
+
+    def _run_batch(self, model_name: str, images: List[bytes]) -> list:
+        model = self._model_for(model_name)
+        results: list = [None] * len(images)
+        arrays, positions = [], []
+        for i, image_data in enumerate(images):
+            try:
+                arrays.append(preprocess(image_data, model.input_size))
+                positions.append(i)
+            except Exception as e:
+                results[i] = ValueError(f"Could not decode image for perception: {e}")
+
+        if arrays:
+            probabilities = model.run(np.stack(arrays))
+            for i, probs in zip(positions, probabilities):
+                best = int(np.argmax(probs))
+                results[i] = PerceptionOutput(prediction=LABELS[best], confidence=round(float(probs[best]), 2))
+        return results
+
+    def _mock_predict(self) -> PerceptionOutput:
+        # Random stand-in kept for demos without model files (PERCEPTION_BACKEND=mock)
         confidence = round(random.uniform(0.7, 0.99), 2)
         prediction = "suspected"
-        
+
         # Occasional low confidence or negative result simulation
         if random.random() < 0.1:
             prediction = "normal"
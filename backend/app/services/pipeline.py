@@ -0,0 +1,324 @@
+import asyncio
+import time
+from typing import AsyncIterator, Optional, Sequence, Tuple
+from app.core.config import settings
+from app.core.metrics import LLM_CALLS_SAVED, observe_stage, stage
+from app.models.schemas import PatientInput, PerceptionOutput, LLMInput, FinalResult
+from app.services import gemini_service
+from app.services.admission import AdmissionRejected, llm_admission
+from app.services.coalescing import SingleFlight, content_parts_key
+from app.services.cognitive import cognitive_service
+from app.services.hospital import hospital_service
+from app.services.perception import perception_service
+from app.services.risk import risk_service
+from app.services.relevance import relevance_prefilter
+from app.services.results import result_recorder
+from app.services.streaming import AnalysisStreamParser, sse_event
+from app.services.triage_rules import triage_rules
+
+ANALYSIS_MODES = ("serial", "speculative")
+
+ai_analysis_flight = SingleFlight("ai_analysis")
+
+
+async def _timed(stage: str, coro, timings: dict):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+async def _cancel(task: asyncio.Task):
+    if task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def run_triage(input_data: PatientInput, images: Sequence[bytes]) -> FinalResult:
+    """
+    Full /analyze pipeline for one case, starting from its normalized images
+    (for a large scan, its selected regions).
+    """
+    # 1. Perception Layer
+    perception = await perception_service.predict_case_async(images, input_data.cancer_type)
+
+    # 2. Risk Aggregation Layer
+    preliminary_cri = risk_service.calculate_preliminary_cri(input_data, perception)
+
+    # 3-5. Cognitive Layer, Final Calculation, Hospital Recommendation
+    return await complete_triage(input_data, perception, preliminary_cri)
+
+
+async def complete_triage(input_data: PatientInput, perception: PerceptionOutput, preliminary_cri: int) -> FinalResult:
+    """
+    Cognitive, final-score and hospital stages of /analyze, shared by the
+    single-case and batch endpoints. Clear-cut cases are triaged by the rule
+    engine; only the borderline ones reach the LLM.
+    """
+    # 3. Cognitive Layer
+    llm_input = LLMInput(
+        cancer_type=input_data.cancer_type,
+        ml_confidence=perception.confidence,
+        preliminary_cri=preliminary_cri,
+        symptoms=input_data.symptoms,
+        age=input_data.age,
+        risk_factors=input_data.risk_factors
+    )
+    with stage("triage_rules"):
+        llm_output = triage_rules.decide(llm_input)
+    if llm_output is None:
+        llm_output = await cognitive_service.analyze_async(llm_input)
+
+    # 4. Final Calculation
+    final_cri = max(0, min(100, preliminary_cri + llm_output.risk_adjustment))
+
+    # 5. Hospital Recommendation
+    hospital_rec = hospital_service.recommend(input_data.cancer_type, input_data.latitude, input_data.longitude)
+
+    result = FinalResult(
+        cancer_type=input_data.cancer_type,
+        ml_confidence=perception.confidence,
+        preliminary_cri=preliminary_cri,
+        final_cri=final_cri,
+        triage_level=llm_output.triage_level,
+        explanation=llm_output.explanation,
+        recommendation=llm_output.recommendation,
+        hospital_recommendation=hospital_rec
+    )
+    # Buffered only; the results store is written in the background
+    result_recorder.record_triage(result)
+    return result
+
+
+def _irrelevant(reason: str) -> dict:
+    return {
+        "is_relevant": False,
+        "reason": reason,
+        "analysis": None,
+        "chart_data": None
+    }
+
+
+def _relevant(analysis_text: str, chart_data: Optional[dict]) -> dict:
+    return {
+        "is_relevant": True,
+        "reason": "Analysis successful",
+        "analysis": analysis_text,
+        "chart_data": chart_data
+    }
+
+
+async def run_ai_analysis(content_parts: list, mode: Optional[str] = None) -> dict:
+    """
+    Guardrail + oncology analysis for /ai-analyze.
+
+    In "serial" mode the analysis only starts once the guardrail has accepted the
+    input. In "speculative" mode both Gemini calls start together; if the guardrail
+    rejects the input the in-flight analysis is cancelled and its result discarded.
+    Text-only inputs first go through the local relevance pre-classifier; only
+    the cases it is unsure about reach the LLM guardrail.
+    Per-stage wall time (ms) is returned under "timings_ms".
+
+    Identical requests in flight at the same time (same image bytes, same text
+    after normalization, same mode) share a single run and its result.
+    Every request's outcome is recorded in the results store.
+
+    Gemini calls wait for an admission slot at ADMISSION_AI_PRIORITY; raises
+    AdmissionRejected if the run is shed or times out in the queue.
+    """
+    mode = _resolve_mode(mode)
+    content_key = content_parts_key(content_parts)
+    if content_key is None or not settings.ai_analysis_coalescing:
+        result = await _analyze(content_parts, mode)
+        result_recorder.record_ai_analysis(result, content_key)
+        return result
+
+    result, shared = await ai_analysis_flight.do(f"{mode}:{content_key}", lambda: _analyze(content_parts, mode))
+    if shared:
+        LLM_CALLS_SAVED.inc("ai_analysis", amount=_upstream_calls(result["timings_ms"]))
+    # Buffered only; the results store is written in the background
+    result_recorder.record_ai_analysis(result, content_key)
+    # Every waiter gets its own copy, so callers can't mutate each other's result
+    return {**result, "timings_ms": dict(result["timings_ms"])}
+
+
+def _upstream_calls(timings: dict) -> int:
+    """Gemini calls a run made, judged by its recorded stages."""
+    return int("guardrail" in timings) + int("analysis" in timings or bool(timings.get("analysis_cancelled")))
+
+
+async def _analyze(content_parts: list, mode: str) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    decision = _prefilter(content_parts, timings)
+
+    if decision is not None and not decision[0]:
+        result = _irrelevant(decision[1])
+    else:
+        async with llm_admission.slot(settings.admission_ai_priority, "ai_analysis"):
+            if decision is not None:
+                analysis_text, chart_data = await _timed(
+                    "analysis", gemini_service.analyze_oncology(content_parts), timings
+                )
+                result = _relevant(analysis_text, chart_data)
+            elif mode == "speculative":
+                result = await _run_speculative(content_parts, timings)
+            else:
+                result = await _run_serial(content_parts, timings)
+    timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+
+    result["mode"] = mode
+    result["timings_ms"] = timings
+    return result
+
+
+def _resolve_mode(mode: Optional[str]) -> str:
+    mode = mode or settings.ai_analysis_mode
+    if mode not in ANALYSIS_MODES:
+        print(f"Unknown AI analysis mode '{mode}', falling back to serial")
+        mode = "serial"
+    return mode
+
+
+def _prefilter(content_parts: list, timings: dict) -> Optional[Tuple[bool, str]]:
+    """Local relevance decision for text-only inputs; None means ask the LLM guardrail."""
+    if not (relevance_prefilter.enabled and content_parts and all(isinstance(part, str) for part in content_parts)):
+        return None
+    start = time.perf_counter()
+    decision = relevance_prefilter.decide("\n".join(content_parts))
+    elapsed = time.perf_counter() - start
+    observe_stage("prefilter", elapsed)
+    timings["prefilter"] = round(elapsed * 1000, 3)
+    return decision
+
+
+async def _run_serial(content_parts: list, timings: dict) -> dict:
+    # 1. Guardrail Check
+    is_relevant, reason = await _timed("guardrail", gemini_service.check_relevance(content_parts), timings)
+    if not is_relevant:
+        return _irrelevant(reason)
+
+    # 2. Oncology Analysis
+    analysis_text, chart_data = await _timed("analysis", gemini_service.analyze_oncology(content_parts), timings)
+    return _relevant(analysis_text, chart_data)
+
+
+async def _run_speculative(content_parts: list, timings: dict) -> dict:
+    guardrail = asyncio.create_task(_timed("guardrail", gemini_service.check_relevance(content_parts), timings))
+    analysis = asyncio.create_task(_timed("analysis", gemini_service.analyze_oncology(content_parts), timings))
+    try:
+        is_relevant, reason = await guardrail
+        if not is_relevant:
+            await _cancel(analysis)
+            timings.pop("analysis", None)
+            timings["analysis_cancelled"] = True
+            return _irrelevant(reason)
+
+        analysis_text, chart_data = await analysis
+        return _relevant(analysis_text, chart_data)
+    finally:
+        # Client went away or something raised: never leave Gemini calls running.
+        await _cancel(guardrail)
+        await _cancel(analysis)
+
+
+async def stream_ai_analysis(content_parts: list, mode: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Server-sent-events variant of `run_ai_analysis`. Emits, in order:
+    `relevance` (guardrail outcome), zero or more `chunk` events with markdown as
+    Gemini generates it, `chart` with the parsed chart JSON block (if any), and
+    `done` with per-stage timings. Upstream failures surface as an `error` event.
+    In speculative mode the analysis stream starts alongside the guardrail and
+    its chunks are buffered until the guardrail accepts the input. Work that is
+    not admitted to the LLM stages gets an `error` event with `retry_after_s`.
+    A stream that runs to `done` is recorded in the results store like a
+    `run_ai_analysis` outcome.
+    """
+    mode = _resolve_mode(mode)
+    content_key = content_parts_key(content_parts)
+    timings = {}
+    start = time.perf_counter()
+    chunks: asyncio.Queue = asyncio.Queue()
+    producer = None
+    ticket = None
+
+    async def produce():
+        try:
+            async for text in gemini_service.analyze_oncology_stream(content_parts):
+                await chunks.put(("chunk", text))
+            await chunks.put(("end", None))
+        except Exception as e:
+            await chunks.put(("error", str(e)))
+
+    def elapsed_ms():
+        return round((time.perf_counter() - start) * 1000, 2)
+
+    def record(result: dict):
+        timings["total"] = elapsed_ms()
+        result_recorder.record_ai_analysis({**result, "mode": mode, "timings_ms": timings}, content_key)
+
+    try:
+        decision = _prefilter(content_parts, timings)
+        if decision is None or decision[0]:
+            try:
+                ticket = await llm_admission.acquire(settings.admission_ai_priority, "ai_analysis")
+            except AdmissionRejected as e:
+                yield sse_event("error", {"detail": str(e), "retry_after_s": int(e.retry_after)})
+                return
+        if decision is None:
+            if mode == "speculative":
+                producer = asyncio.create_task(produce())
+            decision = await _timed("guardrail", gemini_service.check_relevance(content_parts), timings)
+
+        is_relevant, reason = decision
+        yield sse_event("relevance", {"is_relevant": is_relevant, "reason": reason})
+        if not is_relevant:
+            if producer is not None:
+                await _cancel(producer)
+                timings["analysis_cancelled"] = True
+            record(_irrelevant(reason))
+            yield sse_event("done", {"mode": mode, "timings_ms": timings})
+            return
+
+        if producer is None:
+            producer = asyncio.create_task(produce())
+
+        parser = AnalysisStreamParser()
+        analysis_text = []
+        while True:
+            kind, payload = await chunks.get()
+            if kind == "chunk":
+                timings.setdefault("first_chunk", elapsed_ms())
+                text = parser.feed(payload)
+                if text:
+                    analysis_text.append(text)
+                    yield sse_event("chunk", {"text": text})
+            elif kind == "error":
+                # Recorded the way run_ai_analysis records a failed analysis
+                outcome = _relevant(f"Error during analysis: {payload}", None)
+                yield sse_event("error", {"detail": outcome["analysis"]})
+                break
+            else:
+                # Complete answer: flush held-back text and parse the chart data
+                remaining, chart_data = parser.finish()
+                if remaining:
+                    analysis_text.append(remaining)
+                    yield sse_event("chunk", {"text": remaining})
+                if chart_data is not None:
+                    yield sse_event("chart", {"chart_data": chart_data})
+                outcome = _relevant("".join(analysis_text), chart_data)
+                break
+
+        record(outcome)
+        yield sse_event("done", {"mode": mode, "timings_ms": timings})
+    finally:
+        # Client disconnected or the stream finished: never leave Gemini calls running
+        if producer is not None:
+            await _cancel(producer)
+        if ticket is not None:
+            ticket.release()
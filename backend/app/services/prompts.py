@@ -0,0 +1,69 @@
+import functools
+import hashlib
+import os
+import re
+from string import Template
+from typing import List, Optional
+
+from app.core.config import settings
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "prompts")
+
+_VERSION_FILE = re.compile(r"^(v\d+)\.system\.txt$")
+
+
+class PromptTemplate:
+    """
+    One version of a prompt, loaded from data/prompts/<name>/<version>.*.txt:
+    the static `system` instruction (sent once per client as the model's
+    system instruction) and an optional per-call user template with
+    `$placeholders`, parsed once at load time.
+    """
+    def __init__(self, name: str, version: str, system: str, user: Optional[str] = None):
+        self.name = name
+        self.version = version
+        self.system = system
+        self._user = Template(user) if user is not None else None
+        self.placeholders = set(self._user.get_identifiers()) if self._user is not None else set()
+        digest = hashlib.sha256(f"{name}\0{version}\0{system}\0{user or ''}".encode("utf-8"))
+        # Short content hash, for cache keys and logs: changes whenever the prompt text does
+        self.fingerprint = digest.hexdigest()[:12]
+
+    def render(self, **values) -> str:
+        if self._user is None:
+            raise ValueError(f"Prompt '{self.name}' has no user template")
+        missing = self.placeholders - set(values)
+        if missing:
+            raise ValueError(f"Prompt '{self.name}' is missing values for {sorted(missing)}")
+        return self._user.substitute(values)
+
+
+def available_versions(name: str) -> List[str]:
+    directory = os.path.join(PROMPT_DIR, name)
+    if not os.path.isdir(directory):
+        return []
+    versions = [m.group(1) for m in map(_VERSION_FILE.match, os.listdir(directory)) if m]
+    return sorted(versions, key=lambda v: int(v[1:]))
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """
+    Loads (once) prompt `name` at `version`, the version pinned in
+    PROMPT_VERSIONS, or else the latest one on disk.
+    """
+    version = version or settings.prompt_versions.get(name)
+    if version is None:
+        versions = available_versions(name)
+        if not versions:
+            raise ValueError(f"No prompt templates found for '{name}' in {PROMPT_DIR}")
+        version = versions[-1]
+
+    base = os.path.join(PROMPT_DIR, name, version)
+    with open(f"{base}.system.txt", "r", encoding="utf-8") as f:
+        system = f.read().strip()
+    user = None
+    if os.path.exists(f"{base}.user.txt"):
+        with open(f"{base}.user.txt", "r", encoding="utf-8") as f:
+            user = f.read().strip()
+    return PromptTemplate(name, version, system, user)
@@ -0,0 +1,164 @@
+import importlib
+import json
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data")
+
+
+class RelevanceClassifier(ABC):
+    """
+    Interface for local relevance classifiers. `score` returns the probability
+    (0.0-1.0) that the text is oncology/medical related.
+    """
+    name = "base"
+
+    @abstractmethod
+    def score(self, text: str) -> float:
+        ...
+
+
+class LexiconClassifier(RelevanceClassifier):
+    """
+    Weighted keyword scorer: sums the weights of every distinct lexicon term
+    found in the text (plurals included) and squashes the total with a logistic.
+    """
+    name = "lexicon"
+
+    def __init__(self, lexicon_path: Optional[str] = None):
+        if lexicon_path is None:
+            lexicon_path = os.path.join(DATA_DIR, "relevance_lexicon.json")
+        with open(lexicon_path, "r") as f:
+            lexicon = json.load(f)
+
+        self.bias = lexicon.get("bias", 0.0)
+        self.weights = {**lexicon.get("positive", {}), **lexicon.get("negative", {})}
+        # Longest terms first so multi-word phrases win over their parts
+        terms = sorted(self.weights, key=len, reverse=True)
+        alternation = "|".join(re.escape(t) for t in terms)
+        self._pattern = re.compile(rf"\b({alternation})(?:s|es)?\b")
+
+    def matched_terms(self, text: str) -> set:
+        return set(self._pattern.findall(text.lower()))
+
+    def score(self, text: str) -> float:
+        total = self.bias + sum(self.weights[t] for t in self.matched_terms(text))
+        return 1.0 / (1.0 + math.exp(-total))
+
+
+CLASSIFIERS = {
+    LexiconClassifier.name: LexiconClassifier,
+}
+
+
+def load_classifier(name: str) -> RelevanceClassifier:
+    """
+    Resolves a classifier by registry name ("lexicon") or by
+    "package.module:ClassName" for out-of-tree implementations.
+    """
+    if name in CLASSIFIERS:
+        return CLASSIFIERS[name]()
+    if ":" in name:
+        module_name, class_name = name.split(":", 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"Unknown relevance classifier: {name}")
+
+
+class RelevancePrefilter:
+    """
+    Settles clear-cut text-only inputs locally. Scores at or above
+    `accept_threshold` are accepted, scores at or below `reject_threshold` are
+    rejected, and everything in between is escalated to the LLM guardrail.
+    """
+    def __init__(self, classifier: RelevanceClassifier,
+                 accept_threshold: float = 0.9, reject_threshold: float = 0.1,
+                 enabled: bool = True):
+        if not 0.0 <= reject_threshold < accept_threshold <= 1.0:
+            raise ValueError("Expected 0 <= reject_threshold < accept_threshold <= 1")
+        self.classifier = classifier
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.enabled = enabled
+        self.accepted = 0
+        self.rejected = 0
+        self.escalated = 0
+
+    def decide(self, text: str) -> Optional[Tuple[bool, str]]:
+        """Returns (is_relevant, reason), or None when the LLM guardrail should decide."""
+        if not self.enabled:
+            return None
+
+        score = self.classifier.score(text)
+        if score >= self.accept_threshold:
+            self.accepted += 1
+            return True, f"Local pre-classifier: oncology/medical content (score {score:.2f})."
+        if score <= self.reject_threshold:
+            self.rejected += 1
+            return False, f"Local pre-classifier: not related to oncology or medicine (score {score:.2f})."
+        self.escalated += 1
+        return None
+
+    def stats(self) -> dict:
+        decided = self.accepted + self.rejected
+        total = decided + self.escalated
+        return {
+            "classifier": self.classifier.name,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "escalated": self.escalated,
+            "llm_calls_avoided": decided,
+            "avoided_ratio": round(decided / total, 4) if total else 0.0,
+        }
+
+
+def load_labeled_examples(path: Optional[str] = None) -> List[Tuple[str, bool]]:
+    if path is None:
+        path = os.path.join(DATA_DIR, "relevance_eval.jsonl")
+    examples = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                examples.append((row["text"], bool(row["label"])))
+    return examples
+
+
+def evaluate(prefilter: RelevancePrefilter, examples: Iterable[Tuple[str, bool]]) -> dict:
+    """
+    Offline accuracy of the prefilter's local decisions. Escalated examples
+    count towards coverage only; the LLM guardrail handles them in production.
+    """
+    total = correct = decided = false_rejects = false_accepts = 0
+    for text, label in examples:
+        total += 1
+        decision = prefilter.decide(text)
+        if decision is None:
+            continue
+        decided += 1
+        if decision[0] == label:
+            correct += 1
+        elif label:
+            false_rejects += 1
+        else:
+            false_accepts += 1
+    return {
+        "examples": total,
+        "decided": decided,
+        "coverage": round(decided / total, 4) if total else 0.0,
+        "accuracy": round(correct / decided, 4) if decided else 0.0,
+        "false_rejects": false_rejects,
+        "false_accepts": false_accepts,
+    }
+
+
+relevance_prefilter = RelevancePrefilter(
+    load_classifier(settings.relevance_classifier),
+    accept_threshold=settings.relevance_accept_threshold,
+    reject_threshold=settings.relevance_reject_threshold,
+    enabled=settings.relevance_prefilter_enabled
+)
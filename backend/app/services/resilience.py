@@ -0,0 +1,257 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_STATE, LLM_RESILIENCE_EVENTS
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, so callers fall back
+    immediately instead of waiting on a failing upstream. After `reset_timeout_s`
+    it lets a single probe call through (half-open): success closes the circuit,
+    failure re-opens it for another `reset_timeout_s`.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED], name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            CIRCUIT_STATE.set(STATE_VALUES[state], self.name)
+            if state == OPEN:
+                print(f"Circuit '{self.name}' opened after {self.failures} consecutive failures")
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() - self.opened_at >= self.reset_timeout_s:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self._clock()
+                self._set_state(OPEN)
+
+    def release_probe(self):
+        """For a call that ended without a verdict (cancelled): lets the next caller probe instead."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(CLOSED)
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges to a fraction of regular traffic: every call
+    deposits `ratio` tokens (up to `max_tokens`), every retry or hedge spends
+    one. Stops retry storms from multiplying load on a struggling upstream.
+    """
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0, initial_tokens: Optional[float] = None):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens if initial_tokens is None else initial_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies (seconds)."""
+    def __init__(self, window: int = 256):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        return percentile(self._samples, p)
+
+
+def percentile(samples: Iterable[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def backoff_s(attempt: int, base_s: float, cap_s: float, rng: random.Random = random) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return rng.uniform(0.0, min(cap_s, base_s * (2 ** attempt)))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_budgets: Dict[str, RetryBudget] = {}
+
+
+def circuit_breaker(upstream: str) -> CircuitBreaker:
+    """Shared breaker per upstream model: every caller of the same model sees the same health."""
+    if upstream not in _breakers:
+        _breakers[upstream] = CircuitBreaker(
+            upstream,
+            failure_threshold=settings.llm_circuit_failures,
+            reset_timeout_s=settings.llm_circuit_reset_s
+        )
+    return _breakers[upstream]
+
+
+def retry_budget(upstream: str) -> RetryBudget:
+    if upstream not in _budgets:
+        _budgets[upstream] = RetryBudget(ratio=settings.llm_retry_budget_ratio)
+    return _budgets[upstream]
+
+
+class ResilientCall:
+    """
+    Wraps one kind of upstream call (e.g. the cognitive triage prompt) with:
+    - the upstream's shared circuit breaker (CircuitOpenError when open),
+    - optional hedging: once `hedge_percentile` of recent latencies has
+      elapsed, a second attempt is started and the first to succeed wins,
+    - up to `max_retries` retries with jittered backoff,
+    hedges and retries both paid for from the upstream's retry budget.
+    """
+    def __init__(self, name: str, upstream: str,
+                 hedge_percentile: Optional[float] = None, hedge_min_samples: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff_base_s: Optional[float] = None,
+                 backoff_cap_s: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, budget: Optional[RetryBudget] = None):
+        self.name = name
+        self.breaker = breaker or circuit_breaker(upstream)
+        self.budget = budget or retry_budget(upstream)
+        self.hedge_percentile = settings.llm_hedge_percentile if hedge_percentile is None else hedge_percentile
+        self.hedge_min_samples = settings.llm_hedge_min_samples if hedge_min_samples is None else hedge_min_samples
+        self.max_retries = settings.llm_max_retries if max_retries is None else max_retries
+        self.backoff_base_s = settings.llm_retry_backoff_s if backoff_base_s is None else backoff_base_s
+        self.backoff_cap_s = 2.0 if backoff_cap_s is None else backoff_cap_s
+        self.latency = LatencyTracker()
+
+    def _event(self, event: str):
+        LLM_RESILIENCE_EVENTS.inc(self.name, event)
+
+    async def call(self, attempt: Callable[[], Awaitable[T]], deadline_s: Optional[float] = None) -> T:
+        """
+        Runs `attempt` (a zero-argument coroutine factory) under the policy.
+        Raises CircuitOpenError without calling upstream when the circuit is
+        open, asyncio.TimeoutError past `deadline_s`, or the last attempt's error.
+        """
+        if not self.breaker.allow():
+            self._event("short_circuit")
+            raise CircuitOpenError(f"Circuit for '{self.breaker.name}' is open")
+        self.budget.deposit()
+        try:
+            return await asyncio.wait_for(self._with_retries(attempt), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+
+    async def _with_retries(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        tries = 0
+        while True:
+            try:
+                result = await self._hedged(attempt)
+            except Exception:
+                self.breaker.record_failure()
+                if tries >= self.max_retries or self.breaker.state == OPEN or not self.budget.try_spend():
+                    raise
+                self._event("retry")
+                await asyncio.sleep(backoff_s(tries, self.backoff_base_s, self.backoff_cap_s))
+                tries += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _timed(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await attempt()
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._timed(attempt)
+
+        primary = asyncio.ensure_future(self._timed(attempt))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.budget.try_spend():
+                self._event("hedge")
+                tasks.add(asyncio.ensure_future(self._timed(attempt)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._event("hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
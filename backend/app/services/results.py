@@ -0,0 +1,321 @@
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import RESULT_FLUSH_SECONDS, RESULT_RECORDS
+from app.models.schemas import FinalResult
+
+TRIAGE, AI_ANALYSIS = "triage", "ai_analysis"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS triage_results (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    cancer_type TEXT NOT NULL,
+    triage_level TEXT NOT NULL,
+    ml_confidence REAL NOT NULL,
+    preliminary_cri INTEGER NOT NULL,
+    final_cri INTEGER NOT NULL,
+    explanation TEXT,
+    recommendation TEXT,
+    hospital_recommendation TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_triage_created ON triage_results (created_at);
+CREATE INDEX IF NOT EXISTS idx_triage_cancer_created ON triage_results (cancer_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_triage_level_created ON triage_results (triage_level, created_at);
+-- CRI ranges: seek to the matching rows, then sort just those by created_at
+CREATE INDEX IF NOT EXISTS idx_triage_cri_created ON triage_results (final_cri, created_at);
+
+CREATE TABLE IF NOT EXISTS ai_analyses (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    content_key TEXT,
+    is_relevant INTEGER NOT NULL,
+    reason TEXT,
+    mode TEXT,
+    analysis TEXT,
+    chart_data TEXT,
+    total_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_created ON ai_analyses (created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_content_key ON ai_analyses (content_key);
+"""
+
+TRIAGE_COLUMNS = ("created_at", "cancer_type", "triage_level", "ml_confidence", "preliminary_cri",
+                  "final_cri", "explanation", "recommendation", "hospital_recommendation")
+AI_COLUMNS = ("created_at", "content_key", "is_relevant", "reason", "mode", "analysis", "chart_data", "total_ms")
+
+
+def encode_cursor(created_at: float, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}:{row_id}".encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Raises ValueError for a cursor this store didn't issue."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").split(":")
+        return float(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ResultStore:
+    """
+    SQLite (WAL) history of triage and AI analysis outcomes. Writes come in
+    bulk from ResultRecorder; reads use their own connection so queries
+    never wait behind a flush. Blocking; call it from worker threads.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+        self._reader = None
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader
+
+    def insert_many(self, records: List[Tuple[str, tuple]]) -> int:
+        """Writes (table, row) records in one transaction; rows follow TRIAGE_COLUMNS / AI_COLUMNS."""
+        triage = [row for table, row in records if table == TRIAGE]
+        analyses = [row for table, row in records if table == AI_ANALYSIS]
+        with self._write_lock:
+            conn = self._writer_connection()
+            conn.execute("BEGIN")
+            try:
+                if triage:
+                    conn.executemany(
+                        f"INSERT INTO triage_results ({', '.join(TRIAGE_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(TRIAGE_COLUMNS))})", triage
+                    )
+                if analyses:
+                    conn.executemany(
+                        f"INSERT INTO ai_analyses ({', '.join(AI_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(AI_COLUMNS))})", analyses
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(triage) + len(analyses)
+
+    def _page(self, table: str, where: List[str], params: list, limit: int, cursor: Optional[str]) -> dict:
+        """
+        Newest first, keyset-paginated on (created_at, id): each page is an
+        index seek past the cursor, as cheap on page 10,000 as on page 1.
+        A bounded CRI range instead seeks the CRI index and sorts the rows in
+        range (SQLite picks whichever plan reads fewer rows).
+        """
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            where = where + ["(created_at, id) < (?, ?)"]
+            params = params + [created_at, row_id]
+        sql = f"SELECT * FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self._read_lock:
+            rows = self._reader_connection().execute(sql, params + [limit + 1]).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]["created_at"], items[-1]["id"]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def query_triage(self, cancer_type: Optional[str] = None, triage_level: Optional[str] = None,
+                     min_cri: Optional[int] = None, max_cri: Optional[int] = None,
+                     since: Optional[float] = None, until: Optional[float] = None,
+                     limit: int = 50, cursor: Optional[str] = None) -> dict:
+        where, params = [], []
+        for clause, value in (("cancer_type = ?", cancer_type), ("triage_level = ?", triage_level),
+                              ("final_cri >= ?", min_cri), ("final_cri <= ?", max_cri),
+                              ("created_at >= ?", since), ("created_at < ?", until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        return self._page("triage_results", where, params, limit, cursor)
+
+    def query_ai_analyses(self, is_relevant: Optional[bool] = None, content_key: Optional[str] = None,
+                          since: Optional[float] = None, until: Optional[float] = None,
+                          limit: int = 50, cursor: Optional[str] = None) -> dict:
+        where, params = [], []
+        for clause, value in (("is_relevant = ?", None if is_relevant is None else int(is_relevant)),
+                              ("content_key = ?", content_key),
+                              ("created_at >= ?", since), ("created_at < ?", until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        page = self._page("ai_analyses", where, params, limit, cursor)
+        for item in page["items"]:
+            item["is_relevant"] = bool(item["is_relevant"])
+            item["chart_data"] = json.loads(item["chart_data"]) if item["chart_data"] else None
+        return page
+
+    def query_plan(self, sql: str, params: tuple = ()) -> List[str]:
+        with self._read_lock:
+            rows = self._reader_connection().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row["detail"] for row in rows]
+
+    def close(self):
+        with self._write_lock, self._read_lock:
+            for conn in (self._writer, self._reader):
+                if conn is not None:
+                    conn.close()
+            self._writer = self._reader = None
+
+
+class ResultRecorder:
+    """
+    Write-behind persistence: `record_*` only appends to an in-memory buffer
+    (no I/O on the request path), and a background task flushes the buffer
+    to the ResultStore in bulk every `flush_interval_s` or once `batch_size`
+    records are waiting. The buffer is bounded: past `max_buffer` the oldest
+    unflushed records are dropped (and counted) rather than growing without
+    limit while the disk is slow. `stop` flushes what is left, within
+    `flush_timeout_s`.
+    """
+    def __init__(self, store: ResultStore, enabled: bool = True, flush_interval_s: float = 1.0,
+                 batch_size: int = 500, max_buffer: int = 50000, flush_timeout_s: float = 10.0):
+        self.store = store
+        self.enabled = enabled
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = max(1, batch_size)
+        self.flush_timeout_s = flush_timeout_s
+        self._buffer = deque(maxlen=max(1, max_buffer))
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def _append(self, table: str, row: tuple):
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+                RESULT_RECORDS.inc(table, "dropped")
+            self._buffer.append((table, row))
+            full = len(self._buffer) >= self.batch_size
+        if full and self._wakeup is not None:
+            # Callers may be on another thread (batch workers); wake the flusher on its own loop
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def record_triage(self, result: FinalResult):
+        self._append(TRIAGE, (
+            time.time(), result.cancer_type, result.triage_level, result.ml_confidence,
+            result.preliminary_cri, result.final_cri, result.explanation, result.recommendation,
+            result.hospital_recommendation
+        ))
+
+    def record_ai_analysis(self, result: dict, content_key: Optional[str] = None):
+        chart_data = result.get("chart_data")
+        self._append(AI_ANALYSIS, (
+            time.time(), content_key, int(bool(result.get("is_relevant"))), result.get("reason"),
+            result.get("mode"), result.get("analysis"), json.dumps(chart_data) if chart_data is not None else None,
+            result.get("timings_ms", {}).get("total")
+        ))
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def _take(self) -> list:
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        return batch
+
+    def flush_now(self) -> int:
+        """Writes everything buffered so far (blocking). Returns the number of records written."""
+        written = 0
+        while True:
+            batch = self._take()
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def _write(self, batch: list) -> int:
+        start = time.perf_counter()
+        try:
+            count = self.store.insert_many(batch)
+        except Exception as e:
+            print(f"Result store flush failed, {len(batch)} records lost: {e}")
+            self.dropped += len(batch)
+            for table, _ in batch:
+                RESULT_RECORDS.inc(table, "dropped")
+            return 0
+        RESULT_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        self.written += count
+        for table, _ in batch:
+            RESULT_RECORDS.inc(table, "written")
+        return count
+
+    async def start(self):
+        if self._task is not None or not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        if self.pending():
+            try:
+                await asyncio.wait_for(asyncio.to_thread(self.flush_now), timeout=self.flush_timeout_s)
+            except asyncio.TimeoutError:
+                print(f"Result store flush timed out after {self.flush_timeout_s}s, {self.pending()} records not written")
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self.pending():
+                # One bounded batch per thread hop, so shutdown never waits on a huge backlog write
+                await asyncio.to_thread(self._write, self._take())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "pending": self.pending(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+result_recorder = ResultRecorder(
+    ResultStore(settings.results_db_path),
+    enabled=settings.results_persist,
+    flush_interval_s=settings.results_flush_interval_s,
+    batch_size=settings.results_batch_size,
+    max_buffer=settings.results_max_buffer,
+    flush_timeout_s=settings.results_flush_timeout_s
+)
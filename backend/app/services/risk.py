@@ -1,6 +1,16 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import stage
 from app.models.schemas import PatientInput, PerceptionOutput
+from app.services.inference import MicroBatcher
+
+ML_SCORED_PREDICTIONS = ("suspected", "inconclusive")
 
 class RiskService:
+    def __init__(self):
+        self._batcher: Optional[MicroBatcher] = None
+
     def calculate_preliminary_cri(self, input_data: PatientInput, perception: PerceptionOutput) -> int:
         """
         Calculates the preliminary Cancer Risk Index (CRI) based on deterministic logic.
@@ -9,22 +19,63 @@ class RiskService:
         - Symptom Severity: 30%
         - Risk Factors: 10%
         """
+        with stage("risk"):
+            # 1. ML Contribution (0-60)
+            # Only count if prediction is "suspected" or "inconclusive"
+            ml_score = 0
+            if perception.prediction in ML_SCORED_PREDICTIONS:
+                 ml_score = perception.confidence * 60
         
-        # 1. ML Contribution (0-60)
-        # Only count if prediction is "suspected" or "inconclusive"
-        ml_score = 0
-        if perception.prediction in ["suspected", "inconclusive"]:
-             ml_score = perception.confidence * 60
+            # 2. Symptom Score (0-30)
+            # Simple heyristic: 5 points per symptom, max 30
+            symptom_score = min(len(input_data.symptoms) * 5, 30)
         
-        # 2. Symptom Score (0-30)
-        # Simple heyristic: 5 points per symptom, max 30
-        symptom_score = min(len(input_data.symptoms) * 5, 30)
+            # 3. Risk Factor Score (0-10)
+            # 5 points per risk factor, max 10
+            risk_score = min(len(input_data.risk_factors) * 5, 10)
         
-        # 3. Risk Factor Score (0-10)
-        # 5 points per risk factor, max 10
-        risk_score = min(len(input_data.risk_factors) * 5, 10)
-        
-        total_cri = round(ml_score + symptom_score + risk_score)
-        return min(total_cri, 100) # Cap at 100
+            total_cri = round(ml_score + symptom_score + risk_score)
+            return min(total_cri, 100) # Cap at 100
+
+    def calculate_preliminary_cri_batch(self, inputs: Sequence[PatientInput], perceptions: Sequence[PerceptionOutput]) -> List[int]:
+        """
+        Vectorized `calculate_preliminary_cri` for a whole cohort.
+        Returns the same scores as the per-case method, in input order.
+        """
+        if len(inputs) != len(perceptions):
+            raise ValueError("inputs and perceptions must have the same length")
+        if not inputs:
+            return []
+
+        confidence = np.fromiter((p.confidence for p in perceptions), dtype=np.float64, count=len(perceptions))
+        scored = np.fromiter((p.prediction in ML_SCORED_PREDICTIONS for p in perceptions), dtype=bool, count=len(perceptions))
+        n_symptoms = np.fromiter((len(i.symptoms) for i in inputs), dtype=np.int64, count=len(inputs))
+        n_risk_factors = np.fromiter((len(i.risk_factors) for i in inputs), dtype=np.int64, count=len(inputs))
+
+        ml_score = np.where(scored, confidence * 60, 0.0)
+        symptom_score = np.minimum(n_symptoms * 5, 30)
+        risk_score = np.minimum(n_risk_factors * 5, 10)
+
+        # np.round rounds half to even, matching Python's round()
+        total_cri = np.round(ml_score + symptom_score + risk_score)
+        return np.minimum(total_cri, 100).astype(np.int64).tolist()
+
+    async def calculate_preliminary_cri_async(self, input_data: PatientInput, perception: PerceptionOutput) -> int:
+        """
+        `calculate_preliminary_cri` for concurrent callers: cases whose
+        perception finishes together are scored as one NumPy chunk through
+        `calculate_preliminary_cri_batch`.
+        """
+        if self._batcher is None:
+            self._batcher = MicroBatcher(
+                self._score_chunk,
+                max_batch_size=settings.batch_max_concurrency,
+                max_wait_ms=settings.batch_score_wait_ms
+            )
+        return await self._batcher.submit((input_data, perception))
+
+    def _score_chunk(self, cases: List[Tuple[PatientInput, PerceptionOutput]]) -> List[int]:
+        with stage("risk"):
+            return self.calculate_preliminary_cri_batch([c[0] for c in cases], [c[1] for c in cases])
 
 risk_service = RiskService()
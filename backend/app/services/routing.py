@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import LLM_ROUTE_DECISIONS, LLM_TIER_CALLS, LLM_TIER_SECONDS
+from app.services.resilience import OPEN, CircuitOpenError, ResilientCall, circuit_breaker, percentile
+
+T = TypeVar("T")
+
+FLASH, PRO = "flash", "pro"
+TIERS = (FLASH, PRO)
+
+# Kinds of LLM call
+GUARDRAIL, ANALYSIS, TRIAGE = "guardrail", "analysis", "triage"
+
+
+@dataclass(frozen=True)
+class Route:
+    task: str
+    tier: str
+    model_name: str
+    reason: str
+
+
+class TierStats:
+    """
+    Rolling window of one tier's recent calls: at most `window` of them, none
+    older than `window_s`. Error rate is over all of them, latency over the
+    successful ones. Samples age out even when the tier gets no traffic, so a
+    tier that was routed around after a bad spell is tried again once its
+    bad samples are gone.
+    """
+    def __init__(self, window: int = 200, window_s: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        # (time, seconds, ok)
+        self._calls = deque(maxlen=window)
+        self.window_s = window_s
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, ok: bool):
+        with self._lock:
+            self._calls.append((self._clock(), seconds, ok))
+
+    def _recent(self) -> list:
+        cutoff = self._clock() - self.window_s
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+        return list(self._calls)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recent())
+
+    def error_rate(self) -> float:
+        with self._lock:
+            calls = self._recent()
+        return sum(1 for _, _, ok in calls if not ok) / len(calls) if calls else 0.0
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            calls = self._recent()
+        return percentile((seconds for _, seconds, ok in calls if ok), 95)
+
+
+class ModelRouter:
+    """
+    Picks the model tier for each LLM call. Guardrails, triage and short
+    text-only analyses go to the cheap, fast tier; image analyses and inputs
+    of at least `pro_min_tokens` go to the heavier one. A tier whose rolling
+    error rate or p95 latency is over its limit (once it has `min_samples`
+    calls within the last `window_s`), or whose circuit is open, hands its
+    calls to the other tier for as long as that one is healthy. Health is
+    judged on recent calls only, so a tier recovers once its bad samples
+    age out. Disabled, every task keeps a fixed tier:
+    analyses on pro, everything else on flash.
+    """
+    def __init__(self, models: Optional[Dict[str, str]] = None, enabled: Optional[bool] = None,
+                 pro_min_tokens: Optional[int] = None, window: Optional[int] = None,
+                 min_samples: Optional[int] = None, max_error_rate: Optional[float] = None,
+                 max_p95_s: Optional[float] = None, window_s: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.models = models or {FLASH: settings.llm_flash_model, PRO: settings.llm_pro_model}
+        self.enabled = settings.llm_routing if enabled is None else enabled
+        self.pro_min_tokens = settings.llm_route_pro_min_tokens if pro_min_tokens is None else pro_min_tokens
+        self.min_samples = settings.llm_route_min_samples if min_samples is None else min_samples
+        self.max_error_rate = settings.llm_route_max_error_rate if max_error_rate is None else max_error_rate
+        self.max_p95_s = settings.llm_route_max_p95_s if max_p95_s is None else max_p95_s
+        self.window = window or settings.llm_route_window
+        self.window_s = settings.llm_route_window_s if window_s is None else window_s
+        self._clock = clock
+        self.tier_stats = self._new_stats()
+
+    def _new_stats(self) -> Dict[str, TierStats]:
+        return {tier: TierStats(self.window, self.window_s, self._clock) for tier in TIERS}
+
+    def model_name(self, tier: str) -> str:
+        return self.models[tier]
+
+    def route(self, task: str, tokens: int, has_image: bool = False) -> Route:
+        tier, reason = self._preferred(task, tokens, has_image)
+        if self.enabled and not self.healthy(tier):
+            other = PRO if tier == FLASH else FLASH
+            if self.healthy(other):
+                tier, reason = other, f"{tier}_unhealthy"
+        LLM_ROUTE_DECISIONS.inc(task, tier, reason)
+        return Route(task, tier, self.models[tier], reason)
+
+    def _preferred(self, task: str, tokens: int, has_image: bool):
+        if not self.enabled:
+            return (PRO if task == ANALYSIS else FLASH), "static"
+        if task == GUARDRAIL:
+            return FLASH, "guardrail"
+        if has_image:
+            return PRO, "image"
+        if tokens >= self.pro_min_tokens:
+            return PRO, "long_input"
+        return FLASH, "short_text"
+
+    def healthy(self, tier: str) -> bool:
+        if circuit_breaker(self.models[tier]).state == OPEN:
+            return False
+        stats = self.tier_stats[tier]
+        if len(stats) < self.min_samples:
+            return True
+        if stats.error_rate() > self.max_error_rate:
+            return False
+        p95 = stats.p95()
+        return not (self.max_p95_s > 0 and p95 is not None and p95 > self.max_p95_s)
+
+    def record(self, route: Route, seconds: float, ok: bool):
+        self.tier_stats[route.tier].add(seconds, ok)
+        LLM_TIER_CALLS.inc(route.tier, route.task, "ok" if ok else "error")
+        if ok:
+            LLM_TIER_SECONDS.observe(seconds, route.tier, route.task)
+
+    async def call(self, route: Route, resilient: ResilientCall, attempt: Callable[[], Awaitable[T]],
+                   deadline_s: Optional[float] = None) -> T:
+        """Runs `attempt` through the tier's ResilientCall and records the outcome against the tier."""
+        start = time.perf_counter()
+        try:
+            result = await resilient.call(attempt, deadline_s=deadline_s)
+        except CircuitOpenError:
+            # Nothing was sent; the open circuit already marks the tier unhealthy
+            raise
+        except Exception:
+            self.record(route, time.perf_counter() - start, ok=False)
+            raise
+        self.record(route, time.perf_counter() - start, ok=True)
+        return result
+
+    def stats(self) -> dict:
+        tiers = {}
+        for tier, stats in self.tier_stats.items():
+            p95 = stats.p95()
+            tiers[tier] = {
+                "model": self.models[tier],
+                "healthy": self.healthy(tier),
+                "recent_calls": len(stats),
+                "error_rate": round(stats.error_rate(), 4),
+                "p95_s": round(p95, 4) if p95 is not None else None,
+            }
+        return {"enabled": self.enabled, "pro_min_tokens": self.pro_min_tokens, "tiers": tiers}
+
+    def reset(self):
+        self.tier_stats = self._new_stats()
+
+
+model_router = ModelRouter()
@@ -0,0 +1,223 @@
+import json
+from typing import Optional, Tuple
+
+from app.core.metrics import LLM_PARSE_FAILURES, LLM_STRUCTURED_OUTPUTS
+from app.models.schemas import ChartData, OncologyAnalysis
+
+FENCE_OPEN = "```json"
+FENCE_CLOSE = "```"
+
+
+def sse_event(event: str, data) -> str:
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _partial_suffix(text: str, marker: str) -> int:
+    """Length of the longest suffix of `text` that is a proper prefix of `marker`."""
+    for size in range(min(len(text), len(marker) - 1), 0, -1):
+        if marker.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ChartBlockExtractor:
+    """
+    Single-pass parser for streamed analysis text. `feed` returns the markdown
+    that is safe to forward immediately; the first ```json ... ``` block is
+    captured instead of forwarded and parsed by `finish`. Only a few trailing
+    characters that might start a fence are ever held back. Parse failures are
+    counted by the caller (AnalysisStreamParser).
+    """
+    def __init__(self):
+        self._pending = ""
+        self._block = []
+        self._state = "text"  # text -> block -> after
+        self.block_found = False
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        out = []
+        while self._pending:
+            if self._state == "block":
+                end = self._pending.find(FENCE_CLOSE)
+                if end < 0:
+                    keep = _partial_suffix(self._pending, FENCE_CLOSE)
+                    self._block.append(self._pending[:len(self._pending) - keep])
+                    self._pending = self._pending[len(self._pending) - keep:]
+                    break
+                self._block.append(self._pending[:end])
+                self._pending = self._pending[end + len(FENCE_CLOSE):]
+                self._state = "after"
+                continue
+
+            if self._state == "after":
+                out.append(self._pending)
+                self._pending = ""
+                break
+
+            start = self._pending.find(FENCE_OPEN)
+            if start < 0:
+                keep = _partial_suffix(self._pending, FENCE_OPEN)
+                out.append(self._pending[:len(self._pending) - keep])
+                self._pending = self._pending[len(self._pending) - keep:]
+                break
+            out.append(self._pending[:start])
+            self._pending = self._pending[start + len(FENCE_OPEN):]
+            self._state = "block"
+            self.block_found = True
+        return "".join(out)
+
+    def finish(self) -> Tuple[str, Optional[dict]]:
+        """Flushes held-back text and returns (remaining_text, chart_data)."""
+        remaining = ""
+        if self._state == "block":
+            # Unterminated fence: still try to parse what arrived
+            self._block.append(self._pending)
+        else:
+            remaining = self._pending
+        self._pending = ""
+
+        chart_data = None
+        if self._block:
+            try:
+                chart_data = json.loads("".join(self._block))
+            except json.JSONDecodeError:
+                pass
+        return remaining, chart_data
+
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class AnalysisStreamParser:
+    """
+    Single-pass parser for the oncology analysis, streamed or whole. A
+    schema-constrained answer ({"analysis": "...", "chart_data": {...}}) is
+    decoded as it arrives: `feed` returns the newly decoded part of the
+    `analysis` string, so markdown still streams token by token. Free-text
+    answers (markdown with a ```json chart block) go through
+    ChartBlockExtractor instead. `finish` returns (remaining_text, chart_data)
+    and counts the parse outcome.
+    """
+    def __init__(self, service: str = "analysis"):
+        self.service = service
+        self.mode = None  # "json" or "text", decided by the first non-blank character
+        self._head = ""
+        self._text = ChartBlockExtractor()
+        self._raw = []
+        # JSON tokenizer state
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode = None  # hex digits of a \uXXXX escape in progress
+        self._high_surrogate = None
+        self._expect_key = False
+        self._key = None
+        self._key_chars = None  # collecting a depth-1 key
+        self._capturing = False  # inside the "analysis" string value
+
+    def feed(self, chunk: str) -> str:
+        if self.mode is None:
+            self._head += chunk
+            stripped = self._head.lstrip()
+            if not stripped:
+                return ""
+            self.mode = "json" if stripped[0] == "{" else "text"
+            chunk, self._head = self._head, ""
+        if self.mode == "text":
+            return self._text.feed(chunk)
+        self._raw.append(chunk)
+        out = []
+        for ch in chunk:
+            self._scan(ch, out)
+        return "".join(out)
+
+    def _scan(self, ch: str, out: list):
+        if self._in_string:
+            if self._unicode is not None:
+                self._unicode += ch
+                if len(self._unicode) == 4:
+                    code, self._unicode = int(self._unicode, 16), None
+                    self._string_char(self._decode_code_point(code), out)
+            elif self._escape:
+                self._escape = False
+                if ch == "u":
+                    self._unicode = ""
+                else:
+                    self._string_char(_ESCAPES.get(ch, ch), out)
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                self._capturing = False
+                if self._key_chars is not None:
+                    self._key, self._key_chars = "".join(self._key_chars), None
+            else:
+                self._string_char(ch, out)
+            return
+
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect_key:
+                self._expect_key = False
+                self._key_chars = []
+            elif self._depth == 1 and self._key == "analysis":
+                self._capturing = True
+        elif ch in "{[":
+            self._depth += 1
+            self._expect_key = self._depth == 1
+        elif ch in "}]":
+            self._depth -= 1
+        elif ch == "," and self._depth == 1:
+            self._expect_key = True
+
+    def _decode_code_point(self, code: int) -> str:
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
+
+    def _string_char(self, text: str, out: list):
+        if self._key_chars is not None:
+            self._key_chars.append(text)
+        elif self._capturing:
+            out.append(text)
+
+    def finish(self) -> Tuple[str, Optional[dict]]:
+        remaining, chart_data, outcome = "", None, "failed"
+        if self.mode == "json":
+            try:
+                chart_data = OncologyAnalysis.model_validate_json("".join(self._raw)).chart_data.as_chart()
+                outcome = "schema"
+            except ValueError:
+                pass
+        elif self.mode == "text":
+            remaining, block = self._text.finish()
+            try:
+                if isinstance(block, dict) and "analysis" in block:
+                    # The whole structured answer, wrapped in a fence
+                    parsed = OncologyAnalysis.model_validate(block)
+                    remaining += parsed.analysis
+                    chart_data = parsed.chart_data.as_chart()
+                elif block is not None:
+                    chart_data = ChartData.model_validate(block).as_chart()
+                outcome = "recovered" if chart_data is not None else "failed"
+            except ValueError:
+                pass
+
+        LLM_STRUCTURED_OUTPUTS.inc(self.service, outcome)
+        if outcome == "failed":
+            LLM_PARSE_FAILURES.inc(self.service)
+        return remaining, chart_data
+
+
+def parse_analysis(text: str, service: str = "analysis") -> Tuple[str, Optional[dict]]:
+    """(analysis_markdown, chart_data) from a complete oncology analysis answer."""
+    parser = AnalysisStreamParser(service)
+    head = parser.feed(text)
+    remaining, chart_data = parser.finish()
+    return head + remaining, chart_data
@@ -0,0 +1,121 @@
+from typing import Iterator, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.core.metrics import LLM_PARSE_FAILURES, LLM_STRUCTURED_OUTPUTS
+
+T = TypeVar("T", bound=BaseModel)
+
+# The OpenAPI subset Gemini accepts in `response_schema`; anything else is rejected by the SDK
+_SCHEMA_KEYS = ("description", "enum")
+
+
+class StructuredOutputError(ValueError):
+    """An LLM answer that neither matches its response schema nor contains a JSON object that does."""
+    def __init__(self, service: str, model: Type[BaseModel]):
+        super().__init__(f"{service}: response is not a valid {model.__name__}")
+        self.service = service
+
+
+def response_schema(model: Type[BaseModel]) -> dict:
+    """Gemini `response_schema` for a Pydantic model: refs inlined, Optional as `nullable`."""
+    schema = model.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}))
+
+
+def _convert(node: dict, defs: dict) -> dict:
+    if "$ref" in node:
+        # Model docstrings are for developers; only field descriptions are sent to the model
+        target = {k: v for k, v in defs[node["$ref"].rsplit("/", 1)[-1]].items() if k != "description"}
+        node = {**target, **{k: v for k, v in node.items() if k != "$ref"}}
+    nullable = False
+    if "anyOf" in node:
+        variants = [v for v in node["anyOf"] if v.get("type") != "null"]
+        if len(variants) != 1:
+            raise ValueError(f"Unsupported union in response schema: {node['anyOf']}")
+        nullable = len(variants) < len(node["anyOf"])
+        node = {**variants[0], **{k: v for k, v in node.items() if k != "anyOf"}}
+    if "type" not in node:
+        raise ValueError(f"Response schema node has no type: {node}")
+
+    out = {"type": node["type"].upper()}
+    out.update((key, node[key]) for key in _SCHEMA_KEYS if key in node)
+    if nullable:
+        out["nullable"] = True
+    if node["type"] == "array":
+        out["items"] = _convert(node["items"], defs)
+    if node["type"] == "object":
+        if "additionalProperties" in node:
+            raise ValueError("Free-form maps are not supported in response schemas; use a list of items")
+        out["properties"] = {name: _convert(prop, defs) for name, prop in node.get("properties", {}).items()}
+        if node.get("required"):
+            out["required"] = list(node["required"])
+    return out
+
+
+def structured_config(model: Type[BaseModel], base: dict = None) -> dict:
+    """Generation config that constrains the answer to JSON matching `model`."""
+    return {**(base or {}), "response_mime_type": "application/json", "response_schema": response_schema(model)}
+
+
+class JSONObjectScanner:
+    """
+    Single-pass, incremental scanner for top-level JSON objects embedded in
+    free text (prose, markdown fences). Tracks brace depth and string/escape
+    state, so braces inside strings don't confuse it the way a regex does.
+    """
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current = []
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        """Yields every object completed by `chunk`."""
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._current = [ch]
+                continue
+            self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    yield "".join(self._current)
+                    self._current = []
+
+
+def parse_structured(service: str, text: str, model: Type[T]) -> T:
+    """
+    Parses an LLM answer into `model`. Schema-constrained answers parse
+    directly; otherwise the first embedded JSON object that validates is
+    used. Outcomes are counted per service (schema / recovered / failed).
+    """
+    try:
+        result = model.model_validate_json(text)
+        LLM_STRUCTURED_OUTPUTS.inc(service, "schema")
+        return result
+    except ValueError:
+        pass
+    for candidate in JSONObjectScanner().feed(text):
+        try:
+            result = model.model_validate_json(candidate)
+        except ValueError:
+            continue
+        LLM_STRUCTURED_OUTPUTS.inc(service, "recovered")
+        return result
+    LLM_STRUCTURED_OUTPUTS.inc(service, "failed")
+    LLM_PARSE_FAILURES.inc(service)
+    raise StructuredOutputError(service, model)
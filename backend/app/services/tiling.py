@@ -0,0 +1,528 @@
+import heapq
+import io
+import math
+import mmap
+import shutil
+import struct
+import tempfile
+import traceback
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+DICOM, TIFF = "dicom", "tiff"
+
+# First bytes needed to recognise a scan (DICOM's "DICM" marker sits after a 128-byte preamble)
+SNIFF_BYTES = 132
+
+
+class UnsupportedScanError(ValueError):
+    """A DICOM or TIFF this reader can't access lazily (e.g. a compression scheme it doesn't decode)."""
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    if len(head) >= 132 and head[128:132] == b"DICM":
+        return DICOM
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return TIFF
+    return None
+
+
+class MappedFile:
+    """
+    Read-only memory map of an upload. Files already on disk (Starlette
+    spools uploads past 1 MB to a temporary file) are mapped in place;
+    anything else is first copied to a temporary file in chunks. Pixels are
+    read straight from the page cache, so nothing is held in process memory.
+    """
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = 1024 * 1024):
+        self._spool = None
+        fileobj.seek(0)
+        try:
+            fd = fileobj.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            self._spool = tempfile.TemporaryFile()
+            shutil.copyfileobj(fileobj, self._spool, chunk_size)
+            self._spool.flush()
+            fd = self._spool.fileno()
+        else:
+            # A SpooledTemporaryFile still in memory moves to disk on fileno(); make sure it is written out
+            fileobj.flush()
+        self.buffer = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def close(self):
+        self.buffer.close()
+        if self._spool is not None:
+            self._spool.close()
+
+
+@dataclass(frozen=True)
+class Tile:
+    frame: int
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class ScanSource(ABC):
+    """
+    Lazy pixel access to a large scan: `tiles(step)` lists regions on a grid
+    (every `step`-th tile in each direction), `read_tile` returns one as an
+    8-bit array, (H, W) grayscale or (H, W, 3) RGB. Only that tile is ever
+    materialized.
+    """
+    kind = ""
+    width = 0
+    height = 0
+    frames = 1
+    tile_size = 512
+
+    def grid(self) -> Tuple[int, int]:
+        return math.ceil(self.width / self.tile_size), math.ceil(self.height / self.tile_size)
+
+    def tile_count(self) -> int:
+        across, down = self.grid()
+        return across * down * self.frames
+
+    def tiles(self, step: int = 1) -> Iterator[Tile]:
+        across, down = self.grid()
+        frame_step = step if self.frames > 1 else 1
+        grid_step = 1 if self.frames > 1 else step
+        for frame in range(0, self.frames, frame_step):
+            for ty in range(0, down, grid_step):
+                for tx in range(0, across, grid_step):
+                    x, y = tx * self.tile_size, ty * self.tile_size
+                    yield Tile(frame, x, y, min(self.tile_size, self.width - x), min(self.tile_size, self.height - y))
+
+    @abstractmethod
+    def read_tile(self, tile: Tile) -> np.ndarray:
+        ...
+
+    def close(self):
+        pass
+
+
+# --- DICOM ---------------------------------------------------------------------------------
+
+IMPLICIT_LE, EXPLICIT_LE = "1.2.840.10008.1.2", "1.2.840.10008.1.2.1"
+_LONG_VRS = {b"OB", b"OW", b"OF", b"SQ", b"UT", b"UN", b"OD", b"OL", b"OV", b"UC", b"UR", b"SV", b"UV"}
+_UNDEFINED = 0xFFFFFFFF
+_ITEM, _ITEM_END, _SEQUENCE_END = (0xFFFE, 0xE000), (0xFFFE, 0xE00D), (0xFFFE, 0xE0DD)
+_PIXEL_DATA = (0x7FE0, 0x0010)
+_DICOM_TAGS = {
+    (0x0002, 0x0010): "transfer_syntax",
+    (0x0028, 0x0002): "samples",
+    (0x0028, 0x0004): "photometric",
+    (0x0028, 0x0006): "planar",
+    (0x0028, 0x0008): "frames",
+    (0x0028, 0x0010): "rows",
+    (0x0028, 0x0011): "columns",
+    (0x0028, 0x0100): "bits_allocated",
+    (0x0028, 0x0103): "pixel_representation",
+    (0x0028, 0x1050): "window_center",
+    (0x0028, 0x1051): "window_width",
+    (0x0028, 0x1052): "rescale_intercept",
+    (0x0028, 0x1053): "rescale_slope",
+}
+
+
+def _read_element(buf, pos: int, explicit: bool):
+    """(group, element, vr, length, value_offset) of the data element at `pos`."""
+    group, element = struct.unpack_from("<HH", buf, pos)
+    if (group, element) in (_ITEM, _ITEM_END, _SEQUENCE_END) or not explicit:
+        # Item markers carry no VR, even in explicit-VR data
+        (length,) = struct.unpack_from("<I", buf, pos + 4)
+        return group, element, None, length, pos + 8
+    vr = bytes(buf[pos + 4:pos + 6])
+    if vr in _LONG_VRS:
+        (length,) = struct.unpack_from("<I", buf, pos + 8)
+        return group, element, vr, length, pos + 12
+    (length,) = struct.unpack_from("<H", buf, pos + 6)
+    return group, element, vr, length, pos + 8
+
+
+# Real files nest a handful of sequences deep; anything past this is malformed or hostile
+_MAX_SEQUENCE_DEPTH = 64
+
+
+def _skip_undefined(buf, pos: int, explicit: bool) -> int:
+    """Skips an undefined-length sequence (or item) starting at `pos`; returns the offset after its delimiter."""
+    depth = 1
+    while pos < len(buf):
+        group, element, _, length, value = _read_element(buf, pos, explicit)
+        if (group, element) in (_SEQUENCE_END, _ITEM_END):
+            depth -= 1
+            if not depth:
+                return value
+            pos = value
+        elif length == _UNDEFINED:
+            depth += 1
+            if depth > _MAX_SEQUENCE_DEPTH:
+                raise UnsupportedScanError(f"DICOM sequences nested more than {_MAX_SEQUENCE_DEPTH} deep")
+            pos = value
+        else:
+            pos = value + length
+    raise UnsupportedScanError("Truncated DICOM sequence")
+
+
+_US_VALUES = {"samples", "planar", "rows", "columns", "bits_allocated", "pixel_representation"}
+
+
+def _value(raw: bytes, name: str):
+    if name in _US_VALUES:
+        return struct.unpack("<H", raw[:2])[0]
+    text = raw.decode("ascii", "replace").strip("\x00 ")
+    if name in ("photometric", "transfer_syntax"):
+        return text
+    # DS / IS values may be multi-valued ("40\\400"); the first one applies
+    return float(text.split("\\")[0]) if text else None
+
+
+class DicomSource(ScanSource):
+    """
+    Uncompressed (implicit or explicit VR little endian) single- or
+    multi-frame DICOM. Frames are numpy views on the memory map; each is
+    windowed to 8 bits only when read.
+    """
+    kind = DICOM
+
+    def __init__(self, buf, tile_size: int = 512):
+        self.tile_size = tile_size
+        info = self._parse(buf)
+        if info.get("transfer_syntax", IMPLICIT_LE) not in (IMPLICIT_LE, EXPLICIT_LE):
+            raise UnsupportedScanError(f"Compressed DICOM (transfer syntax {info['transfer_syntax']}) is not supported")
+        if "pixel_offset" not in info or "rows" not in info or "columns" not in info:
+            raise UnsupportedScanError("DICOM file has no pixel data")
+
+        self.height, self.width = int(info["rows"]), int(info["columns"])
+        self.frames = int(info.get("frames") or 1)
+        self.samples = int(info.get("samples") or 1)
+        bits = int(info.get("bits_allocated") or 16)
+        if bits not in (8, 16, 32) or self.samples not in (1, 3):
+            raise UnsupportedScanError(f"Unsupported DICOM pixel layout ({bits} bits, {self.samples} samples)")
+        signed = bool(info.get("pixel_representation"))
+        dtype = np.dtype(f"<{'i' if signed else 'u'}{bits // 8}")
+        count = self.frames * self.height * self.width * self.samples
+        if info["pixel_offset"] + count * dtype.itemsize > len(buf):
+            raise UnsupportedScanError("DICOM pixel data is shorter than its header declares")
+
+        pixels = np.frombuffer(buf, dtype=dtype, count=count, offset=info["pixel_offset"])
+        if self.samples == 1:
+            self._pixels = pixels.reshape(self.frames, self.height, self.width)
+        elif info.get("planar"):
+            self._pixels = pixels.reshape(self.frames, 3, self.height, self.width).transpose(0, 2, 3, 1)
+        else:
+            self._pixels = pixels.reshape(self.frames, self.height, self.width, 3)
+        self._invert = info.get("photometric") == "MONOCHROME1"
+        self._window = self._window_for(info)
+
+    @staticmethod
+    def _parse(buf) -> Dict[str, object]:
+        info: Dict[str, object] = {}
+        pos, explicit, in_meta = 132, True, True  # The file meta group is always explicit VR little endian
+        while pos + 8 <= len(buf):
+            if in_meta and struct.unpack_from("<H", buf, pos)[0] != 0x0002:
+                in_meta = False
+                explicit = info.get("transfer_syntax", EXPLICIT_LE) != IMPLICIT_LE
+            group, element, vr, length, value = _read_element(buf, pos, explicit)
+            if (group, element) == _PIXEL_DATA:
+                if length == _UNDEFINED:
+                    raise UnsupportedScanError("Encapsulated (compressed) DICOM pixel data is not supported")
+                info["pixel_offset"] = value
+                break
+            if length == _UNDEFINED:
+                pos = _skip_undefined(buf, value, explicit)
+                continue
+            name = _DICOM_TAGS.get((group, element))
+            if name is not None:
+                info[name] = _value(bytes(buf[value:value + length]), name)
+            pos = value + length
+        return info
+
+    def _window_for(self, info: dict) -> Tuple[float, float]:
+        slope = info.get("rescale_slope") or 1.0
+        intercept = info.get("rescale_intercept") or 0.0
+        self._rescale = (float(slope), float(intercept))
+        if self.samples == 1 and info.get("window_center") is not None and info.get("window_width"):
+            center, width = float(info["window_center"]), float(info["window_width"])
+            return center - width / 2, center + width / 2
+        # No stored window: 1st-99th percentile of a sparse sample across the series
+        frames = self._pixels[::max(1, self.frames // 16)]
+        sample = frames[:, ::8, ::8].astype(np.float32) * self._rescale[0] + self._rescale[1]
+        low, high = np.percentile(sample, (1, 99))
+        return float(low), float(high) if high > low else float(low) + 1.0
+
+    def read_tile(self, tile: Tile) -> np.ndarray:
+        raw = self._pixels[tile.frame, tile.y:tile.y + tile.height, tile.x:tile.x + tile.width]
+        if self.samples == 3:
+            # Always a copy: a view would pin the memory map open
+            return np.array(raw, dtype=np.uint8) if raw.dtype == np.uint8 else _scale_to_8bit(raw)
+        low, high = self._window
+        values = raw.astype(np.float32) * self._rescale[0] + self._rescale[1]
+        values = np.clip((values - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+        return 255 - values if self._invert else values
+
+    def close(self):
+        # Views must go before the memory map can be closed
+        self._pixels = None
+
+
+def _scale_to_8bit(raw: np.ndarray) -> np.ndarray:
+    values = raw.astype(np.float32)
+    low, high = float(values.min()), float(values.max())
+    return ((values - low) * (255.0 / (high - low)) if high > low else np.zeros_like(values)).astype(np.uint8)
+
+
+# --- TIFF ----------------------------------------------------------------------------------
+
+_TIFF_TYPES = {1: "B", 2: "B", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i", 16: "Q", 17: "q"}
+_TIFF_TAGS = {
+    256: "width", 257: "height", 258: "bits", 259: "compression", 262: "photometric",
+    273: "strip_offsets", 277: "samples", 278: "rows_per_strip", 279: "strip_counts",
+    284: "planar", 317: "predictor", 322: "tile_width", 323: "tile_height",
+    324: "tile_offsets", 325: "tile_counts", 339: "sample_format",
+}
+_ARRAY_TAGS = {"strip_offsets", "strip_counts", "tile_offsets", "tile_counts", "bits"}
+NO_COMPRESSION, DEFLATE = (1,), (8, 32946)
+
+
+class TiffSource(ScanSource):
+    """
+    First (full-resolution) image of a classic or BigTIFF file, tiled or
+    striped. Tiles are read one at a time from the memory map: uncompressed
+    data as a zero-copy view, Deflate tiles decompressed individually. Other
+    compression schemes raise UnsupportedScanError.
+    """
+    kind = TIFF
+
+    def __init__(self, buf, tile_size: int = 512):
+        self._buf = buf
+        self._order = "<" if buf[:2] == b"II" else ">"
+        tags = self._read_ifd()
+        self.width, self.height = int(tags["width"]), int(tags["height"])
+        self.samples = int(tags.get("samples", 1))
+        self.bits = int(tags["bits"][0]) if "bits" in tags else 1
+        self.compression = int(tags.get("compression", 1))
+        self.predictor = int(tags.get("predictor", 1))
+        if self.bits not in (8, 16) or self.samples not in (1, 3, 4) or int(tags.get("planar", 1)) != 1:
+            raise UnsupportedScanError(f"Unsupported TIFF pixel layout ({self.bits} bits, {self.samples} samples)")
+        if self.compression not in NO_COMPRESSION + DEFLATE:
+            raise UnsupportedScanError(f"TIFF compression {self.compression} is not supported for tiled reading")
+        self._dtype = np.dtype(f"{self._order}u{self.bits // 8}")
+        self._invert = tags.get("photometric") == 0  # WhiteIsZero
+
+        if "tile_offsets" in tags:
+            self._tile_w, self._tile_h = int(tags["tile_width"]), int(tags["tile_height"])
+            self._offsets, self._counts = tags["tile_offsets"], tags["tile_counts"]
+            self.tile_size = self._tile_w if self._tile_w == self._tile_h else tile_size
+            self._tiled = True
+        else:
+            if self.compression != NO_COMPRESSION[0]:
+                raise UnsupportedScanError("Compressed striped TIFF can't be read tile by tile")
+            self._rows_per_strip = min(int(tags.get("rows_per_strip", self.height)), self.height)
+            self._offsets = tags["strip_offsets"]
+            self.tile_size = tile_size
+            self._tiled = False
+
+    def _unpack(self, fmt: str, offset: int):
+        return struct.unpack_from(self._order + fmt, self._buf, offset)
+
+    def _read_ifd(self) -> dict:
+        (magic,) = self._unpack("H", 2)
+        big = magic == 43
+        (ifd,) = self._unpack("Q", 8) if big else self._unpack("I", 4)
+        (entries,) = self._unpack("Q", ifd) if big else self._unpack("H", ifd)
+        entry_size, inline = (20, 8) if big else (12, 4)
+        pos = ifd + (8 if big else 2)
+        tags = {}
+        for _ in range(entries):
+            tag, kind = self._unpack("HH", pos)
+            (count,) = self._unpack("Q", pos + 4) if big else self._unpack("I", pos + 4)
+            name = _TIFF_TAGS.get(tag)
+            if name is not None and kind in _TIFF_TYPES:
+                dtype = np.dtype(self._order + _TIFF_TYPES[kind])
+                value_pos = pos + (12 if big else 8)
+                if count * dtype.itemsize > inline:
+                    (value_pos,) = self._unpack("Q", value_pos) if big else self._unpack("I", value_pos)
+                # Offset tables of huge slides stay views on the map
+                values = np.frombuffer(self._buf, dtype=dtype, count=count, offset=value_pos)
+                tags[name] = values if name in _ARRAY_TAGS else int(values[0])
+            pos += entry_size
+        return tags
+
+    def _pixels(self, data, height: int, width: int) -> np.ndarray:
+        pixels = np.frombuffer(data, dtype=self._dtype, count=height * width * self.samples)
+        return pixels.reshape(height, width, self.samples)
+
+    def _decode_tile(self, index: int) -> np.ndarray:
+        offset, count = int(self._offsets[index]), int(self._counts[index])
+        if self.compression in DEFLATE:
+            data = zlib.decompress(self._buf[offset:offset + count])
+        else:
+            data = memoryview(self._buf)[offset:offset + count]
+        pixels = self._pixels(data, self._tile_h, self._tile_w)
+        if self.predictor == 2:
+            # Horizontal differencing: undo with a wrapping cumulative sum along each row
+            pixels = np.cumsum(pixels, axis=1, dtype=pixels.dtype)
+        return pixels
+
+    def _read_region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        if self._tiled:
+            out = np.empty((height, width, self.samples), dtype=self._dtype)
+            across = math.ceil(self.width / self._tile_w)
+            for ty in range(y // self._tile_h, (y + height - 1) // self._tile_h + 1):
+                for tx in range(x // self._tile_w, (x + width - 1) // self._tile_w + 1):
+                    tile = self._decode_tile(ty * across + tx)
+                    x0, y0 = max(x, tx * self._tile_w), max(y, ty * self._tile_h)
+                    x1 = min(x + width, (tx + 1) * self._tile_w)
+                    y1 = min(y + height, (ty + 1) * self._tile_h)
+                    out[y0 - y:y1 - y, x0 - x:x1 - x] = tile[y0 - ty * self._tile_h:y1 - ty * self._tile_h,
+                                                             x0 - tx * self._tile_w:x1 - tx * self._tile_w]
+            return out
+        # Uncompressed strips: each row sits at a fixed offset, so slice rows straight off the map
+        row_bytes = self.width * self.samples * self._dtype.itemsize
+        rows = []
+        for row in range(y, y + height):
+            strip, within = divmod(row, self._rows_per_strip)
+            start = int(self._offsets[strip]) + within * row_bytes
+            rows.append(self._pixels(memoryview(self._buf)[start:start + row_bytes], 1, self.width)[0, x:x + width])
+        return np.stack(rows)
+
+    def read_tile(self, tile: Tile) -> np.ndarray:
+        pixels = self._read_region(tile.x, tile.y, tile.width, tile.height)
+        if self.bits == 16:
+            pixels = _scale_to_8bit(pixels)
+        pixels = pixels[..., 0] if self.samples == 1 else pixels[..., :3]
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        return 255 - pixels if self._invert else pixels
+
+    def close(self):
+        self._offsets = self._counts = None
+
+
+def open_scan(buf, kind: str, tile_size: int = 512) -> ScanSource:
+    try:
+        return DicomSource(buf, tile_size) if kind == DICOM else TiffSource(buf, tile_size)
+    except (struct.error, KeyError, IndexError, ValueError, TypeError) as e:
+        # The failed constructor's locals hold views on the map, which would keep it from closing
+        traceback.clear_frames(e.__traceback__)
+        if isinstance(e, UnsupportedScanError):
+            raise
+        raise UnsupportedScanError(f"Could not read {kind.upper()} header: {e}") from e
+
+
+# --- Region selection ------------------------------------------------------------------------
+
+def tissue_score(pixels: np.ndarray, min_fraction: float = 0.05) -> float:
+    """
+    How informative a tile looks, from a sparse pixel sample: the fraction
+    that is neither background (near-white glass on slides, air in CT/MRI)
+    nor saturated, weighted by the contrast within it. 0 for blank tiles.
+    """
+    sample = pixels[::4, ::4].astype(np.float32)
+    if sample.ndim == 3:
+        gray = sample.mean(axis=2)
+        # H&E tissue is stained; background glass is bright and unsaturated
+        foreground = (gray < 220) & ((sample.max(axis=2) - sample.min(axis=2)) > 12)
+    else:
+        gray = sample
+        foreground = (gray > 12) & (gray < 243)
+    fraction = float(foreground.mean()) if foreground.size else 0.0
+    if fraction < min_fraction:
+        return 0.0
+    contrast = min(float(gray[foreground].std()) / 48.0, 1.0)
+    return round(fraction * (0.5 + 0.5 * contrast), 4)
+
+
+@dataclass
+class ScanSelection:
+    source: str
+    size: Tuple[int, int]
+    frames: int
+    tiles_total: int
+    tiles_scored: int
+    overview: Optional[np.ndarray]
+    regions: List[Tuple[Tile, float, np.ndarray]]
+
+
+def _apart(a: Tile, b: Tile, tile_size: int, frame_gap: int) -> bool:
+    if a.frame != b.frame:
+        return abs(a.frame - b.frame) >= frame_gap
+    return abs(a.x - b.x) > tile_size or abs(a.y - b.y) > tile_size
+
+
+def select_regions(source: ScanSource, count: int = 4, max_scored: int = 4096, overview_side: int = 1024,
+                   min_fraction: float = 0.05) -> ScanSelection:
+    """
+    One pass over (at most `max_scored`, evenly spread) tiles: scores each,
+    keeps the best candidates in a bounded heap and paints a downscaled
+    overview. Then picks up to `count` high-scoring regions that aren't
+    neighbours (adjacent tiles, or frames closer than a slab apart), so the
+    set covers different parts of the scan. Memory use depends on the tile
+    size, `count` and `overview_side`, never on the file size.
+    """
+    total = source.tile_count()
+    step = 1
+    if total > max_scored:
+        step = math.ceil(total / max_scored) if source.frames > 1 else math.ceil(math.sqrt(total / max_scored))
+
+    overview, scale = None, 1.0
+    if source.frames == 1:
+        scale = min(1.0, overview_side / max(source.width, source.height))
+        overview = np.full((max(1, round(source.height * scale)), max(1, round(source.width * scale)), 3), 255, np.uint8)
+
+    candidates: List[Tuple[float, int, Tile]] = []
+    scored = 0
+    for tile in source.tiles(step):
+        pixels = source.read_tile(tile)
+        score = tissue_score(pixels, min_fraction)
+        scored += 1
+        if overview is not None:
+            _paint(overview, pixels, tile, scale, step, source)
+        entry = (score, -scored, tile)
+        if len(candidates) < count * 4:
+            heapq.heappush(candidates, entry)
+        elif entry > candidates[0]:
+            heapq.heapreplace(candidates, entry)
+
+    frame_gap = max(1, source.frames // (count * 2))
+    chosen: List[Tuple[Tile, float]] = []
+    ranked = sorted(candidates, reverse=True)
+    for score, _, tile in ranked:
+        if len(chosen) < count and score > 0 and all(_apart(tile, t, source.tile_size, frame_gap) for t, _ in chosen):
+            chosen.append((tile, score))
+    # A small or uniform scan may not have enough separate regions; fill up with the next best
+    for score, _, tile in ranked:
+        if len(chosen) < count and score > 0 and all(tile != t for t, _ in chosen):
+            chosen.append((tile, score))
+    if not chosen and ranked:
+        chosen.append((ranked[0][2], ranked[0][0]))
+
+    return ScanSelection(
+        source=source.kind,
+        size=(source.width, source.height),
+        frames=source.frames,
+        tiles_total=total,
+        tiles_scored=scored,
+        overview=overview,
+        regions=[(tile, score, source.read_tile(tile)) for tile, score in chosen],
+    )
+
+
+def _paint(overview: np.ndarray, pixels: np.ndarray, tile: Tile, scale: float, step: int, source: ScanSource):
+    # With a sparse grid each scored tile stands in for the step x step block it starts
+    x0, y0 = round(tile.x * scale), round(tile.y * scale)
+    x1 = min(overview.shape[1], round(min(source.width, tile.x + source.tile_size * step) * scale))
+    y1 = min(overview.shape[0], round(min(source.height, tile.y + source.tile_size * step) * scale))
+    if x1 <= x0 or y1 <= y0:
+        return
+    image = Image.fromarray(pixels).convert("RGB").resize((x1 - x0, y1 - y0), Image.Resampling.BILINEAR)
+    overview[y0:y1, x0:x1] = np.asarray(image)
@@ -0,0 +1,87 @@
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import LLM_BUDGET_ACTIONS, LLM_INPUT_TOKENS
+
+# Local estimate, no API round trip: Gemini averages about 4 characters per token
+# for English text, and bills every image at a flat 258 tokens.
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+
+TRUNCATION_MARKER = "\n[... input truncated ...]"
+POLICIES = ("trim", "reject")
+
+
+class PromptTooLargeError(ValueError):
+    """Raised instead of sending a user input over the token budget (policy "reject")."""
+    def __init__(self, service: str, tokens: int, limit: int):
+        super().__init__(f"Input is about {tokens} tokens; the limit for {service} is {limit}")
+        self.tokens = tokens
+        self.limit = limit
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def estimate_parts(content_parts: list) -> int:
+    return sum(estimate_tokens(p) if isinstance(p, str) else IMAGE_TOKENS for p in content_parts)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    limit = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    if limit <= 0:
+        return ""
+    cut = text[:limit]
+    # Prefer a word boundary, unless that would throw away most of the allowance
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut + TRUNCATION_MARKER
+
+
+class TokenBudget:
+    """
+    Caps the user-supplied text sent with one LLM call at `max_tokens`
+    (0 disables the cap). Over the cap, policy "trim" keeps the beginning of
+    the input and marks the cut; "reject" raises PromptTooLargeError.
+    """
+    def __init__(self, service: str, max_tokens: Optional[int] = None, policy: Optional[str] = None):
+        self.service = service
+        self.max_tokens = settings.llm_max_input_tokens if max_tokens is None else max_tokens
+        policy = policy or settings.llm_budget_policy
+        if policy not in POLICIES:
+            print(f"Unknown token budget policy '{policy}', falling back to trim")
+            policy = "trim"
+        self.policy = policy
+
+    def fit_text(self, text: str) -> str:
+        return self.fit_items([text])[0] if text else text
+
+    def fit_items(self, items: List[str]) -> List[str]:
+        """
+        Fits a list of texts (e.g. symptoms) into the budget as a whole:
+        items are kept in order until the budget runs out; the item that
+        crosses it is truncated and the rest are dropped.
+        """
+        tokens = sum(estimate_tokens(item) for item in items)
+        LLM_INPUT_TOKENS.observe(tokens, self.service)
+        if not self.max_tokens or tokens <= self.max_tokens:
+            return list(items)
+        if self.policy == "reject":
+            LLM_BUDGET_ACTIONS.inc(self.service, "rejected")
+            raise PromptTooLargeError(self.service, tokens, self.max_tokens)
+
+        LLM_BUDGET_ACTIONS.inc(self.service, "trimmed")
+        kept, remaining = [], self.max_tokens
+        for item in items:
+            cost = estimate_tokens(item)
+            if cost <= remaining:
+                kept.append(item)
+                remaining -= cost
+                continue
+            truncated = _truncate(item, remaining)
+            if truncated:
+                kept.append(truncated)
+            break
+        return kept
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import TRIAGE_PATH
+from app.models.schemas import LLMInput, LLMOutput
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data")
+
+TRIAGE_LEVELS = ("Low", "Moderate", "High", "Critical")
+
+# Condition name -> check against an LLMInput
+CONDITIONS = {
+    "min_cri": lambda data, v: data.preliminary_cri >= v,
+    "max_cri": lambda data, v: data.preliminary_cri <= v,
+    "min_ml_confidence": lambda data, v: data.ml_confidence >= v,
+    "max_ml_confidence": lambda data, v: data.ml_confidence <= v,
+    "min_symptoms": lambda data, v: len(data.symptoms) >= v,
+    "max_symptoms": lambda data, v: len(data.symptoms) <= v,
+    "min_age": lambda data, v: data.age >= v,
+    "max_age": lambda data, v: data.age <= v,
+}
+
+
+class TriageRule:
+    """
+    One high-confidence band: when every condition in `when` holds, the case
+    gets this rule's triage level, risk adjustment and wording. Explanation
+    and recommendation may use LLMInput fields, e.g. "{preliminary_cri}".
+    """
+    def __init__(self, name: str, when: dict, triage_level: str, risk_adjustment: int,
+                 explanation: str, recommendation: str):
+        unknown = set(when) - set(CONDITIONS)
+        if unknown:
+            raise ValueError(f"Rule '{name}': unknown conditions {sorted(unknown)}")
+        if not when:
+            raise ValueError(f"Rule '{name}' has no conditions")
+        if triage_level not in TRIAGE_LEVELS:
+            raise ValueError(f"Rule '{name}': triage_level must be one of {TRIAGE_LEVELS}")
+        if not -10 <= risk_adjustment <= 10:
+            raise ValueError(f"Rule '{name}': risk_adjustment must be between -10 and 10")
+        self.name = name
+        self.when = dict(when)
+        self.triage_level = triage_level
+        self.risk_adjustment = risk_adjustment
+        self.explanation = explanation
+        self.recommendation = recommendation
+
+    def matches(self, data: LLMInput) -> bool:
+        return all(CONDITIONS[condition](data, value) for condition, value in self.when.items())
+
+    def apply(self, data: LLMInput) -> LLMOutput:
+        fields = data.model_dump()
+        return LLMOutput(
+            triage_level=self.triage_level,
+            risk_adjustment=self.risk_adjustment,
+            explanation=self.explanation.format(**fields),
+            recommendation=self.recommendation.format(**fields)
+        )
+
+
+def load_rules(path: Optional[str] = None) -> List[TriageRule]:
+    if path is None:
+        path = os.path.join(DATA_DIR, "triage_rules.json")
+    with open(path, "r") as f:
+        return [TriageRule(**rule) for rule in json.load(f)["rules"]]
+
+
+class TriageRuleEngine:
+    """
+    Deterministic fast path between the risk and cognitive stages. The first
+    rule matching a case decides its triage without an LLM call; cases no
+    rule covers (the borderline ones) go to the cognitive service.
+    """
+    def __init__(self, rules: List[TriageRule], enabled: bool = True):
+        self.rules = rules
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.fast_path = {rule.name: 0 for rule in rules}
+        self.escalated = 0
+
+    def match(self, data: LLMInput) -> Optional[TriageRule]:
+        return next((rule for rule in self.rules if rule.matches(data)), None)
+
+    def decide(self, data: LLMInput) -> Optional[LLMOutput]:
+        """Returns the rule-based triage, or None when the LLM should decide."""
+        if not self.enabled:
+            return None
+
+        rule = self.match(data)
+        with self._lock:
+            if rule is None:
+                self.escalated += 1
+            else:
+                self.fast_path[rule.name] = self.fast_path.get(rule.name, 0) + 1
+        TRIAGE_PATH.inc("llm" if rule is None else "fast", "none" if rule is None else rule.name)
+        return None if rule is None else rule.apply(data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_rule = dict(self.fast_path)
+            escalated = self.escalated
+        fast = sum(by_rule.values())
+        total = fast + escalated
+        return {
+            "enabled": self.enabled,
+            "fast_path": fast,
+            "escalated": escalated,
+            "fast_path_ratio": round(fast / total, 4) if total else 0.0,
+            "by_rule": by_rule,
+        }
+
+
+_record_lock = threading.Lock()
+
+
+def record_case(path: str, data: LLMInput, output: LLMOutput):
+    """Appends an LLM-answered case to a JSONL file, for offline evaluation of the rules."""
+    line = json.dumps({"input": data.model_dump(), "llm": output.model_dump()})
+    with _record_lock, open(path, "a") as f:
+        f.write(line + "\n")
+
+
+def load_recorded_cases(path: Optional[str] = None) -> List[Tuple[LLMInput, LLMOutput]]:
+    if path is None:
+        path = os.path.join(DATA_DIR, "triage_eval.jsonl")
+    cases = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                cases.append((LLMInput(**row["input"]), LLMOutput(**row["llm"])))
+    return cases
+
+
+def evaluate(engine: TriageRuleEngine, cases: Iterable[Tuple[LLMInput, LLMOutput]]) -> dict:
+    """
+    Agreement between the fast path and the LLM on recorded cases. Only the
+    cases a rule decides are scored; the rest would reach the LLM anyway.
+    Under-triage (the rule picked a lower level than the LLM) is the costly
+    mistake and is reported separately.
+    """
+    total = decided = agreed = under = over = 0
+    by_rule = {}
+    for data, llm in cases:
+        total += 1
+        rule = engine.match(data) if engine.enabled else None
+        if rule is None:
+            continue
+        decided += 1
+        row = by_rule.setdefault(rule.name, {"cases": 0, "agreed": 0, "under_triage": 0, "over_triage": 0})
+        row["cases"] += 1
+        delta = TRIAGE_LEVELS.index(rule.triage_level) - _level_index(llm.triage_level)
+        if delta == 0:
+            agreed += 1
+            row["agreed"] += 1
+        elif delta < 0:
+            under += 1
+            row["under_triage"] += 1
+        else:
+            over += 1
+            row["over_triage"] += 1
+    return {
+        "cases": total,
+        "fast_path": decided,
+        "coverage": round(decided / total, 4) if total else 0.0,
+        "agreement": round(agreed / decided, 4) if decided else 0.0,
+        "under_triage": under,
+        "over_triage": over,
+        "by_rule": by_rule,
+    }
+
+
+def _level_index(level: str) -> int:
+    # The LLM occasionally varies casing; unknown levels count as the most severe
+    normalized = level.strip().capitalize()
+    return TRIAGE_LEVELS.index(normalized) if normalized in TRIAGE_LEVELS else len(TRIAGE_LEVELS) - 1
+
+
+triage_rules = TriageRuleEngine(
+    load_rules(settings.triage_rules_path),
+    enabled=settings.triage_fast_path_enabled
+)
@@ -0,0 +1,196 @@
+"""
+End-to-end latency of /api/v1/analyze and /api/v1/ai-analyze against the
+local Gemini stand-in (tools/gemini_stub.py), at several concurrency levels.
+
+The stand-in is started on a free local port and the API runs in-process, so
+runs are reproducible on any machine without an API key. Reports p50/p95/p99
+latency and requests/s per endpoint and concurrency, writes them to a JSON
+file, and optionally prints the change against an earlier run.
+
+Usage (from backend/):
+    python benchmarks/bench_api.py [--requests 200] [--concurrency 1,8,32,64]
+                                   [--latency lognormal:300:0.3] [--error-rate 0]
+                                   [--out benchmarks/results/api.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+from tools.gemini_stub import StubConfig, create_app  # noqa: E402
+
+ENDPOINTS = ("analyze", "ai-analyze")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(config: StubConfig) -> str:
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="gemini-stub", daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Gemini stand-in did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def make_scan(size: int = 256) -> bytes:
+    import io
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    pixels = np.clip(120 + rng.normal(0, 30, (size, size)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def request_for(endpoint: str, scan: bytes) -> dict:
+    files = {"file": ("scan.png", scan, "image/png")}
+    if endpoint == "analyze":
+        params = {
+            "cancer_type": "lung",
+            "age": 61,
+            "symptoms": json.dumps(["persistent cough", "weight loss"]),
+            "risk_factors": json.dumps(["smoking"]),
+        }
+        return {"url": "/api/v1/analyze", "params": params, "files": files}
+    # Image input, so the local text pre-classifier never short-circuits the LLM calls
+    return {"url": "/api/v1/ai-analyze", "files": files}
+
+
+def summarize(latencies_s, errors: int, elapsed_s: float) -> dict:
+    ms = np.asarray(latencies_s) * 1000.0
+    return {
+        "requests": len(latencies_s) + errors,
+        "errors": errors,
+        "rps": round(len(latencies_s) / elapsed_s, 2),
+        "mean_ms": round(float(ms.mean()), 2) if len(ms) else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+    }
+
+
+async def run_level(client, endpoint: str, scan: bytes, concurrency: int, total: int) -> dict:
+    remaining = total
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.post(**request_for(endpoint, scan))
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_suite(levels, total: int, warmup: int) -> dict:
+    import httpx
+    from main import app, lifespan
+
+    scan = make_scan()
+    results = {}
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for endpoint in ENDPOINTS:
+                await run_level(client, endpoint, scan, concurrency=min(levels), total=warmup)
+                results[endpoint] = {}
+                for concurrency in levels:
+                    stats = await run_level(client, endpoint, scan, concurrency, total)
+                    results[endpoint][str(concurrency)] = stats
+                    print(f"{endpoint:<11} c={concurrency:<4} {stats['rps']:8.1f} req/s  "
+                          f"p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+                          f"p99 {stats['p99_ms']:8.1f} ms  errors {stats['errors']}")
+    return results
+
+
+def compare(current: dict, previous: dict):
+    print(f"\nchange vs {previous.get('created_at', 'previous run')}:")
+    for endpoint, levels in current["results"].items():
+        for concurrency, stats in levels.items():
+            before = previous.get("results", {}).get(endpoint, {}).get(concurrency)
+            if not before:
+                continue
+            deltas = []
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before.get(key):
+                    deltas.append(f"{key} {100.0 * (stats[key] - before[key]) / before[key]:+6.1f}%")
+            print(f"{endpoint:<11} c={concurrency:<4} " + "  ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=16)
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--latency", default="lognormal:300:0.3", help="Stand-in latency spec in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(BACKEND_DIR, "benchmarks", "results", "api.json"))
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    stub_config = StubConfig(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    os.environ["GEMINI_STUB_URL"] = start_stub(stub_config)
+    # Measure the pipeline, not the result cache or coalescing of the identical benchmark requests
+    os.environ.setdefault("COGNITIVE_CACHE_SIZE", "0")
+    os.environ.setdefault("AI_ANALYSIS_COALESCING", "false")
+    # All benchmark traffic comes from one client
+    os.environ.setdefault("CLIENT_RATE_PER_S", "0")
+
+    results = asyncio.run(run_suite(levels, args.requests, args.warmup))
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": levels,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(report, json.load(f))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Hospital lookup on a synthetic 100k-site registry: index build / hot-reload
+time and per-query latency of the KD-tree index vs a linear scan.
+
+Usage (from backend/):
+    python benchmarks/bench_hospital.py [--hospitals 100000] [--queries 2000]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.hospital import AVAILABILITY_WEIGHTS, EARTH_RADIUS_KM, HospitalService  # noqa: E402
+
+SPECIALTIES = ["brain", "lung", "breast", "colon", "skin", "blood", "general"]
+
+
+def synthetic_registry(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"Site {i}",
+            "location": "Synthetic",
+            # Roughly the continental US
+            "latitude": rng.uniform(25, 49),
+            "longitude": rng.uniform(-124, -67),
+            "specialties": rng.sample(SPECIALTIES, rng.randint(1, 3)),
+            "availability": rng.choice(list(AVAILABILITY_WEIGHTS)),
+            "distance_km": rng.randint(1, 500),
+        }
+        for i in range(n)
+    ]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def linear_scan(hospitals, cancer_type, lat, lon):
+    candidates = [h for h in hospitals if cancer_type in h["specialties"] or "general" in h["specialties"]]
+    return min(candidates, key=lambda h: haversine_km(lat, lon, h["latitude"], h["longitude"]) * AVAILABILITY_WEIGHTS[h["availability"]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hospitals", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    registry = synthetic_registry(args.hospitals)
+    rng = random.Random(1)
+    queries = [(rng.choice(SPECIALTIES[:-1]), rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hospitals.json")
+        with open(path, "w") as f:
+            json.dump(registry, f)
+
+        start = time.perf_counter()
+        service = HospitalService(data_path=path)
+        print(f"hospitals={args.hospitals} initial load+index: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        for cancer_type, lat, lon in queries:
+            service.recommend(cancer_type, latitude=lat, longitude=lon)
+        indexed = (time.perf_counter() - start) / len(queries)
+        print(f"indexed recommend():   {indexed * 1e6:10.1f} us/query")
+
+        start = time.perf_counter()
+        for cancer_type, _, _ in queries:
+            service.recommend(cancer_type)
+        print(f"static recommend():    {(time.perf_counter() - start) / len(queries) * 1e6:10.1f} us/query")
+
+        sample = queries[:max(1, args.queries // 20)]
+        start = time.perf_counter()
+        for cancer_type, lat, lon in sample:
+            linear_scan(registry, cancer_type, lat, lon)
+        linear = (time.perf_counter() - start) / len(sample)
+        print(f"linear scan:           {linear * 1e6:10.1f} us/query  ({linear / indexed:.0f}x slower)")
+
+        registry[0]["name"] = "Renamed Site"
+        with open(path, "w") as f:
+            json.dump(registry, f)
+        os.utime(path, ns=(1, 1))
+        start = time.perf_counter()
+        service.reload_if_changed()
+        print(f"hot reload (off request path): {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
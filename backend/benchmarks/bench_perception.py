@@ -0,0 +1,90 @@
+"""
+CPU perception throughput: batch-1 vs micro-batched inference.
+
+Usage (from backend/):
+    python benchmarks/bench_perception.py [--images 512] [--backend numpy|onnx]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.config import settings  # noqa: E402
+from app.services.perception import PerceptionService  # noqa: E402
+
+
+def synthetic_scans(count: int, size: int = 256):
+    rng = np.random.default_rng(0)
+    scans = []
+    for i in range(count):
+        pixels = np.clip(120 + rng.normal(0, (i % 8) * 10, (size, size)), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG")
+        scans.append(buffer.getvalue())
+    return scans
+
+
+def bench_batch_1(service, scans):
+    start = time.perf_counter()
+    for scan in scans:
+        service.predict(scan, "lung")
+    return len(scans) / (time.perf_counter() - start)
+
+
+def bench_forward_only(service, scans, batch_size):
+    from app.services.inference import preprocess
+    model = service.models["lung"]
+    arrays = np.stack([preprocess(s) for s in scans])
+    start = time.perf_counter()
+    for i in range(0, len(arrays), batch_size):
+        model.run(arrays[i:i + batch_size])
+    return len(arrays) / (time.perf_counter() - start)
+
+
+def bench_micro_batched(service, scans, concurrency):
+    async def run():
+        queue = list(scans)
+
+        async def client():
+            while queue:
+                await service.predict_async(queue.pop(), "lung")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return len(scans) / (time.perf_counter() - start)
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=512)
+    parser.add_argument("--backend", default=settings.perception_backend)
+    args = parser.parse_args()
+
+    service = PerceptionService(backend=args.backend)
+    service.load()
+    scans = synthetic_scans(args.images)
+
+    print(f"backend={args.backend} images={args.images} max_batch={settings.perception_max_batch} "
+          f"max_wait_ms={settings.perception_max_wait_ms} workers={settings.perception_workers}")
+    print(f"forward only, batch=1           {bench_forward_only(service, scans, 1):10.1f} img/s")
+    print(f"forward only, batch={settings.perception_max_batch:<3}         {bench_forward_only(service, scans, settings.perception_max_batch):10.1f} img/s")
+    print(f"end-to-end predict(), batch=1    {bench_batch_1(service, scans):10.1f} img/s")
+    for concurrency in (1, 8, 32, 64):
+        before = service.stats().get("lung", {"batches": 0, "items": 0})
+        rate = bench_micro_batched(service, scans, concurrency)
+        after = service.stats()["lung"]
+        mean_batch = (after["items"] - before["items"]) / max(1, after["batches"] - before["batches"])
+        print(f"end-to-end micro-batched, c={concurrency:<3} {rate:10.1f} img/s  (mean batch {mean_batch:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Worker cold start: time to import the app, run its startup hooks, and (with
+LLM_WARMUP) build the Gemini clients. Each sample is a fresh interpreter, as
+for a newly autoscaled worker.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+
+async def boot():
+    async with main.lifespan(main.app):
+        pass
+
+start = time.perf_counter()
+asyncio.run(boot())
+print(json.dumps({
+    "import_s": imported,
+    "startup_s": time.perf_counter() - start,
+    "sdk_loaded": "google.generativeai" in sys.modules,
+}))
+"""
+
+
+def sample(env_overrides: dict) -> dict:
+    env = {**os.environ, **env_overrides}
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    scenarios = {
+        "lazy (default)": {"GEMINI_API_KEY": "bench-key", "LLM_WARMUP": "false"},
+        "LLM_WARMUP=true": {"GEMINI_API_KEY": "bench-key", "LLM_WARMUP": "true"},
+    }
+    for name, overrides in scenarios.items():
+        runs = [sample(overrides) for _ in range(args.runs)]
+        import_s = statistics.median(r["import_s"] for r in runs)
+        startup_s = statistics.median(r["startup_s"] for r in runs)
+        print(f"{name:<16} import {import_s * 1000:8.1f} ms  startup {startup_s * 1000:8.1f} ms  "
+              f"total {(import_s + startup_s) * 1000:8.1f} ms  SDK loaded: {runs[0]['sdk_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
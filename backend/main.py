@@ -1,7 +1,51 @@
+import time
+_import_start = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, STARTUP_SECONDS, MetricsMiddleware, registry
+from app.services import cognitive, gemini_service
+from app.services.cognitive import cognitive_service
+from app.services.llm import llm_provider
+from app.services.perception import perception_service
+from app.services.hospital import hospital_service
+from app.services.jobs import job_queue
+from app.services.results import result_recorder
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: load perception models once so the first request doesn't pay for it
+    startup_start = time.perf_counter()
+    perception_service.load()
+    hospital_service.start_watching()
+    await job_queue.start()
+    await result_recorder.start()
+    if settings.llm_warmup:
+        # Optional: pay the Gemini SDK import and client setup now rather than on the first AI request
+        await llm_provider.warmup([(cognitive.MODEL_NAME, cognitive.model_options())] + gemini_service.warmup_models())
+    _report_startup(time.perf_counter() - startup_start)
+    yield
+    await job_queue.stop()
+    # Bounded final flush of results still buffered in memory
+    await result_recorder.stop()
+    hospital_service.stop_watching()
+    # Shutdown: persist warm caches so they survive restarts
+    cognitive_service.cache.save()
+
+def _report_startup(startup_s: float):
+    STARTUP_SECONDS.set(startup_s, "startup")
+    llm = llm_provider.stats()
+    if llm["sdk_import_s"] is not None:
+        STARTUP_SECONDS.set(llm["sdk_import_s"], "llm_sdk_import")
+    if llm["warmup_s"] is not None:
+        STARTUP_SECONDS.set(llm["warmup_s"], "llm_warmup")
+    print(f"Startup: imports {STARTUP_SECONDS.value('import'):.3f}s, startup {startup_s:.3f}s, "
+          f"LLM SDK {'loaded' if llm['sdk_loaded'] else 'not loaded'}")
 
-app = FastAPI(title="OncoDetect X API", version="1.0.0", description="AI-assisted cancer triage and decision-support system API")
+app = FastAPI(title="OncoDetect X API", version="1.0.0", description="AI-assisted cancer triage and decision-support system API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -12,6 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage latency histograms and the Server-Timing response header
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "OncoDetect X API is running", "status": "System Operational"}
@@ -20,8 +67,17 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
 from app.api.routes import router as default_router
-from app.api.routes import analysis
+from app.api.routes import analysis, batch, jobs, results
 
 app.include_router(default_router, prefix="/api/v1")
 app.include_router(analysis.router, prefix="/api/v1")
+app.include_router(batch.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(results.router, prefix="/api/v1")
+
+STARTUP_SECONDS.set(time.perf_counter() - _import_start, "import")
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from PIL import Image
+
+
+def make_png(size=(32, 32), color=(120, 60, 60)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="session")
+def png_bytes() -> bytes:
+    return make_png()
+
+
+@pytest.fixture(autouse=True)
+def _reset_circuit_breakers():
+    # Breakers are shared per upstream; don't let one test's injected failures open them for the next
+    from app.services.resilience import _breakers
+    for breaker in _breakers.values():
+        breaker.reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def _reset_model_router():
+    # Tier health is rolling state; one test's failing calls must not reroute the next test's
+    from app.services.routing import model_router
+    model_router.reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def _isolated_results_store(tmp_path, monkeypatch):
+    # Every pipeline run records its result; keep those writes out of the real data/results.sqlite3
+    from app.services.results import ResultStore, result_recorder
+    store = ResultStore(str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(result_recorder, "store", store)
+    result_recorder._buffer.clear()
+    yield store
+    result_recorder._buffer.clear()
+    store.close()
+
+
+@pytest.fixture(autouse=True)
+def _isolated_job_store(tmp_path, monkeypatch):
+    # The app's lifespan starts the job queue; keep its store out of the real data/jobs.sqlite3
+    from app.services.jobs import JobStore, job_queue
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(job_queue, "store", store)
+    yield store
+    store.close()
+
+
+@pytest.fixture(autouse=True)
+def _reset_rate_limits():
+    # Every TestClient request comes from the same client; start each test with full buckets
+    from app.services.admission import client_rate_limiter
+    client_rate_limiter.reset()
+    yield
@@ -0,0 +1,215 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from tests.conftest import make_png
+from app.api import routes
+from app.core.config import settings
+from app.core.metrics import ADMISSION_QUEUE_WAIT, ADMISSION_REJECTIONS, LLM_FALLBACKS
+from app.models.schemas import LLMInput
+from app.services import gemini_service, pipeline
+from app.services.admission import AdmissionController, AdmissionRejected, ClientRateLimiter, TokenBucket
+from app.services.cache import TTLCache
+from app.services.cognitive import cognitive_service
+from app.services.relevance import relevance_prefilter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UnusedModel:
+    async def generate_content_async(self, prompt, generation_config=None):
+        raise AssertionError("shed work must not reach the model")
+
+
+def _case(cri: int) -> LLMInput:
+    return LLMInput(cancer_type="lung", ml_confidence=0.6, preliminary_cri=cri, symptoms=["cough"], age=60,
+                    risk_factors=[])
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_s=2.0, burst=2, clock=clock)
+    assert bucket.try_take() == 0.0 and bucket.try_take() == 0.0
+    assert bucket.try_take() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.try_take() == 0.0
+
+
+def test_clients_have_separate_buckets():
+    clock = FakeClock()
+    limiter = ClientRateLimiter(rate_per_s=1.0, burst=1, max_clients=2, clock=clock)
+    before = ADMISSION_REJECTIONS.value("triage", "rate_limited")
+    limiter.check("a", "triage")
+    limiter.check("b", "triage")
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check("a", "triage")
+    assert rejected.value.reason == "rate_limited" and rejected.value.retry_after == "1"
+    assert ADMISSION_REJECTIONS.value("triage", "rate_limited") == before + 1
+    # Only the most recent clients are tracked
+    limiter.check("c", "triage")
+    assert len(limiter._buckets) == 2
+    ClientRateLimiter(rate_per_s=0, burst=1).check("a", "triage")
+
+
+def test_most_urgent_work_is_admitted_first():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=10, queue_timeout_s=5, enabled=True)
+        holder = await controller.acquire(0, "test")
+        order = []
+
+        async def wait(priority):
+            async with controller.slot(priority, "test"):
+                order.append(priority)
+
+        waiters = [asyncio.create_task(wait(p)) for p in (10, 90, 50, 90)]
+        await asyncio.sleep(0)
+        assert controller.queued() == 4
+        holder.release()
+        await asyncio.gather(*waiters)
+        assert controller.in_flight == 0 and controller.queued() == 0
+        return order
+
+    assert asyncio.run(scenario()) == [90, 90, 50, 10]
+
+
+def test_full_queue_sheds_the_least_urgent_work():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=2, queue_timeout_s=5, enabled=True)
+        holder = await controller.acquire(0, "test")
+        low = asyncio.create_task(controller.acquire(10, "low"))
+        mid = asyncio.create_task(controller.acquire(40, "test"))
+        await asyncio.sleep(0)
+
+        # Something more urgent evicts the least urgent waiter...
+        urgent = asyncio.create_task(controller.acquire(90, "test"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as shed:
+            await low
+        assert shed.value.reason == "shed" and shed.value.retry_after_s > 0
+        # ...while less urgent work is turned away at once
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire(20, "test")
+        assert full.value.reason == "queue_full"
+
+        holder.release()
+        (await urgent).release()
+        (await mid).release()
+        return controller
+
+    shed_before = ADMISSION_REJECTIONS.value("low", "shed")
+    controller = asyncio.run(scenario())
+    assert ADMISSION_REJECTIONS.value("low", "shed") == shed_before + 1
+    assert controller.in_flight == 0
+
+
+def test_waiters_time_out_and_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=5, queue_timeout_s=0.05, enabled=True)
+        holder = await controller.acquire(0, "test")
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await controller.acquire(50, "timeout_test")
+        assert timed_out.value.reason == "timeout"
+
+        waiter = asyncio.create_task(controller.acquire(50, "test"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.queued() == 0
+        holder.release()
+        assert controller.in_flight == 0
+
+    before = ADMISSION_QUEUE_WAIT.count("timeout_test", "timeout")
+    asyncio.run(scenario())
+    assert ADMISSION_QUEUE_WAIT.count("timeout_test", "timeout") == before + 1
+
+
+def test_disabled_controller_admits_everything():
+    async def scenario():
+        controller = AdmissionController("test", max_concurrency=1, max_queue=0, enabled=False)
+        tickets = [await controller.acquire(0, "test") for _ in range(3)]
+        for ticket in tickets:
+            ticket.release()
+        return controller.in_flight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_shed_triage_falls_back_to_the_rule_based_answer(monkeypatch):
+    controller = AdmissionController("test", max_concurrency=1, max_queue=0, enabled=True)
+    monkeypatch.setattr(cognitive_service, "admission", controller)
+    monkeypatch.setattr(cognitive_service, "model", UnusedModel())
+    monkeypatch.setattr(cognitive_service, "cache", TTLCache(max_size=0))
+    before = LLM_FALLBACKS.value("cognitive", "shed")
+
+    async def scenario():
+        holder = await controller.acquire(100, "test")
+        try:
+            return await cognitive_service.analyze_async(_case(85))
+        finally:
+            holder.release()
+
+    output = asyncio.run(scenario())
+    assert output == cognitive_service._mock_response(_case(85))
+    assert LLM_FALLBACKS.value("cognitive", "shed") == before + 1
+
+
+@pytest.fixture
+def busy_llm(monkeypatch):
+    """Every LLM slot taken and no room in the queue."""
+    controller = AdmissionController("test", max_concurrency=1, max_queue=0, enabled=True)
+    controller.in_flight = 1
+    monkeypatch.setattr(controller, "_bind_loop", asyncio.get_running_loop)
+    monkeypatch.setattr(pipeline, "llm_admission", controller)
+    monkeypatch.setattr(relevance_prefilter, "enabled", False)
+
+    async def check_relevance(content_parts):
+        raise AssertionError("shed work must not reach Gemini")
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    return controller
+
+
+def test_ai_analysis_is_answered_with_429_when_shed(busy_llm):
+    client = TestClient(app)
+    response = client.post("/api/v1/ai-analyze", data={"text": "persistent cough"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    events = client.post("/api/v1/ai-analyze/stream", data={"text": "persistent cough"}).text
+    assert "event: error" in events and "retry_after_s" in events
+
+
+def test_clients_over_their_rate_get_429(monkeypatch):
+    monkeypatch.setattr(routes, "client_rate_limiter", ClientRateLimiter(rate_per_s=0.01, burst=2))
+    params = {"cancer_type": "lung", "age": 40, "symptoms": json.dumps([]), "risk_factors": json.dumps([])}
+    client = TestClient(app)
+
+    def post(headers=None):
+        return client.post("/api/v1/analyze", params=params, headers=headers,
+                           files={"file": ("scan.png", make_png(), "image/png")})
+
+    assert [post().status_code for _ in range(3)] == [200, 200, 429]
+    rejected = post()
+    assert int(rejected.headers["Retry-After"]) > 60
+    # Clients are told apart by address unless CLIENT_ID_HEADER names a header
+    monkeypatch.setattr(routes.settings, "client_id_header", "X-Client-ID")
+    assert post({"X-Client-ID": "other"}).status_code == 200
+
+
+def test_limits_are_validated_not_replaced(monkeypatch):
+    monkeypatch.setattr(settings, "admission_max_concurrency", 16)
+    with pytest.raises(ValueError):
+        AdmissionController("test", max_concurrency=0)
+    with pytest.raises(ValueError):
+        AdmissionController("test", max_queue=-1)
+    assert AdmissionController("test", max_queue=0).max_queue == 0
+    assert AdmissionController("test").max_concurrency == 16
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import COALESCED_REQUESTS, LLM_CALLS_SAVED
+from app.services import gemini_service, pipeline
+from app.services.coalescing import content_parts_key
+from app.services.relevance import relevance_prefilter
+
+LATENCY_S = 0.1
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    state = {"guardrail": 0, "analysis": 0, "analysis_cancelled": 0}
+
+    async def check_relevance(content_parts):
+        state["guardrail"] += 1
+        await asyncio.sleep(LATENCY_S)
+        return True, "stub guardrail"
+
+    async def analyze_oncology(content_parts):
+        state["analysis"] += 1
+        try:
+            await asyncio.sleep(LATENCY_S)
+        except asyncio.CancelledError:
+            state["analysis_cancelled"] += 1
+            raise
+        return "stub analysis", {"risk_factors": {"Age": 3}}
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology", analyze_oncology)
+    monkeypatch.setattr(relevance_prefilter, "enabled", False)
+    monkeypatch.setattr(settings, "ai_analysis_coalescing", True)
+    return state
+
+
+def test_key_normalizes_text_and_hashes_image_bytes():
+    image = {"mime_type": "image/png", "data": b"\x89PNG-one"}
+    assert content_parts_key(["Persistent  cough\n", image]) == content_parts_key(["persistent cough", dict(image)])
+    assert content_parts_key(["persistent cough", image]) != content_parts_key(
+        ["persistent cough", {"mime_type": "image/png", "data": b"\x89PNG-two"}]
+    )
+    assert content_parts_key(["cough"], "serial") != content_parts_key(["cough"], "speculative")
+
+
+def test_identical_concurrent_requests_share_one_run(fake_gemini):
+    saved_before = LLM_CALLS_SAVED.value("ai_analysis")
+    followers_before = COALESCED_REQUESTS.value("ai_analysis", "follower")
+
+    async def scenario():
+        return await asyncio.gather(
+            pipeline.run_ai_analysis(["persistent cough"], mode="serial"),
+            *(pipeline.run_ai_analysis(["  Persistent COUGH "], mode="serial") for _ in range(4))
+        )
+
+    results = asyncio.run(scenario())
+    assert fake_gemini["guardrail"] == 1
+    assert fake_gemini["analysis"] == 1
+    assert all(r == results[0] for r in results)
+    assert results[0]["analysis"] == "stub analysis"
+    # Each waiter gets its own copy
+    results[1]["timings_ms"]["total"] = -1
+    assert results[2]["timings_ms"]["total"] != -1
+    assert COALESCED_REQUESTS.value("ai_analysis", "follower") - followers_before == 4
+    assert LLM_CALLS_SAVED.value("ai_analysis") - saved_before == 8
+    assert pipeline.ai_analysis_flight.in_flight() == 0
+
+
+def test_different_inputs_are_not_coalesced(fake_gemini):
+    async def scenario():
+        await asyncio.gather(
+            pipeline.run_ai_analysis(["persistent cough"], mode="serial"),
+            pipeline.run_ai_analysis(["night sweats"], mode="serial"),
+        )
+
+    asyncio.run(scenario())
+    assert fake_gemini["guardrail"] == 2
+    assert fake_gemini["analysis"] == 2
+
+
+def test_sequential_requests_run_again(fake_gemini):
+    asyncio.run(pipeline.run_ai_analysis(["persistent cough"], mode="serial"))
+    asyncio.run(pipeline.run_ai_analysis(["persistent cough"], mode="serial"))
+    assert fake_gemini["analysis"] == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_others(fake_gemini):
+    async def scenario():
+        first = asyncio.create_task(pipeline.run_ai_analysis(["persistent cough"], mode="speculative"))
+        second = asyncio.create_task(pipeline.run_ai_analysis(["persistent cough"], mode="speculative"))
+        await asyncio.sleep(LATENCY_S / 2)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    result = asyncio.run(scenario())
+    assert result["analysis"] == "stub analysis"
+    assert fake_gemini["analysis"] == 1
+    assert fake_gemini["analysis_cancelled"] == 0
+
+
+def test_run_is_cancelled_once_every_waiter_is_gone(fake_gemini):
+    async def scenario():
+        waiters = [asyncio.create_task(pipeline.run_ai_analysis(["persistent cough"], mode="speculative"))
+                   for _ in range(3)]
+        await asyncio.sleep(LATENCY_S / 2)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert fake_gemini["analysis_cancelled"] == 1
+    assert pipeline.ai_analysis_flight.in_flight() == 0
+
+
+def test_upstream_error_reaches_every_waiter(fake_gemini, monkeypatch):
+    calls = []
+
+    async def failing_relevance(content_parts):
+        calls.append(1)
+        await asyncio.sleep(LATENCY_S)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(gemini_service, "check_relevance", failing_relevance)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(pipeline.run_ai_analysis(["persistent cough"], mode="serial") for _ in range(3)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_coalescing_can_be_disabled(fake_gemini, monkeypatch):
+    monkeypatch.setattr(settings, "ai_analysis_coalescing", False)
+
+    async def scenario():
+        await asyncio.gather(*(pipeline.run_ai_analysis(["persistent cough"], mode="serial") for _ in range(3)))
+
+    asyncio.run(scenario())
+    assert fake_gemini["guardrail"] == 3
+
+
+def test_unhashable_parts_run_uncoalesced(fake_gemini):
+    assert content_parts_key(["cough", object()]) is None
+
+    async def scenario():
+        await asyncio.gather(*(pipeline.run_ai_analysis(["cough", object()], mode="serial") for _ in range(2)))
+
+    asyncio.run(scenario())
+    assert fake_gemini["guardrail"] == 2
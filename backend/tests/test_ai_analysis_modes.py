@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.services import gemini_service, pipeline
+from app.services.relevance import relevance_prefilter
+
+STAGE_LATENCY_S = 0.2
+ANALYSIS_LATENCY_S = 0.3
+REAL_CHECK_RELEVANCE = gemini_service.check_relevance
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    state = {"relevant": True, "analysis_started": 0, "analysis_finished": 0, "analysis_cancelled": 0}
+
+    async def check_relevance(content_parts):
+        await asyncio.sleep(STAGE_LATENCY_S)
+        return state["relevant"], "stub guardrail"
+
+    async def analyze_oncology(content_parts):
+        state["analysis_started"] += 1
+        try:
+            await asyncio.sleep(ANALYSIS_LATENCY_S)
+        except asyncio.CancelledError:
+            state["analysis_cancelled"] += 1
+            raise
+        state["analysis_finished"] += 1
+        return "stub analysis", {"risk_factors": {"Age": 3}}
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology", analyze_oncology)
+    # These tests exercise the LLM guardrail path itself.
+    monkeypatch.setattr(relevance_prefilter, "enabled", False)
+    return state
+
+
+def _run(mode):
+    start = time.perf_counter()
+    result = asyncio.run(pipeline.run_ai_analysis(["persistent cough"], mode=mode))
+    return result, time.perf_counter() - start
+
+
+def test_serial_runs_stages_back_to_back(fake_gemini):
+    result, elapsed = _run("serial")
+    assert result["is_relevant"] is True
+    assert result["analysis"] == "stub analysis"
+    assert elapsed >= STAGE_LATENCY_S + ANALYSIS_LATENCY_S
+    assert set(result["timings_ms"]) == {"guardrail", "analysis", "total"}
+
+
+def test_speculative_overlaps_stages(fake_gemini):
+    result, elapsed = _run("speculative")
+    assert result["is_relevant"] is True
+    assert result["chart_data"] == {"risk_factors": {"Age": 3}}
+    assert elapsed < ANALYSIS_LATENCY_S + STAGE_LATENCY_S / 2
+    assert result["mode"] == "speculative"
+
+
+def test_speculative_cancels_analysis_when_irrelevant(fake_gemini):
+    fake_gemini["relevant"] = False
+    result, _ = _run("speculative")
+    assert result == {
+        "is_relevant": False,
+        "reason": "stub guardrail",
+        "analysis": None,
+        "chart_data": None,
+        "mode": "speculative",
+        "timings_ms": result["timings_ms"],
+    }
+    assert result["timings_ms"]["analysis_cancelled"] is True
+    assert fake_gemini["analysis_cancelled"] == 1
+    assert fake_gemini["analysis_finished"] == 0
+
+
+def test_serial_skips_analysis_when_irrelevant(fake_gemini):
+    fake_gemini["relevant"] = False
+    result, _ = _run("serial")
+    assert result["is_relevant"] is False
+    assert fake_gemini["analysis_started"] == 0
+
+
+def test_guardrail_error_proceeds_with_caution(monkeypatch, fake_gemini):
+    class ExplodingModel:
+        async def generate_content_async(self, parts):
+            raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_service, "model_flash", ExplodingModel())
+    monkeypatch.setattr(gemini_service, "check_relevance", REAL_CHECK_RELEVANCE)
+    result, _ = _run("speculative")
+    assert result["is_relevant"] is True
+    assert result["analysis"] == "stub analysis"
+
+
+def test_route_reports_mode_and_timings(fake_gemini):
+    client = TestClient(app)
+    response = client.post("/api/v1/ai-analyze", data={"text": "Suspicious lung nodule on CT"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["is_relevant"] is True
+    assert body["mode"] in pipeline.ANALYSIS_MODES
+    assert "guardrail" in body["timings_ms"]
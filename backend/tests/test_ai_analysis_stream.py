@@ -0,0 +1,134 @@
+import asyncio
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.services import gemini_service, pipeline
+from app.services.relevance import relevance_prefilter
+from app.services.streaming import ChartBlockExtractor
+
+CHART = {"cancer_types_probability": {"Benign/Normal": 0.7, "Malignant (General)": 0.3}, "risk_factors": {"Age": 4}}
+MARKDOWN = "## Findings\n\nA 2 cm nodule with `smooth` margins.\n\n**Next steps:** CT follow-up.\n\n"
+FULL_TEXT = MARKDOWN + "```json\n" + json.dumps(CHART, indent=2) + "\n```\n"
+
+
+def _split_randomly(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 30)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_extractor_handles_any_chunking():
+    rng = random.Random(11)
+    for _ in range(200):
+        extractor = ChartBlockExtractor()
+        emitted = "".join(extractor.feed(chunk) for chunk in _split_randomly(FULL_TEXT, rng))
+        remaining, chart = extractor.finish()
+        assert emitted + remaining == MARKDOWN + "\n"
+        assert chart == CHART
+
+
+def test_extractor_emits_text_promptly():
+    extractor = ChartBlockExtractor()
+    assert extractor.feed("Hello wor") == "Hello wor"
+    # A lone backtick might start a fence, so it is held back until disambiguated
+    assert extractor.feed("ld `") == "ld "
+    assert extractor.feed("code`") == "`code"
+    assert extractor.feed(" done") == "` done"
+
+
+def test_extractor_without_or_with_malformed_block():
+    extractor = ChartBlockExtractor()
+    assert extractor.feed("plain text") == "plain text"
+    assert extractor.finish() == ("", None)
+
+    extractor = ChartBlockExtractor()
+    extractor.feed("text ```json\n{not json}\n```")
+    assert extractor.finish() == ("", None)
+    assert extractor.block_found
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    state = {"relevant": True, "cancelled": 0}
+
+    async def check_relevance(parts):
+        await asyncio.sleep(0.05)
+        return state["relevant"], "stub guardrail"
+
+    async def analyze_oncology_stream(parts):
+        try:
+            for chunk in _split_randomly(FULL_TEXT, random.Random(5)):
+                await asyncio.sleep(0.005)
+                yield chunk
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology_stream", analyze_oncology_stream)
+    monkeypatch.setattr(relevance_prefilter, "enabled", False)
+    return state
+
+
+@pytest.mark.parametrize("mode", ["serial", "speculative"])
+def test_stream_endpoint_event_sequence(monkeypatch, fake_stream, mode, _isolated_results_store):
+    monkeypatch.setattr("app.core.config.settings.ai_analysis_mode", mode)
+    client = TestClient(app)
+    response = client.post("/api/v1/ai-analyze/stream", data={"text": "lung nodule"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "relevance" and events[0][1]["is_relevant"] is True
+    assert names[-2:] == ["chart", "done"]
+    assert set(names[1:-2]) == {"chunk"}
+    assert "".join(data["text"] for name, data in events if name == "chunk") == MARKDOWN + "\n"
+    assert events[-2][1]["chart_data"] == CHART
+
+    timings = events[-1][1]["timings_ms"]
+    assert timings["first_chunk"] < timings["total"]
+
+    # Recorded like a non-streamed analysis
+    pipeline.result_recorder.flush_now()
+    recorded = _isolated_results_store.query_ai_analyses()["items"]
+    assert len(recorded) == 1
+    assert (recorded[0]["analysis"], recorded[0]["chart_data"], recorded[0]["mode"]) == (MARKDOWN + "\n", CHART, mode)
+
+
+def test_stream_rejects_irrelevant_and_cancels_speculative_analysis(monkeypatch, fake_stream, _isolated_results_store):
+    monkeypatch.setattr("app.core.config.settings.ai_analysis_mode", "speculative")
+    fake_stream["relevant"] = False
+    client = TestClient(app)
+    events = _events(client.post("/api/v1/ai-analyze/stream", data={"text": "anything"}).text)
+    assert [name for name, _ in events] == ["relevance", "done"]
+    assert events[0][1] == {"is_relevant": False, "reason": "stub guardrail"}
+    assert events[1][1]["timings_ms"]["analysis_cancelled"] is True
+    assert fake_stream["cancelled"] == 1
+    pipeline.result_recorder.flush_now()
+    assert _isolated_results_store.query_ai_analyses(is_relevant=False)["items"][0]["reason"] == "stub guardrail"
+
+
+def test_stream_reports_upstream_errors(monkeypatch, fake_stream):
+    async def broken_stream(parts):
+        yield "Partial "
+        raise RuntimeError("quota exceeded")
+
+    monkeypatch.setattr(gemini_service, "analyze_oncology_stream", broken_stream)
+    client = TestClient(app)
+    events = _events(client.post("/api/v1/ai-analyze/stream", data={"text": "lung nodule"}).text)
+    names = [name for name, _ in events]
+    assert "error" in names
+    assert "quota exceeded" in dict(events)["error"]["detail"]
+    assert names[-1] == "done"
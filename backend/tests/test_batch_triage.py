@@ -0,0 +1,190 @@
+import asyncio
+import json
+import random
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from tests.conftest import make_png
+from app.models.schemas import PatientInput, PerceptionOutput
+from app.api.routes import batch as batch_route
+from app.core.config import settings
+from app.services.cache import TTLCache
+from app.services.cognitive import cognitive_service
+from app.services.risk import risk_service
+from app.services.triage_rules import triage_rules
+
+
+def _random_cohort(n, seed=7):
+    rng = random.Random(seed)
+    inputs, perceptions = [], []
+    for _ in range(n):
+        inputs.append(PatientInput(
+            cancer_type=rng.choice(["brain", "lung", "breast"]),
+            age=rng.randint(18, 90),
+            symptoms=[f"s{i}" for i in range(rng.randint(0, 8))],
+            risk_factors=[f"r{i}" for i in range(rng.randint(0, 4))],
+        ))
+        perceptions.append(PerceptionOutput(
+            prediction=rng.choice(["suspected", "inconclusive", "normal"]),
+            confidence=round(rng.uniform(0.0, 1.0), rng.choice([2, 4])),
+        ))
+    return inputs, perceptions
+
+
+def test_batch_cri_matches_scalar():
+    inputs, perceptions = _random_cohort(2000)
+    expected = [risk_service.calculate_preliminary_cri(i, p) for i, p in zip(inputs, perceptions)]
+    assert risk_service.calculate_preliminary_cri_batch(inputs, perceptions) == expected
+
+
+def test_batch_cri_rounding_ties():
+    # 0.875 * 60 = 52.5 -> Python rounds half to even
+    inputs = [PatientInput(cancer_type="lung", age=50, symptoms=[], risk_factors=[])]
+    perceptions = [PerceptionOutput(prediction="suspected", confidence=0.875)]
+    assert risk_service.calculate_preliminary_cri_batch(inputs, perceptions) == [
+        risk_service.calculate_preliminary_cri(inputs[0], perceptions[0])
+    ]
+
+
+def test_batch_cri_length_mismatch():
+    inputs, perceptions = _random_cohort(3)
+    with pytest.raises(ValueError):
+        risk_service.calculate_preliminary_cri_batch(inputs, perceptions[:2])
+
+
+def _cases(n):
+    return [
+        {"cancer_type": "lung", "age": 40 + i, "symptoms": ["cough"] * (i % 4), "risk_factors": ["smoking"], "image_ref": f"scan{i}.png"}
+        for i in range(n)
+    ]
+
+
+def _files(n):
+    return [("files", (f"scan{i}.png", make_png(), "image/png")) for i in range(n)]
+
+
+def test_batch_endpoint_streams_every_case():
+    client = TestClient(app)
+    response = client.post("/api/v1/analyze/batch", data={"cases": json.dumps(_cases(5))}, files=_files(5))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(5))
+    assert all(line["result"]["cancer_type"] == "lung" for line in lines)
+
+
+def test_batch_endpoint_pairs_images_by_position():
+    cases = [{k: v for k, v in c.items() if k != "image_ref"} for c in _cases(3)]
+    client = TestClient(app)
+    response = client.post("/api/v1/analyze/batch", data={"cases": json.dumps(cases)}, files=_files(3))
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 3
+
+
+def test_batch_endpoint_rejects_missing_image():
+    cases = _cases(2)
+    cases[1]["image_ref"] = "missing.png"
+    client = TestClient(app)
+    response = client.post("/api/v1/analyze/batch", data={"cases": json.dumps(cases)}, files=_files(2))
+    assert response.status_code == 400
+
+
+def test_batch_endpoint_rejects_duplicate_filenames():
+    files = _files(2) + [("files", ("scan1.png", make_png(color=(0, 0, 0)), "image/png"))]
+    response = TestClient(app).post("/api/v1/analyze/batch", data={"cases": json.dumps(_cases(2))}, files=files)
+    assert response.status_code == 400 and "scan1.png" in response.json()["detail"]
+
+
+def test_unreadable_image_fails_only_its_case():
+    files = _files(2) + [("files", ("scan2.png", b"not an image", "image/png"))]
+    response = TestClient(app).post("/api/v1/analyze/batch", data={"cases": json.dumps(_cases(3))}, files=files)
+    lines = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+    assert [("result" in line) for line in lines] == [True, True, False]
+    assert lines[2]["error"].startswith("Invalid image file")
+
+
+def test_images_are_ingested_as_cases_come_up(monkeypatch):
+    monkeypatch.setattr(settings, "batch_max_concurrency", 2)
+    active, peak = 0, 0
+
+    async def ingest_image(upload):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        try:
+            # The first case's image is slow to read; the rest must not wait for it
+            await asyncio.sleep(0.3 if upload.filename == "scan0.png" else 0.01)
+            return await real_ingest(upload)
+        finally:
+            active -= 1
+
+    real_ingest = batch_route.ingest_image
+    monkeypatch.setattr(batch_route, "ingest_image", ingest_image)
+    cases = _cases(6)
+    cases[5]["image_ref"] = "scan1.png"  # shared image, read once
+    response = TestClient(app).post("/api/v1/analyze/batch", data={"cases": json.dumps(cases)}, files=_files(5))
+    order = [json.loads(line)["index"] for line in response.text.splitlines()]
+    assert sorted(order) == list(range(6)) and order[-1] == 0
+    assert peak <= 2
+
+
+def test_slow_case_does_not_hold_up_others(monkeypatch):
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    class AgeDependentModel:
+        async def generate_content_async(self, prompt, generation_config=None):
+            # Case 0 (age 40) is slow, everyone else is quick
+            await asyncio.sleep(0.3 if '"age": 40' in prompt else 0.01)
+            return _Response(json.dumps({
+                "triage_level": "Moderate", "risk_adjustment": 0,
+                "explanation": "stub", "recommendation": "stub",
+            }))
+
+    monkeypatch.setattr(cognitive_service, "model", AgeDependentModel())
+    monkeypatch.setattr(triage_rules, "enabled", False)
+    monkeypatch.setattr(cognitive_service, "cache", TTLCache(max_size=0))
+    monkeypatch.setattr(cognitive_service, "_semaphore", None)
+
+    client = TestClient(app)
+    start = time.perf_counter()
+    response = client.post("/api/v1/analyze/batch", data={"cases": json.dumps(_cases(6))}, files=_files(6))
+    elapsed = time.perf_counter() - start
+    order = [json.loads(line)["index"] for line in response.text.splitlines()]
+    assert order[-1] == 0
+    assert elapsed < 0.6
+
+
+def test_batch_endpoint_scores_every_region_in_numpy_chunks(monkeypatch):
+    perceived, chunks = [], []
+
+    class Scan:
+        def perception_inputs(self):
+            return [make_png(color=(c, 0, 0)) for c in (10, 120, 240)]
+
+    async def ingest_image(upload):
+        return Scan()
+
+    async def predict_case_async(images, cancer_type):
+        perceived.append(len(images))
+        return PerceptionOutput(prediction="suspected", confidence=0.8)
+
+    def calculate_preliminary_cri_batch(inputs, perceptions):
+        chunks.append(len(inputs))
+        return real_batch(inputs, perceptions)
+
+    real_batch = risk_service.calculate_preliminary_cri_batch
+    monkeypatch.setattr(batch_route, "ingest_image", ingest_image)
+    monkeypatch.setattr(batch_route.perception_service, "predict_case_async", predict_case_async)
+    monkeypatch.setattr(risk_service, "calculate_preliminary_cri_batch", calculate_preliminary_cri_batch)
+    response = TestClient(app).post("/api/v1/analyze/batch", data={"cases": json.dumps(_cases(4))}, files=_files(4))
+    lines = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+    assert perceived == [3, 3, 3, 3]
+    assert sum(chunks) == 4 and max(chunks) > 1
+    expected = [risk_service.calculate_preliminary_cri(PatientInput(**c), PerceptionOutput(prediction="suspected", confidence=0.8))
+                for c in _cases(4)]
+    assert [line["result"]["preliminary_cri"] for line in lines] == expected
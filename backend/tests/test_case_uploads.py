@@ -0,0 +1,149 @@
+import asyncio
+import io
+import time
+
+import numpy as np
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image, ImageEnhance
+
+from main import app
+from app.api.routes import analysis
+from app.core.config import settings
+from app.core.metrics import CASE_IMAGES
+from app.models.schemas import PerceptionOutput
+from app.services import ingestion
+from app.services.ingestion import CaseTooLargeError, TooManyImagesError, hamming, ingest_case, normalize_image
+from app.services.perception import aggregate, perception_service
+
+PARAMS = {"cancer_type": "lung", "age": 60, "symptoms": "[]", "risk_factors": "[]"}
+
+
+def scene(seed: int, size=(256, 256)) -> Image.Image:
+    """A smooth random picture; flat colors would all share one hash."""
+    coarse = np.random.default_rng(seed).integers(0, 256, (6, 6, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize(size, Image.Resampling.BICUBIC)
+
+
+def encode(image: Image.Image, fmt="PNG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def near_duplicate(seed: int) -> bytes:
+    """The same view re-exported: rescaled, slightly brighter, lossy."""
+    image = ImageEnhance.Brightness(scene(seed).resize((200, 200))).enhance(1.05)
+    return encode(image, "JPEG", quality=70)
+
+
+def uploads(*images: bytes):
+    return [UploadFile(io.BytesIO(data), filename=f"view{i}.png") for i, data in enumerate(images)]
+
+
+def test_near_duplicates_hash_close_and_distinct_views_far_apart():
+    original = normalize_image(encode(scene(1)))
+    assert hamming(original.dhash, normalize_image(near_duplicate(1)).dhash) <= settings.image_dedup_max_distance
+    assert hamming(original.dhash, normalize_image(encode(scene(2))).dhash) > 3 * settings.image_dedup_max_distance
+
+
+def test_case_keeps_the_first_of_each_near_duplicate_group():
+    dropped_before = CASE_IMAGES.value("duplicate")
+    case = asyncio.run(ingest_case(uploads(encode(scene(1)), encode(scene(2)), near_duplicate(1), encode(scene(1)))))
+    assert (case.received, case.duplicates) == (4, [2, 3])
+    assert len(case.images) == 2 and len(case.perception_inputs()) == 2 and len(case.blobs()) == 2
+    assert case.images[0].dhash == normalize_image(encode(scene(1))).dhash
+    assert CASE_IMAGES.value("duplicate") == dropped_before + 2
+
+
+def test_dedup_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(settings, "image_dedup", False)
+    case = asyncio.run(ingest_case(uploads(encode(scene(1)), encode(scene(1)))))
+    assert len(case.images) == 2 and case.duplicates == []
+
+
+def test_case_images_are_decoded_in_parallel(monkeypatch):
+    def slow_normalize(data):
+        time.sleep(0.2)
+        return normalize_image(data)
+
+    monkeypatch.setattr(ingestion, "normalize_image", slow_normalize)
+    start = time.perf_counter()
+    case = asyncio.run(ingest_case(uploads(*(encode(scene(seed)) for seed in range(4)))))
+    assert time.perf_counter() - start < 0.6
+    # Results keep upload order whatever order the workers finish in
+    assert [image.dhash for image in case.images] == [normalize_image(encode(scene(s))).dhash for s in range(4)]
+
+
+def test_case_size_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "max_case_images", 2)
+    with pytest.raises(TooManyImagesError):
+        asyncio.run(ingest_case(uploads(*(encode(scene(seed)) for seed in range(3)))))
+
+
+def test_case_bytes_are_capped(monkeypatch):
+    images = [encode(scene(seed)) for seed in range(3)]
+    monkeypatch.setattr(settings, "max_case_bytes", sum(map(len, images)) - 1)
+    sized = [UploadFile(io.BytesIO(data), filename=f"view{i}.png", size=len(data)) for i, data in enumerate(images)]
+    with pytest.raises(CaseTooLargeError):
+        asyncio.run(ingest_case(sized))
+    # Uploads of unknown size are counted as their bytes come in
+    with pytest.raises(CaseTooLargeError):
+        asyncio.run(ingest_case(uploads(*images)))
+
+    files = [("files", (f"{i}.png", data, "image/png")) for i, data in enumerate(images)]
+    response = TestClient(app).post("/api/v1/analyze", params=PARAMS, files=files)
+    assert response.status_code == 413
+
+
+def test_aggregation_takes_the_most_severe_label():
+    outputs = [PerceptionOutput(prediction="normal", confidence=0.95),
+               PerceptionOutput(prediction="suspected", confidence=0.6),
+               PerceptionOutput(prediction="suspected", confidence=0.5)]
+    assert aggregate(outputs, "max") == PerceptionOutput(prediction="suspected", confidence=0.6)
+    assert aggregate(outputs, "mean").confidence == 0.55
+    assert aggregate(outputs, "noisy_or").confidence == 0.8
+    # A misconfigured method must not fail requests
+    assert aggregate(outputs, "median") == aggregate(outputs, "max")
+
+
+def test_analyze_runs_perception_once_per_distinct_image(monkeypatch):
+    perceived = []
+
+    async def predict_case_async(images, cancer_type):
+        perceived.append(len(images))
+        return PerceptionOutput(prediction="suspected", confidence=0.7)
+
+    monkeypatch.setattr(perception_service, "predict_case_async", predict_case_async)
+    client = TestClient(app)
+    files = [("file", ("a.png", encode(scene(1)), "image/png")),
+             ("files", ("b.png", encode(scene(2)), "image/png")),
+             ("files", ("c.jpg", near_duplicate(2), "image/jpeg"))]
+    response = client.post("/api/v1/analyze", params=PARAMS, files=files)
+    assert response.status_code == 200
+    assert perceived == [2]
+
+    assert client.post("/api/v1/analyze", params=PARAMS).status_code == 400
+    monkeypatch.setattr(settings, "max_case_images", 2)
+    assert client.post("/api/v1/analyze", params=PARAMS, files=files).status_code == 413
+
+
+def test_ai_analysis_sends_each_distinct_image_once(monkeypatch):
+    received = []
+
+    async def run_ai_analysis(content_parts):
+        received.append(content_parts)
+        return {"is_relevant": True}
+
+    monkeypatch.setattr(analysis, "run_ai_analysis", run_ai_analysis)
+    files = [("files", (f"{name}.png", data, "image/png"))
+             for name, data in (("a", encode(scene(1))), ("b", encode(scene(1))), ("c", encode(scene(3))))]
+    response = TestClient(app).post("/api/v1/ai-analyze", data={"text": "two views"}, files=files)
+    assert response.status_code == 200
+    assert received[0][0] == "two views"
+    assert [part["mime_type"] for part in received[0][1:]] == ["image/jpeg", "image/jpeg"]
+
+    bad = [("files", ("a.png", encode(scene(1)), "image/png")), ("files", ("broken.png", b"not an image", "image/png"))]
+    response = TestClient(app).post("/api/v1/ai-analyze", files=bad)
+    assert response.status_code == 400 and "broken.png" in response.json()["detail"]
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+
+from app.models.schemas import LLMInput
+from app.services.cache import TTLCache, llm_input_key
+from app.services.cognitive import CognitiveService
+
+BASE_INPUT = dict(
+    cancer_type="lung",
+    ml_confidence=0.82,
+    preliminary_cri=71,
+    symptoms=["Persistent cough", "weight loss"],
+    age=58,
+    risk_factors=["smoking", "asbestos exposure"],
+)
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def _respond(self):
+        self.calls += 1
+        return _Response(json.dumps({
+            "triage_level": "High",
+            "risk_adjustment": 4,
+            "explanation": "Consistent findings.",
+            "recommendation": "See a specialist this week.",
+        }))
+
+    def generate_content(self, prompt, generation_config=None):
+        return self._respond()
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return self._respond()
+
+
+def _service(cache):
+    service = CognitiveService(cache=cache)
+    service.model = CountingModel()
+    return service
+
+
+def test_key_is_canonical():
+    a = LLMInput(**BASE_INPUT)
+    b = LLMInput(**{
+        **BASE_INPUT,
+        "cancer_type": " Lung ",
+        "ml_confidence": 0.81,
+        "symptoms": ["weight loss", "persistent cough"],
+        "risk_factors": ["asbestos exposure", "Smoking"],
+    })
+    c = LLMInput(**{**BASE_INPUT, "preliminary_cri": 72})
+    assert llm_input_key(a) == llm_input_key(b)
+    assert llm_input_key(a) != llm_input_key(c)
+
+
+def test_repeat_payload_skips_model():
+    service = _service(TTLCache(max_size=16))
+    data = LLMInput(**BASE_INPUT)
+
+    first = asyncio.run(service.analyze_async(data))
+    start = time.perf_counter()
+    second = asyncio.run(service.analyze_async(data))
+    third = service.analyze(data)
+    assert time.perf_counter() - start < 0.05
+
+    assert service.model.calls == 1
+    assert first == second == third
+    assert service.cache.stats()["hits"] == 2
+    assert service.cache.stats()["misses"] == 1
+
+
+def test_fallbacks_are_not_cached():
+    service = CognitiveService(cache=TTLCache(max_size=16))
+    service.model = None
+    service.analyze(LLMInput(**BASE_INPUT))
+    assert len(service.cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_expiry():
+    now = [1000.0]
+    cache = TTLCache(max_size=4, ttl_s=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_persistence_round_trip(tmp_path):
+    path = str(tmp_path / "cognitive_cache.json")
+    service = _service(TTLCache(max_size=16, persist_path=path))
+    data = LLMInput(**BASE_INPUT)
+    expected = service.analyze(data)
+    service.cache.save()
+
+    restarted = _service(TTLCache(max_size=16, persist_path=path))
+    assert restarted.analyze(data) == expected
+    assert restarted.model.calls == 0
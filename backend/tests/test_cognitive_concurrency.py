@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from main import app
+from tests.conftest import make_png
+from app.core.metrics import LLM_FALLBACKS
+from app.models.schemas import LLMInput
+from app.services.cache import TTLCache
+from app.services.cognitive import CognitiveService, cognitive_service
+from app.services.routing import FLASH, model_router
+
+LLM_LATENCY_S = 0.1
+SCAN = make_png()
+
+ANALYZE_PARAMS = {
+    "cancer_type": "lung",
+    "age": 61,
+    "symptoms": json.dumps(["persistent cough", "weight loss"]),
+    "risk_factors": json.dumps(["smoking"]),
+}
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class SlowModel:
+    """Stands in for the Gemini client: every call takes a fixed amount of wall time."""
+
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(self.latency_s)
+        return _Response(json.dumps({
+            "triage_level": "High",
+            "risk_adjustment": 3,
+            "explanation": "Stub explanation.",
+            "recommendation": "Stub recommendation.",
+        }))
+
+
+@pytest.fixture
+def slow_model(monkeypatch):
+    monkeypatch.setattr(cognitive_service, "model", SlowModel(LLM_LATENCY_S))
+    monkeypatch.setattr(cognitive_service, "max_concurrency", 16)
+    monkeypatch.setattr(cognitive_service, "timeout_s", 5.0)
+    monkeypatch.setattr(cognitive_service, "_semaphore", None)
+    # Every request must reach the model for the timings to mean anything.
+    monkeypatch.setattr(cognitive_service, "cache", TTLCache(max_size=0))
+
+
+async def _post_analyze(client):
+    response = await client.post(
+        "/api/v1/analyze",
+        params=ANALYZE_PARAMS,
+        files={"file": ("scan.png", SCAN, "image/png")},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def _throughput(concurrency, total):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        queue = list(range(total))
+
+        async def worker():
+            while queue:
+                queue.pop()
+                await _post_analyze(client)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+def test_throughput_scales_with_concurrency(slow_model):
+    serial = asyncio.run(_throughput(concurrency=1, total=8))
+    concurrent = asyncio.run(_throughput(concurrency=8, total=8))
+    print(f"\nanalyze throughput: c=1 {serial:.1f} req/s, c=8 {concurrent:.1f} req/s")
+    # A blocking LLM call would keep these roughly equal.
+    assert concurrent > serial * 4
+
+
+def test_health_not_blocked_by_llm_calls(slow_model):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            in_flight = [asyncio.create_task(_post_analyze(client)) for _ in range(4)]
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            health = await client.get("/health")
+            health_latency = time.perf_counter() - start
+            await asyncio.gather(*in_flight)
+            return health, health_latency
+
+    health, health_latency = asyncio.run(scenario())
+    assert health.status_code == 200
+    assert health_latency < LLM_LATENCY_S / 2
+
+
+def test_in_flight_limit_is_respected(monkeypatch, slow_model):
+    monkeypatch.setattr(cognitive_service, "max_concurrency", 2)
+    active = 0
+    peak = 0
+
+    class CountingModel(SlowModel):
+        async def generate_content_async(self, prompt, generation_config=None):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            try:
+                return await super().generate_content_async(prompt, generation_config)
+            finally:
+                active -= 1
+
+    monkeypatch.setattr(cognitive_service, "model", CountingModel(0.02))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await asyncio.gather(*(_post_analyze(client) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak == 2
+
+
+def test_deadline_falls_back_to_mock(monkeypatch, slow_model):
+    monkeypatch.setattr(cognitive_service, "model", SlowModel(1.0))
+    monkeypatch.setattr(cognitive_service, "timeout_s", 0.05)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            result = await _post_analyze(client)
+            return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.5
+    assert result["explanation"] != "Stub explanation."
+
+
+CASE = LLMInput(cancer_type="lung", ml_confidence=0.6, preliminary_cri=55, symptoms=["cough"], age=60,
+               risk_factors=[])
+
+
+def test_waiting_for_a_local_slot_is_not_an_upstream_failure(monkeypatch):
+    service = CognitiveService(max_concurrency=1, timeout_s=0.05, cache=TTLCache(max_size=0))
+    monkeypatch.setattr(service, "model", SlowModel(0.0))
+    breaker = service.resilience.breaker
+    failures, busy = breaker.failures, LLM_FALLBACKS.value("cognitive", "busy")
+
+    async def scenario():
+        # Every slot is taken by calls of other cases
+        await service._get_semaphore().acquire()
+        return await service.analyze_async(CASE)
+
+    assert asyncio.run(scenario()) == service._mock_response(CASE)
+    assert LLM_FALLBACKS.value("cognitive", "busy") == busy + 1
+    assert breaker.failures == failures
+    assert len(model_router.tier_stats[FLASH]) == 0
+
+
+def test_explicit_zero_limits_are_kept(monkeypatch):
+    service = CognitiveService(max_concurrency=0, timeout_s=0, cache=TTLCache(max_size=0))
+    assert (service.max_concurrency, service.timeout_s) == (0, 0)
+    monkeypatch.setattr(service, "model", SlowModel(1.0))
+
+    start = time.perf_counter()
+    assert asyncio.run(service.analyze_async(CASE)) == service._mock_response(CASE)
+    assert time.perf_counter() - start < 0.5
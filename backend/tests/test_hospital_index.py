@@ -0,0 +1,136 @@
+import json
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+from app.services.hospital import EARTH_RADIUS_KM, HospitalIndex, HospitalService, KDTree, chord_to_km, to_unit_vectors
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def synthetic_registry(n, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"Site {i}",
+            "location": "Synthetic",
+            "latitude": rng.uniform(-60, 70),
+            "longitude": rng.uniform(-180, 180),
+            "specialties": rng.sample(["brain", "lung", "breast", "general"], rng.randint(1, 2)),
+            "availability": rng.choice(["High", "Medium", "Low"]),
+            "distance_km": rng.randint(1, 500),
+        }
+        for i in range(n)
+    ]
+
+
+def test_kdtree_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(-80, 80, 5000), rng.uniform(-180, 180, 5000)
+    points = to_unit_vectors(lat, lon)
+    tree = KDTree(points, leaf_size=16)
+    for _ in range(25):
+        q = to_unit_vectors(rng.uniform(-80, 80), rng.uniform(-180, 180))
+        expected = np.argsort(((points - q) ** 2).sum(axis=1))[:7].tolist()
+        assert [i for _, i in tree.query(q, 7)] == expected
+
+
+def test_nearest_filters_by_specialty_and_reports_km():
+    hospitals = synthetic_registry(3000)
+    index = HospitalIndex(hospitals)
+    lat, lon = 48.85, 2.35
+    results = index.nearest(["brain", "general"], lat, lon, k=5)
+    eligible = [
+        (haversine_km(lat, lon, h["latitude"], h["longitude"]), i)
+        for i, h in enumerate(hospitals)
+        if {"brain", "general"} & set(h["specialties"])
+    ]
+    expected = sorted(eligible)[:5]
+    assert [i for _, i in results] == [i for _, i in expected]
+    assert all(abs(a - b) < 1e-6 for (a, _), (b, _) in zip(results, expected))
+
+
+def test_best_weighted_is_exact():
+    hospitals = synthetic_registry(3000)
+    index = HospitalIndex(hospitals)
+    weights = {"High": 1.0, "Medium": 1.25, "Low": 1.6}
+    for lat, lon in [(40.7, -74.0), (-33.9, 151.2), (35.7, 139.7)]:
+        distance, i = index.best_weighted(["lung", "general"], lat, lon, k=2)
+        expected = min(
+            (haversine_km(lat, lon, h["latitude"], h["longitude"]) * weights[h["availability"]], j)
+            for j, h in enumerate(hospitals)
+            if {"lung", "general"} & set(h["specialties"])
+        )
+        assert i == expected[1]
+
+
+def test_static_recommendation_unchanged_without_location():
+    service = HospitalService()
+    assert service.recommend("brain") == "Recommended: City Cancer Center (5 km away) - Specialized in brain."
+    assert service.recommend("breast") == "Recommended: City Cancer Center (5 km away) - Specialized in breast."
+    assert service.recommend("lung") == "Recommended: City Cancer Center (5 km away) - Specialized in lung."
+
+
+def test_location_aware_recommendation():
+    service = HospitalService()
+    # Patient just west of General Hospital
+    result = service.recommend("breast", latitude=40.7128, longitude=-74.12)
+    assert result.startswith("Recommended: General Hospital (")
+
+
+def test_hot_reload_swaps_registry(tmp_path):
+    path = tmp_path / "hospitals.json"
+    path.write_text(json.dumps(synthetic_registry(50)))
+    service = HospitalService(data_path=str(path))
+    old_index = service.index
+    assert not service.reload_if_changed()
+
+    replacement = [{
+        "name": "Brand New Clinic", "location": "Harbor", "latitude": 1.0, "longitude": 1.0,
+        "specialties": ["general"], "availability": "High", "distance_km": 1,
+    }]
+    path.write_text(json.dumps(replacement))
+    os.utime(path, ns=(1, 1))
+    assert service.reload_if_changed()
+    assert service.index is not old_index
+    assert service.recommend("lung").startswith("Recommended: Brand New Clinic")
+
+
+def test_bad_reload_keeps_previous_registry(tmp_path):
+    path = tmp_path / "hospitals.json"
+    path.write_text(json.dumps(synthetic_registry(10)))
+    service = HospitalService(data_path=str(path))
+    before = service.index
+    path.write_text("{ not json")
+    os.utime(path, ns=(2, 2))
+    assert not service.reload_if_changed()
+    assert service.index is before
+
+
+def test_chord_to_km_antipodal():
+    assert chord_to_km(2.0) == pytest.approx(math.pi * EARTH_RADIUS_KM)
+
+
+def test_analyze_accepts_patient_location(png_bytes):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    params = {
+        "cancer_type": "brain", "age": 50, "symptoms": "[]", "risk_factors": "[]",
+        "latitude": 40.83, "longitude": -74.0,
+    }
+    response = client.post("/api/v1/analyze", params=params, files={"file": ("scan.png", png_bytes, "image/png")})
+    assert response.status_code == 200
+    assert response.json()["hospital_recommendation"].startswith("Recommended: Neuro-Oncology Institute (")
+
+    params["latitude"] = 123
+    assert client.post("/api/v1/analyze", params=params, files={"file": ("scan.png", png_bytes, "image/png")}).status_code == 422
@@ -0,0 +1,108 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from main import app
+from app.services import gemini_service
+from app.services.ingestion import (
+    InvalidImageError, UploadTooLargeError, normalize_image, read_upload,
+)
+
+
+def _jpeg(size):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_read_upload_stops_at_cap():
+    raw = CountingFile(b"x" * 10_000)
+    upload = UploadFile(raw)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(read_upload(upload, max_bytes=2_500, chunk_size=1_000))
+    # Bailed out on the chunk that crossed the limit instead of reading everything
+    assert raw.reads == 3
+
+
+def test_read_upload_within_cap():
+    upload = UploadFile(io.BytesIO(b"y" * 3_000))
+    assert asyncio.run(read_upload(upload, max_bytes=3_000, chunk_size=1_024)) == b"y" * 3_000
+
+
+def test_large_jpeg_is_downscaled():
+    data = _jpeg((4000, 3000))
+    ingested = normalize_image(data, max_side=512, fmt="JPEG")
+    assert ingested.original_size == (4000, 3000)
+    assert max(ingested.image.size) == 512
+    assert ingested.mime_type == "image/jpeg"
+    assert len(ingested.data) < len(data)
+    assert Image.open(io.BytesIO(ingested.data)).size == ingested.image.size
+
+
+def test_small_image_keeps_resolution():
+    ingested = normalize_image(_jpeg((300, 200)), max_side=1024, fmt="PNG")
+    assert ingested.image.size == (300, 200)
+    assert ingested.mime_type == "image/png"
+
+
+def test_16bit_scan_is_rescaled_not_clipped():
+    pixels = np.linspace(0, 4000, 64 * 64, dtype=np.uint16).reshape(64, 64)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    ingested = normalize_image(buffer.getvalue(), max_side=64, fmt="PNG")
+    out = np.asarray(ingested.image)
+    assert ingested.image.mode == "L"
+    assert out.min() == 0 and out.max() == 255
+
+
+def test_invalid_image():
+    with pytest.raises(InvalidImageError):
+        normalize_image(b"definitely not an image")
+
+
+def test_routes_map_ingestion_errors(monkeypatch):
+    client = TestClient(app)
+    params = {"cancer_type": "lung", "age": 50, "symptoms": "[]", "risk_factors": "[]"}
+    bad = client.post("/api/v1/analyze", params=params, files={"file": ("x.png", b"nope", "image/png")})
+    assert bad.status_code == 400
+
+    monkeypatch.setattr("app.core.config.settings.max_upload_bytes", 100)
+    big = client.post("/api/v1/analyze", params=params, files={"file": ("x.jpg", _jpeg((64, 64)), "image/jpeg")})
+    assert big.status_code == 413
+
+
+def test_ai_analyze_sends_normalized_blob(monkeypatch):
+    seen = {}
+
+    async def check_relevance(parts):
+        return True, "stub"
+
+    async def analyze_oncology(parts):
+        seen["parts"] = parts
+        return "stub", None
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology", analyze_oncology)
+    monkeypatch.setattr("app.core.config.settings.image_max_side", 256)
+
+    client = TestClient(app)
+    response = client.post("/api/v1/ai-analyze", files={"file": ("scan.jpg", _jpeg((2048, 2048)), "image/jpeg")})
+    assert response.status_code == 200
+    blob = seen["parts"][0]
+    assert blob["mime_type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(blob["data"])).size == (256, 256)
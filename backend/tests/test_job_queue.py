@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from tests.conftest import make_png
+from app.core.config import settings
+from app.models.schemas import PerceptionOutput
+from app.services import gemini_service, jobs
+from app.services.admission import AdmissionRejected
+from app.services.jobs import job_queue, JobQueue, JobStore, DONE, PENDING, RUNNING
+from app.services.perception import perception_service
+from app.services.relevance import relevance_prefilter
+
+ANALYZE_PARAMS = {
+    "cancer_type": "lung",
+    "age": 61,
+    "symptoms": json.dumps(["persistent cough"]),
+    "risk_factors": json.dumps(["smoking"]),
+}
+
+
+@pytest.fixture
+def queue_db(_isolated_job_store):
+    return _isolated_job_store
+
+
+def _wait_for_result(client, job_id, timeout_s=5.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        response = client.get(f"/api/v1/jobs/{job_id}/result")
+        if response.status_code != 202:
+            return response
+        assert response.headers["Retry-After"]
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_triage_job_submit_and_poll(queue_db):
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/jobs/analyze",
+            params=ANALYZE_PARAMS,
+            files={"file": ("scan.png", make_png(), "image/png")},
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        result = _wait_for_result(client, job_id)
+        assert result.status_code == 200
+        assert 0 <= result.json()["final_cri"] <= 100
+
+        status = client.get(f"/api/v1/jobs/{job_id}").json()
+        assert status["status"] == DONE
+        assert status["finished_at"] >= status["started_at"]
+
+    # Inputs are dropped once the job is finished
+    assert queue_db.images(job_id) == []
+
+
+def test_jobs_keep_every_image_of_the_case(queue_db, monkeypatch):
+    perceived, received = [], []
+
+    async def predict_case_async(images, cancer_type):
+        perceived.append(len(images))
+        return PerceptionOutput(prediction="suspected", confidence=0.7)
+
+    async def run_ai_analysis(content_parts):
+        received.append(content_parts)
+        return {"is_relevant": True}
+
+    monkeypatch.setattr(perception_service, "predict_case_async", predict_case_async)
+    monkeypatch.setattr(jobs, "run_ai_analysis", run_ai_analysis)
+    # Flat test images all share one perceptual hash
+    monkeypatch.setattr(settings, "image_dedup", False)
+    files = [("file", ("a.png", make_png(color=(0, 0, 0)), "image/png")),
+             ("files", ("b.png", make_png(size=(48, 32), color=(250, 250, 250)), "image/png"))]
+    with TestClient(app) as client:
+        response = client.post("/api/v1/jobs/analyze", params=ANALYZE_PARAMS, files=files)
+        assert _wait_for_result(client, response.json()["job_id"]).status_code == 200
+        response = client.post("/api/v1/jobs/ai-analyze", data={"text": "two views"}, files=files)
+        assert _wait_for_result(client, response.json()["job_id"]).status_code == 200
+    assert perceived == [2]
+    assert received[0][0] == "two views"
+    assert [part["mime_type"] for part in received[0][1:]] == ["image/jpeg", "image/jpeg"]
+
+
+def test_ai_analysis_job(queue_db, monkeypatch):
+    async def check_relevance(content_parts):
+        return True, "stub guardrail"
+
+    async def analyze_oncology(content_parts):
+        await asyncio.sleep(0.05)
+        return "stub analysis", {"risk_factors": {"Age": 3}}
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology", analyze_oncology)
+    monkeypatch.setattr(relevance_prefilter, "enabled", False)
+
+    with TestClient(app) as client:
+        response = client.post("/api/v1/jobs/ai-analyze", data={"text": "persistent cough"})
+        assert response.status_code == 202
+        result = _wait_for_result(client, response.json()["job_id"])
+        assert result.status_code == 200
+        assert result.json()["analysis"] == "stub analysis"
+
+
+def test_workers_bound_concurrency(queue_db, monkeypatch):
+    active = 0
+    peak = 0
+
+    async def slow_job(payload, images):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return {"n": payload["n"]}
+
+    monkeypatch.setitem(job_queue.handlers, "slow", slow_job)
+    monkeypatch.setattr(job_queue, "workers", 2)
+
+    async def scenario():
+        await job_queue.start()
+        try:
+            ids = [await job_queue.submit("slow", {"n": n}) for n in range(8)]
+            while queue_db.count(DONE) < len(ids):
+                await asyncio.sleep(0.01)
+            return [queue_db.get(i)["result"]["n"] for i in ids]
+        finally:
+            await job_queue.stop()
+
+    assert asyncio.run(scenario()) == list(range(8))
+    assert peak == 2
+
+
+def test_unfinished_jobs_survive_restart(queue_db, monkeypatch):
+    ran = []
+
+    async def record(payload, images):
+        ran.append(payload["n"])
+        return {}
+
+    monkeypatch.setitem(job_queue.handlers, "record", record)
+    monkeypatch.setattr(job_queue, "lease_s", 60)
+    queue_db.create("interrupted", "record", {"n": 1})
+    assert queue_db.claim("interrupted")
+    # Claimed long enough ago for the lease to have run out
+    queue_db._execute("UPDATE jobs SET started_at = ? WHERE id = ?", (time.time() - 120, "interrupted"))
+    queue_db.create("queued", "record", {"n": 2})
+    assert queue_db.get("interrupted")["status"] == RUNNING
+
+    async def scenario():
+        await job_queue.start()
+        try:
+            while len(ran) < 2:
+                await asyncio.sleep(0.01)
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(scenario())
+    assert sorted(ran) == [1, 2]
+    assert queue_db.count(PENDING) == 0
+
+
+def test_workers_sharing_a_store_run_each_job_once(queue_db):
+    ran = []
+
+    async def record(payload, images):
+        ran.append(payload["n"])
+        await asyncio.sleep(0.05)
+        return {}
+
+    queues = [JobQueue(JobStore(queue_db.path), workers=2, lease_s=60) for _ in range(2)]
+    for queue in queues:
+        queue.register("record", record)
+
+    async def scenario():
+        await queues[0].start()
+        ids = [await queues[0].submit("record", {"n": n}) for n in range(4)]
+        await asyncio.sleep(0.01)
+        # A second process starting up sees the same jobs, pending and freshly claimed
+        await queues[1].start()
+        for job_id in ids:
+            queues[1]._queue.put_nowait(job_id)
+        try:
+            while queue_db.count(DONE) < len(ids):
+                await asyncio.sleep(0.01)
+        finally:
+            for queue in queues:
+                await queue.stop()
+                queue.store.close()
+
+    asyncio.run(scenario())
+    assert sorted(ran) == [0, 1, 2, 3]
+
+
+def test_only_stale_running_jobs_are_requeued(queue_db):
+    queue_db.create("live", "record", {})
+    queue_db.create("orphaned", "record", {})
+    assert queue_db.claim("live") and queue_db.claim("orphaned")
+    assert not queue_db.claim("live")
+    queue_db._execute("UPDATE jobs SET started_at = ? WHERE id = ?", (time.time() - 120, "orphaned"))
+
+    assert queue_db.requeue_stale(60) == ["orphaned"]
+    assert queue_db.get("live")["status"] == RUNNING
+    assert queue_db.get("orphaned")["status"] == PENDING
+
+
+def test_shed_jobs_are_retried_instead_of_failed(queue_db, monkeypatch):
+    attempts = []
+
+    async def busy_then_free(payload, images):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise AdmissionRejected("shed", 0.02)
+        return {"ok": True}
+
+    monkeypatch.setitem(job_queue.handlers, "busy", busy_then_free)
+    monkeypatch.setattr(job_queue, "max_defer_s", 0.2)
+
+    async def scenario():
+        await job_queue.start()
+        try:
+            job_id = await job_queue.submit("busy", {})
+            while queue_db.get(job_id)["status"] != DONE:
+                assert queue_db.get(job_id)["status"] != "failed"
+                await asyncio.sleep(0.01)
+            return queue_db.get(job_id)
+        finally:
+            await job_queue.stop()
+
+    job = asyncio.run(scenario())
+    assert job["result"] == {"ok": True} and len(attempts) == 3
+    # Each retry waited at least the Retry-After hint
+    assert all(later - earlier >= 0.02 for earlier, later in zip(attempts, attempts[1:]))
+    assert job_queue.stats()["deferred"] == 0
+
+
+def test_unknown_job_and_full_queue(queue_db, monkeypatch):
+    monkeypatch.setattr(job_queue, "max_pending", 0)
+    with TestClient(app) as client:
+        assert client.get("/api/v1/jobs/missing/result").status_code == 404
+        response = client.post("/api/v1/jobs/ai-analyze", data={"text": "persistent cough"})
+        assert response.status_code == 503
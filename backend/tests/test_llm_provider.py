@@ -0,0 +1,70 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app.services import cognitive
+from app.services.jobs import JobStore, job_queue
+from app.services.llm import LLMProvider, StubModel
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def test_importing_the_app_skips_the_gemini_sdk():
+    env = {k: v for k, v in os.environ.items() if k not in ("GEMINI_STUB_URL", "LLM_WARMUP")}
+    env["GEMINI_API_KEY"] = "test-key"
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", "import sys, main; print('google.generativeai' in sys.modules)"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    assert out.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_clients_are_built_once_and_shared():
+    provider = LLMProvider(stub_url="http://gemini-stub")
+    assert provider.stats()["clients"] == 0
+
+    first = provider.model("gemini-1.5-flash", generation_config={"temperature": 0.4})
+    second = provider.model("gemini-1.5-flash", generation_config={"temperature": 0.4})
+    other = provider.model("gemini-1.5-flash")
+    assert isinstance(first, StubModel)
+    assert first is second
+    assert other is not first
+    assert provider.stats()["clients"] == 2
+    assert provider.stats()["sdk_loaded"] is False
+
+
+def test_warmup_builds_clients_up_front():
+    provider = LLMProvider(stub_url="http://gemini-stub")
+    asyncio.run(provider.warmup([("gemini-1.5-flash", {}), ("gemini-1.5-pro", {})]))
+    stats = provider.stats()
+    assert stats["clients"] == 2
+    assert stats["warmup_s"] is not None
+
+    disabled = LLMProvider()
+    asyncio.run(disabled.warmup([("gemini-1.5-flash", {})]))
+    assert disabled.stats()["clients"] == 0
+
+
+def test_cognitive_model_resolves_lazily(monkeypatch):
+    provider = LLMProvider(stub_url="http://gemini-stub")
+    monkeypatch.setattr(cognitive, "llm_provider", provider)
+    service = cognitive.CognitiveService()
+    assert provider.stats()["clients"] == 0
+    assert isinstance(service.model, StubModel)
+    assert service.model is provider.model(cognitive.MODEL_NAME, **cognitive.model_options())
+    assert service.model.system_instruction == cognitive.TRIAGE_PROMPT.system
+
+    monkeypatch.setattr(cognitive, "llm_provider", LLMProvider())
+    assert cognitive.CognitiveService().model is None
+
+
+def test_startup_time_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "store", JobStore(str(tmp_path / "jobs.sqlite3")))
+    with TestClient(app) as client:
+        body = client.get("/metrics").text
+    assert 'oncodetect_startup_seconds{phase="import"}' in body
+    assert 'oncodetect_startup_seconds{phase="startup"}' in body
@@ -0,0 +1,124 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from tests.conftest import make_png
+from app.core.metrics import (
+    CACHE_REQUESTS, LLM_FALLBACKS, LLM_PARSE_FAILURES, LLM_TOKENS, STAGE_SECONDS, Counter, Histogram
+)
+from app.services.cache import TTLCache
+from app.services.cognitive import cognitive_service
+from app.services.jobs import JobStore, job_queue
+from app.services.triage_rules import triage_rules
+
+client = TestClient(app)
+
+ANALYZE_PARAMS = {
+    "cancer_type": "lung",
+    "age": 61,
+    "symptoms": json.dumps(["persistent cough"]),
+    "risk_factors": json.dumps(["smoking"]),
+}
+
+LLM_JSON = json.dumps({
+    "triage_level": "High",
+    "risk_adjustment": 3,
+    "explanation": "Stub explanation.",
+    "recommendation": "Stub recommendation.",
+})
+
+
+class FakeModel:
+    def __init__(self, text, prompt_tokens=120, output_tokens=40):
+        self.text = text
+        self.usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return SimpleNamespace(text=self.text, usage_metadata=self.usage)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(cognitive_service, "model", FakeModel(LLM_JSON))
+    monkeypatch.setattr(cognitive_service, "cache", TTLCache(max_size=16))
+    monkeypatch.setattr(cognitive_service, "_semaphore", None)
+    # Low-risk test cases would otherwise be triaged by the rule fast path
+    monkeypatch.setattr(triage_rules, "enabled", False)
+
+
+def _analyze(age=61):
+    return client.post(
+        "/api/v1/analyze",
+        params={**ANALYZE_PARAMS, "age": age},
+        files={"file": ("scan.png", make_png(), "image/png")},
+    )
+
+
+def test_server_timing_lists_pipeline_stages(fake_model):
+    response = _analyze()
+    assert response.status_code == 200
+    entries = dict(e.split(";dur=") for e in response.headers["server-timing"].split(", "))
+    for stage in ("upload_read", "image_decode", "perception", "risk", "cognitive_llm", "hospital", "total"):
+        assert stage in entries
+    assert float(entries["total"]) >= float(entries["cognitive_llm"])
+    assert "server-timing" in client.get("/health").headers
+
+
+def test_metrics_endpoint_exposes_counters(fake_model):
+    before_hits = CACHE_REQUESTS.value("cognitive", "hit")
+    before_tokens = LLM_TOKENS.value("cognitive", "prompt")
+    before_llm = STAGE_SECONDS.count("cognitive_llm")
+
+    _analyze(age=70)
+    _analyze(age=70)  # same LLM input: served from the cache
+
+    assert CACHE_REQUESTS.value("cognitive", "hit") == before_hits + 1
+    assert LLM_TOKENS.value("cognitive", "prompt") == before_tokens + 120
+    assert STAGE_SECONDS.count("cognitive_llm") == before_llm + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE oncodetect_stage_duration_seconds histogram" in body
+    assert 'oncodetect_stage_duration_seconds_bucket{stage="perception",le="+Inf"}' in body
+    assert 'oncodetect_cache_requests_total{cache="cognitive",result="hit"}' in body
+    assert 'oncodetect_http_request_duration_seconds_count{method="POST",route="/api/v1/analyze",status="200"}' in body
+
+
+def test_parse_failure_counts_as_fallback(fake_model, monkeypatch):
+    monkeypatch.setattr(cognitive_service, "model", FakeModel("not json"))
+    failures = LLM_PARSE_FAILURES.value("cognitive")
+    fallbacks = LLM_FALLBACKS.value("cognitive", "error")
+
+    response = _analyze(age=33)
+    assert response.status_code == 200
+    assert LLM_PARSE_FAILURES.value("cognitive") == failures + 1
+    assert LLM_FALLBACKS.value("cognitive", "error") == fallbacks + 1
+
+
+def test_exposition_format():
+    histogram = Histogram("h_seconds", "Test histogram.", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "a")
+    counter = Counter("c_total", "Test counter.", ["kind"])
+    counter.inc('quote"d')
+
+    lines = histogram.render() + counter.render()
+    assert 'h_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'h_seconds_bucket{stage="a",le="1"} 3' in lines
+    assert 'h_seconds_bucket{stage="a",le="+Inf"} 4' in lines
+    assert 'h_seconds_sum{stage="a"} 4.05' in lines
+    assert 'h_seconds_count{stage="a"} 4' in lines
+    assert 'c_total{kind="quote\\"d"} 1' in lines
+
+
+def test_route_label_uses_path_template(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "store", JobStore(str(tmp_path / "jobs.sqlite3")))
+    assert client.get("/api/v1/jobs/abc123").status_code == 404
+    body = client.get("/metrics").text
+    assert 'route="/api/v1/jobs/{job_id}"' in body
+    assert "abc123" not in body
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.core.metrics import LLM_ROUTE_DECISIONS, LLM_TIER_CALLS
+from app.models.schemas import LLMInput
+from app.services import cognitive, gemini_service
+from app.services.cache import TTLCache
+from app.services.resilience import circuit_breaker
+from app.services.routing import ANALYSIS, FLASH, GUARDRAIL, PRO, TRIAGE, ModelRouter, model_router
+
+IMAGE = {"mime_type": "image/jpeg", "data": b"\xff\xd8scan"}
+ANSWERS = {
+    "is_relevant": {"is_relevant": True, "reason": "scan"},
+    "analysis": {"analysis": "Findings", "chart_data": {"cancer_types_probability": [],
+                                                        "risk_factors": [{"label": "Age", "value": 3}]}},
+    "triage_level": {"triage_level": "High", "risk_adjustment": 2, "explanation": "e", "recommendation": "r"},
+}
+
+
+class TierModel:
+    """Answers with the JSON its response schema asks for and records which model served each call."""
+    def __init__(self, name, calls, generation_config=None, fail=False, **kwargs):
+        self.name = name
+        self.calls = calls
+        self.fail = fail
+        properties = (generation_config or cognitive.GENERATION_CONFIG)["response_schema"]["properties"]
+        self.answer = json.dumps(next(a for key, a in ANSWERS.items() if key in properties))
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls.append(self.name)
+        if self.fail:
+            raise RuntimeError("upstream error")
+        return SimpleNamespace(text=self.answer, usage_metadata=None)
+
+
+class TierProvider:
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def enabled(self):
+        return True
+
+    def model(self, model_name, **kwargs):
+        return TierModel(model_name, self.calls, fail=model_name in self.fail, **kwargs)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = TierProvider()
+    monkeypatch.setattr(gemini_service, "llm_provider", provider)
+    monkeypatch.setattr(gemini_service, "_clients", {})
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(cognitive, "llm_provider", provider)
+    return provider
+
+
+def _router(**kwargs):
+    options = {"models": {FLASH: "test-flash", PRO: "test-pro"}, "enabled": True, "pro_min_tokens": 100,
+               "min_samples": 5, "max_error_rate": 0.2, "max_p95_s": 1.0}
+    return ModelRouter(**{**options, **kwargs})
+
+
+def test_routes_by_task_input_size_and_image():
+    router = _router()
+    assert router.route(GUARDRAIL, 5000, has_image=True).tier == FLASH
+    assert router.route(ANALYSIS, 20, has_image=True).tier == PRO
+    assert router.route(ANALYSIS, 20).tier == FLASH
+    long_text = router.route(ANALYSIS, 100)
+    assert (long_text.tier, long_text.model_name, long_text.reason) == (PRO, "test-pro", "long_input")
+    assert router.route(TRIAGE, 80).tier == FLASH
+
+    static = _router(enabled=False)
+    assert [static.route(task, 20).tier for task in (GUARDRAIL, ANALYSIS, TRIAGE)] == [FLASH, PRO, FLASH]
+
+
+def test_unhealthy_tier_hands_over_to_the_other():
+    router = _router()
+    before = LLM_ROUTE_DECISIONS.value(ANALYSIS, FLASH, "pro_unhealthy")
+    route = router.route(ANALYSIS, 20, has_image=True)
+    for ok in (True, True, True, False, False):
+        router.record(route, 0.1, ok)
+    # 40% errors over the last 5 calls
+    assert not router.healthy(PRO)
+    rerouted = router.route(ANALYSIS, 20, has_image=True)
+    assert (rerouted.tier, rerouted.reason) == (FLASH, "pro_unhealthy")
+    assert LLM_ROUTE_DECISIONS.value(ANALYSIS, FLASH, "pro_unhealthy") == before + 1
+
+    # Slow is unhealthy too; with both tiers unhealthy calls stay where they were
+    for _ in range(5):
+        router.record(router.route(GUARDRAIL, 10), 2.5, True)
+    assert router.tier_stats[FLASH].p95() == 2.5
+    assert router.route(GUARDRAIL, 10).tier == FLASH
+    stats = router.stats()["tiers"]
+    assert stats[PRO]["error_rate"] == 0.4 and stats[FLASH]["healthy"] is False
+
+
+def test_unhealthy_tier_recovers_once_its_failures_age_out():
+    now = [0.0]
+    router = _router(window_s=30.0, clock=lambda: now[0])
+    for _ in range(5):
+        router.record(router.route(GUARDRAIL, 10), 0.1, ok=False)
+    assert router.route(GUARDRAIL, 10).tier == PRO
+    # Traffic to the other tier does not help...
+    for _ in range(50):
+        now[0] += 0.1
+        router.record(router.route(TRIAGE, 10), 0.1, ok=True)
+    assert not router.healthy(FLASH)
+    # ...but time does
+    now[0] = 31.0
+    assert router.healthy(FLASH) and len(router.tier_stats[FLASH]) == 0
+    assert router.route(GUARDRAIL, 10).tier == FLASH
+
+
+def test_open_circuit_marks_a_tier_unhealthy():
+    router = _router(models={FLASH: "routing-test-flash", PRO: "routing-test-pro"})
+    breaker = circuit_breaker("routing-test-flash")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert router.route(GUARDRAIL, 10).tier == PRO
+
+
+def test_gemini_calls_use_the_routed_tier(provider):
+    ok_before = LLM_TIER_CALLS.value(PRO, ANALYSIS, "ok")
+    assert asyncio.run(gemini_service.check_relevance(["cough", IMAGE])) == (True, "scan")
+    analysis, chart = asyncio.run(gemini_service.analyze_oncology(["cough"]))
+    assert analysis == "Findings" and chart["risk_factors"] == {"Age": 3}
+    asyncio.run(gemini_service.analyze_oncology(["cough", IMAGE]))
+    assert provider.calls == [model_router.models[FLASH], model_router.models[FLASH], model_router.models[PRO]]
+    assert LLM_TIER_CALLS.value(PRO, ANALYSIS, "ok") == ok_before + 1
+    assert len(model_router.tier_stats[FLASH]) == 2
+
+
+def test_failed_calls_count_against_their_tier(provider, monkeypatch):
+    provider.fail = (model_router.models[PRO],)
+    monkeypatch.setattr(gemini_service.analysis_calls[PRO], "max_retries", 0)
+    analysis, chart = asyncio.run(gemini_service.analyze_oncology(["cough", IMAGE]))
+    assert analysis.startswith("Error during analysis") and chart is None
+    assert model_router.tier_stats[PRO].error_rate() == 1.0
+
+
+def test_long_triage_prompts_go_to_the_pro_tier(provider, monkeypatch):
+    monkeypatch.setattr(model_router, "pro_min_tokens", 10)
+    service = cognitive.CognitiveService(cache=TTLCache(max_size=0))
+    case = LLMInput(cancer_type="lung", ml_confidence=0.6, preliminary_cri=55, symptoms=["cough"], age=60,
+                    risk_factors=[])
+    assert asyncio.run(service.analyze_async(case)).triage_level == "High"
+    assert provider.calls == [model_router.models[PRO]]
+
+
+def test_router_stats_are_reported():
+    stats = TestClient(app).get("/api/v1/ai-analyze/stats").json()["model_router"]
+    assert set(stats["tiers"]) == {FLASH, PRO}
+    assert stats["tiers"][PRO]["model"] == model_router.models[PRO]
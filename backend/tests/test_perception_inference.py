@@ -0,0 +1,94 @@
+import asyncio
+import io
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.inference import MicroBatcher, NumpyBackend
+from app.services.perception import PerceptionService
+
+
+def _scan(noise_sd, seed=0):
+    rng = np.random.default_rng(seed)
+    pixels = np.clip(120 + rng.normal(0, noise_sd, (64, 64)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = PerceptionService(backend="numpy")
+    service.load()
+    return service
+
+
+def test_models_load_once_per_cancer_type(service):
+    assert set(service.models) == {"brain", "lung", "breast", "default"}
+    model = service.models["lung"]
+    service.predict(_scan(0), "lung")
+    assert service.models["lung"] is model
+
+
+def test_predictions_are_deterministic(service):
+    smooth = service.predict(_scan(0), "lung")
+    textured = service.predict(_scan(80), "lung")
+    assert smooth.prediction == "normal"
+    assert textured.prediction == "suspected"
+    assert service.predict(_scan(80), "lung") == textured
+
+
+def test_unknown_cancer_type_uses_default_model(service):
+    assert service.predict(_scan(40), "pancreas") == service.predict(_scan(40), "default")
+
+
+def test_concurrent_requests_are_micro_batched(service):
+    images = [_scan(sd, seed=i) for i, sd in enumerate([0, 10, 20, 40, 80] * 8)]
+    expected = [service.predict(img, "brain") for img in images]
+
+    async def scenario():
+        return await asyncio.gather(*(service.predict_async(img, "brain") for img in images))
+
+    before = service.batchers["brain"].stats()["batches"] if "brain" in service.batchers else 0
+    results = asyncio.run(scenario())
+    stats = service.batchers["brain"].stats()
+    assert results == expected
+    assert stats["batches"] - before < len(images) / 4
+
+
+def test_undecodable_image_fails_only_its_caller(service):
+    async def scenario():
+        return await asyncio.gather(
+            service.predict_async(_scan(0), "lung"),
+            service.predict_async(b"broken", "lung"),
+            return_exceptions=True,
+        )
+
+    good, bad = asyncio.run(scenario())
+    assert good.prediction == "normal"
+    assert isinstance(bad, ValueError)
+
+
+def test_batcher_flushes_partial_batch_after_max_wait():
+    batcher = MicroBatcher(lambda items: [i * 2 for i in items], max_batch_size=64, max_wait_ms=20)
+
+    async def scenario():
+        start = time.perf_counter()
+        result = await batcher.submit(21)
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == 42
+    assert elapsed < 0.5
+
+
+def test_onnx_backend_matches_numpy():
+    pytest.importorskip("onnxruntime")
+    from app.services.inference import OnnxBackend
+
+    numpy_model = NumpyBackend("data/models/perception_lung.npz")
+    onnx_model = OnnxBackend("data/models/perception_lung.onnx")
+    batch = np.random.default_rng(1).random((8, 64, 64), dtype=np.float32)
+    assert np.allclose(numpy_model.run(batch), onnx_model.run(batch), atol=1e-5)
@@ -0,0 +1,169 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.api.routes import analysis
+from app.core.config import settings
+from app.core.metrics import LLM_BUDGET_ACTIONS, LLM_CALL_TOKENS, LLM_FALLBACKS, record_usage
+from app.models.schemas import LLMInput
+from app.services import gemini_service, prompts
+from app.services.cache import TTLCache
+from app.services.cognitive import CognitiveService
+from app.services.prompts import PromptTemplate, available_versions, load_prompt
+from app.services.tokens import TRUNCATION_MARKER, PromptTooLargeError, TokenBudget, estimate_tokens
+
+CASE = LLMInput(cancer_type="lung", ml_confidence=0.7, preliminary_cri=55,
+                symptoms=["persistent cough"], age=61, risk_factors=["smoking"])
+
+LLM_JSON = json.dumps({"triage_level": "High", "risk_adjustment": 3,
+                       "explanation": "Stub explanation.", "recommendation": "Stub recommendation."})
+
+
+class RecordingModel:
+    def __init__(self, text=LLM_JSON):
+        self.text = text
+        self.contents = []
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.contents.append(contents)
+        return SimpleNamespace(text=self.text, usage_metadata=None)
+
+
+@pytest.fixture
+def prompt_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "prompts" / "demo"
+    directory.mkdir(parents=True)
+    for version in ("v1", "v2", "v10"):
+        (directory / f"{version}.system.txt").write_text(f"System {version}.\n")
+    (directory / "v2.user.txt").write_text("Hello $name, you are $age.\n")
+    monkeypatch.setattr(prompts, "PROMPT_DIR", str(tmp_path / "prompts"))
+    load_prompt.cache_clear()
+    yield
+    load_prompt.cache_clear()
+
+
+def test_latest_version_is_loaded_once(prompt_dir):
+    assert available_versions("demo") == ["v1", "v2", "v10"]
+    latest = load_prompt("demo")
+    assert latest.version == "v10"
+    assert latest.system == "System v10."
+    assert load_prompt("demo") is latest
+
+
+def test_pinned_version_and_rendering(prompt_dir, monkeypatch):
+    monkeypatch.setattr(settings, "prompt_versions", {"demo": "v2"})
+    prompt = load_prompt("demo")
+    assert prompt.version == "v2"
+    assert prompt.render(name="Ada", age=61) == "Hello Ada, you are 61."
+    with pytest.raises(ValueError):
+        prompt.render(name="Ada")
+    with pytest.raises(ValueError):
+        load_prompt("missing")
+
+
+def test_fingerprint_tracks_prompt_text():
+    a = PromptTemplate("p", "v1", "system", "user $x")
+    assert a.fingerprint == PromptTemplate("p", "v1", "system", "user $x").fingerprint
+    assert a.fingerprint != PromptTemplate("p", "v1", "system!", "user $x").fingerprint
+
+
+def test_cognitive_request_carries_only_the_case():
+    model = RecordingModel()
+    service = CognitiveService(cache=TTLCache(max_size=0))
+    service.model = model
+    result = asyncio.run(service.analyze_async(CASE))
+    assert result.triage_level == "High"
+
+    sent = model.contents[0]
+    assert "decision-support assistant" not in sent
+    assert '"age": 61' in sent
+    assert '"symptoms": ["persistent cough"]' in sent
+
+
+def test_gemini_calls_send_only_user_parts(monkeypatch):
+    guardrail = RecordingModel(json.dumps({"is_relevant": True, "reason": "ok"}))
+    analysis_model = RecordingModel("analysis text")
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_service, "model_flash", guardrail)
+    monkeypatch.setattr(gemini_service, "model_pro", analysis_model)
+
+    asyncio.run(gemini_service.check_relevance(["persistent cough"]))
+    asyncio.run(gemini_service.analyze_oncology(["persistent cough"]))
+    assert guardrail.contents == [["persistent cough"]]
+    assert analysis_model.contents == [["persistent cough"]]
+    options = dict(gemini_service.warmup_models())
+    assert all("system_instruction" in o for o in options.values())
+
+
+def test_budget_trims_text_at_a_word_boundary():
+    budget = TokenBudget("test", max_tokens=50, policy="trim")
+    text = "word " * 100
+    trimmed = budget.fit_text(text)
+    assert trimmed.endswith(TRUNCATION_MARKER)
+    assert estimate_tokens(trimmed) <= 50
+    assert trimmed[:-len(TRUNCATION_MARKER)].endswith("word")
+    assert budget.fit_text("short") == "short"
+
+
+def test_budget_trims_lists_in_order():
+    budget = TokenBudget("test", max_tokens=20, policy="trim")
+    items = ["a" * 16, "b" * 100, "c" * 8]
+    fitted = budget.fit_items(items)
+    assert fitted[0] == items[0]
+    assert len(fitted) == 2
+    assert fitted[1].startswith("b") and fitted[1].endswith(TRUNCATION_MARKER)
+    assert sum(estimate_tokens(i) for i in fitted) <= 20
+
+
+def test_budget_rejects_when_configured():
+    budget = TokenBudget("test", max_tokens=10, policy="reject")
+    before = LLM_BUDGET_ACTIONS.value("test", "rejected")
+    with pytest.raises(PromptTooLargeError):
+        budget.fit_text("x" * 100)
+    assert LLM_BUDGET_ACTIONS.value("test", "rejected") == before + 1
+    assert TokenBudget("test", max_tokens=0, policy="reject").fit_text("x" * 100) == "x" * 100
+
+
+def test_oversized_case_falls_back_without_calling_the_model():
+    model = RecordingModel()
+    service = CognitiveService(cache=TTLCache(max_size=0))
+    service.model = model
+    service.budget = TokenBudget("cognitive", max_tokens=5, policy="reject")
+    before = LLM_FALLBACKS.value("cognitive", "oversized")
+    result = asyncio.run(service.analyze_async(CASE))
+    assert model.contents == []
+    assert result.explanation == service._mock_response(CASE).explanation
+    assert LLM_FALLBACKS.value("cognitive", "oversized") == before + 1
+
+
+def test_ai_analyze_route_applies_the_budget(monkeypatch):
+    received = []
+
+    async def run_ai_analysis(content_parts):
+        received.append(content_parts)
+        return {"is_relevant": True}
+
+    monkeypatch.setattr(analysis, "run_ai_analysis", run_ai_analysis)
+    client = TestClient(app)
+
+    monkeypatch.setattr(gemini_service.input_budget, "max_tokens", 20)
+    monkeypatch.setattr(gemini_service.input_budget, "policy", "trim")
+    assert client.post("/api/v1/ai-analyze", data={"text": "cough " * 100}).status_code == 200
+    assert received[0][0].endswith(TRUNCATION_MARKER)
+
+    monkeypatch.setattr(gemini_service.input_budget, "policy", "reject")
+    response = client.post("/api/v1/ai-analyze", data={"text": "cough " * 100})
+    assert response.status_code == 413
+    assert len(received) == 1
+
+
+def test_per_call_token_usage_is_recorded():
+    before = LLM_CALL_TOKENS.count("budget-test", "prompt")
+    usage = SimpleNamespace(prompt_token_count=300, candidates_token_count=80)
+    record_usage("budget-test", SimpleNamespace(usage_metadata=usage))
+    assert LLM_CALL_TOKENS.count("budget-test", "prompt") == before + 1
+    assert LLM_CALL_TOKENS.count("budget-test", "output") == 1
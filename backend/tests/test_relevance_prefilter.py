@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.services import gemini_service, pipeline
+from app.services.relevance import (
+    CLASSIFIERS, LexiconClassifier, RelevanceClassifier, RelevancePrefilter,
+    evaluate, load_classifier, load_labeled_examples, relevance_prefilter,
+)
+
+
+class FixedScore(RelevanceClassifier):
+    name = "fixed"
+
+    def __init__(self, value=0.5):
+        self.value = value
+
+    def score(self, text):
+        return self.value
+
+
+def test_offline_accuracy_on_labeled_set():
+    prefilter = RelevancePrefilter(LexiconClassifier(), accept_threshold=0.9, reject_threshold=0.1)
+    report = evaluate(prefilter, load_labeled_examples())
+    assert report["examples"] >= 60
+    # Rejecting a genuine medical question is the costly mistake.
+    assert report["false_rejects"] == 0
+    assert report["accuracy"] >= 0.95
+    assert report["coverage"] >= 0.6
+
+
+def test_thresholds_route_to_llm():
+    prefilter = RelevancePrefilter(FixedScore(0.5), accept_threshold=0.9, reject_threshold=0.1)
+    assert prefilter.decide("anything") is None
+    prefilter.classifier.value = 0.95
+    assert prefilter.decide("anything")[0] is True
+    prefilter.classifier.value = 0.05
+    assert prefilter.decide("anything")[0] is False
+    assert prefilter.stats()["llm_calls_avoided"] == 2
+    assert prefilter.stats()["escalated"] == 1
+
+
+def test_invalid_thresholds_rejected():
+    with pytest.raises(ValueError):
+        RelevancePrefilter(FixedScore(), accept_threshold=0.2, reject_threshold=0.4)
+
+
+def test_classifier_plugins():
+    assert isinstance(load_classifier("lexicon"), LexiconClassifier)
+    plugin = load_classifier("tests.test_relevance_prefilter:FixedScore")
+    assert plugin.name == "fixed"
+    assert "lexicon" in CLASSIFIERS
+    with pytest.raises(ValueError):
+        load_classifier("does-not-exist")
+
+
+@pytest.fixture
+def counting_gemini(monkeypatch):
+    calls = {"guardrail": 0, "analysis": 0}
+
+    async def check_relevance(parts):
+        calls["guardrail"] += 1
+        return True, "stub"
+
+    async def analyze_oncology(parts):
+        calls["analysis"] += 1
+        return "stub analysis", None
+
+    monkeypatch.setattr(gemini_service, "check_relevance", check_relevance)
+    monkeypatch.setattr(gemini_service, "analyze_oncology", analyze_oncology)
+    monkeypatch.setattr(relevance_prefilter, "enabled", True)
+    return calls
+
+
+def test_clear_cases_skip_llm_guardrail(counting_gemini):
+    off_topic = asyncio.run(pipeline.run_ai_analysis(["Write a Python function to sort a list."]))
+    on_topic = asyncio.run(pipeline.run_ai_analysis(["Biopsy confirmed metastatic carcinoma in the liver."]))
+
+    assert off_topic["is_relevant"] is False
+    assert on_topic["is_relevant"] is True
+    assert on_topic["analysis"] == "stub analysis"
+    assert counting_gemini == {"guardrail": 0, "analysis": 1}
+
+
+def test_uncertain_and_image_inputs_escalate(counting_gemini):
+    asyncio.run(pipeline.run_ai_analysis(["Hello, how are you today?"], mode="serial"))
+    asyncio.run(pipeline.run_ai_analysis(["Biopsy confirmed carcinoma", object()], mode="serial"))
+    assert counting_gemini["guardrail"] == 2
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from tests.conftest import make_png
+from tools.gemini_stub import StubConfig, create_app
+from app.core.metrics import LLM_FALLBACKS, LLM_RESILIENCE_EVENTS
+from app.services.cache import TTLCache
+from app.services.cognitive import cognitive_service
+from app.services.llm import StubModel
+from app.services.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResilientCall, RetryBudget
+)
+from app.services.triage_rules import triage_rules
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _policy(**kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker("test", failure_threshold=3, reset_timeout_s=10))
+    kwargs.setdefault("budget", RetryBudget(ratio=0.5, max_tokens=5))
+    kwargs.setdefault("max_retries", 0)
+    kwargs.setdefault("hedge_percentile", 0)
+    kwargs.setdefault("backoff_base_s", 0.001)
+    return ResilientCall("test", "test-upstream", **kwargs)
+
+
+def test_breaker_opens_and_recovers_through_a_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("unit", failure_threshold=3, reset_timeout_s=10, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()  # the single half-open probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_cancelled_probe_does_not_wedge_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker("unit", failure_threshold=1, reset_timeout_s=1, clock=clock)
+    breaker.record_failure()
+    clock.now = 1
+    policy = _policy(breaker=breaker)
+
+    async def scenario():
+        task = asyncio.create_task(policy.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.allow()
+
+
+def test_retries_with_budget():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("503")
+        return "ok"
+
+    policy = _policy(max_retries=2)
+    assert asyncio.run(policy.call(flaky)) == "ok"
+    assert calls == 2
+
+    async def always_fails():
+        raise RuntimeError("503")
+
+    broke = _policy(max_retries=5, budget=RetryBudget(ratio=0.0, max_tokens=1))
+    with pytest.raises(RuntimeError):
+        asyncio.run(broke.call(always_fails))
+    # One retry paid for by the single token, then the budget is empty
+    assert broke.budget.tokens == 0
+
+
+def test_hedged_request_beats_a_slow_first_attempt():
+    calls = 0
+
+    async def attempt():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(1.0 if calls == 1 else 0.01)
+        return calls
+
+    policy = _policy(hedge_percentile=95, hedge_min_samples=5)
+    for _ in range(5):
+        policy.latency.add(0.02)
+    hedges_won = LLM_RESILIENCE_EVENTS.value("test", "hedge_won")
+
+    start = time.perf_counter()
+    assert asyncio.run(policy.call(attempt)) == 2
+    assert time.perf_counter() - start < 0.3
+    assert LLM_RESILIENCE_EVENTS.value("test", "hedge_won") == hedges_won + 1
+
+
+def test_no_hedge_before_enough_samples():
+    async def attempt():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    policy = _policy(hedge_percentile=95, hedge_min_samples=5)
+    hedges = LLM_RESILIENCE_EVENTS.value("test", "hedge")
+    for _ in range(5):
+        assert asyncio.run(policy.call(attempt)) == "ok"
+    assert LLM_RESILIENCE_EVENTS.value("test", "hedge") == hedges
+    assert len(policy.latency) == 5
+
+
+@pytest.fixture
+def faulty_stub(monkeypatch):
+    """Cognitive service pointed at a stand-in that fails every call."""
+    config = StubConfig(latency="fixed:5", error_rate=1.0, seed=0)
+    stub = create_app(config)
+    clock = FakeClock()
+    model = StubModel("http://gemini-stub", "gemini-1.5-flash", transport=httpx.ASGITransport(app=stub),
+                      system_instruction=cognitive_service.prompt.system)
+    monkeypatch.setattr(cognitive_service, "model", model)
+    monkeypatch.setattr(cognitive_service, "cache", TTLCache(max_size=0))
+    monkeypatch.setattr(cognitive_service, "_semaphore", None)
+    monkeypatch.setattr(cognitive_service.resilience, "breaker",
+                        CircuitBreaker("stub", failure_threshold=3, reset_timeout_s=30, clock=clock))
+    monkeypatch.setattr(cognitive_service.resilience, "max_retries", 0)
+    monkeypatch.setattr(triage_rules, "enabled", False)
+    return stub, config, clock
+
+
+def _analyze(client):
+    response = client.post(
+        "/api/v1/analyze",
+        params={"cancer_type": "lung", "age": 61, "symptoms": json.dumps(["cough"]), "risk_factors": "[]"},
+        files={"file": ("scan.png", make_png(), "image/png")},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_breaker_short_circuits_a_failing_stub(faulty_stub):
+    stub, config, clock = faulty_stub
+    client = TestClient(app)
+    short_circuits = LLM_FALLBACKS.value("cognitive", "circuit_open")
+
+    for _ in range(6):
+        result = _analyze(client)
+        assert not result["explanation"].startswith("Stub explanation")
+    # Three failures opened the circuit; the other three never reached the stub
+    assert stub.state.calls["triage"] == 3
+    assert LLM_FALLBACKS.value("cognitive", "circuit_open") == short_circuits + 3
+
+    # Upstream recovers: after the reset timeout a probe closes the circuit again
+    config.error_rate = 0.0
+    clock.now = 30
+    assert _analyze(client)["explanation"].startswith("Stub explanation")
+    assert cognitive_service.resilience.breaker.state == CLOSED
+    assert stub.state.calls["triage"] == 4
+
+
+def test_open_circuit_skips_guardrail_wait(monkeypatch):
+    from app.services import gemini_service
+
+    breaker = CircuitBreaker("guardrail-test", failure_threshold=1, reset_timeout_s=60)
+    breaker.record_failure()
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_service.guardrail_call, "breaker", breaker)
+    is_relevant, reason = asyncio.run(gemini_service.check_relevance(["persistent cough"]))
+    assert is_relevant is True
+    assert "unavailable" in reason
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(_policy(breaker=breaker).call(lambda: asyncio.sleep(0)))
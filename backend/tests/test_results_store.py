@@ -0,0 +1,171 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.core.metrics import RESULT_RECORDS
+from app.models.schemas import FinalResult, PatientInput, PerceptionOutput
+from app.services import pipeline
+from app.services.results import ResultRecorder, ResultStore, TRIAGE
+from app.services.triage_rules import triage_rules
+
+
+def _result(cancer_type="lung", level="High", cri=70) -> FinalResult:
+    return FinalResult(
+        cancer_type=cancer_type, ml_confidence=0.8, preliminary_cri=cri, final_cri=cri, triage_level=level,
+        explanation="e", recommendation="r", hospital_recommendation=None
+    )
+
+
+def _row(created_at, cancer_type="lung", level="High", cri=70) -> tuple:
+    return (created_at, cancer_type, level, 0.8, cri, cri, "e", "r", None)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "store.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_records_are_buffered_until_flushed(store):
+    recorder = ResultRecorder(store, batch_size=2)
+    recorder.record_triage(_result())
+    recorder.record_ai_analysis({"is_relevant": True, "analysis": "a", "chart_data": {"x": [1]},
+                                 "mode": "serial", "timings_ms": {"total": 12.5}}, "key")
+    recorder.record_triage(_result(level="Low"))
+    assert store.query_triage()["items"] == []
+    assert recorder.pending() == 3
+
+    assert recorder.flush_now() == 3
+    assert recorder.pending() == 0
+    assert [r["triage_level"] for r in store.query_triage()["items"]] == ["Low", "High"]
+    analysis = store.query_ai_analyses()["items"][0]
+    assert analysis["is_relevant"] is True
+    assert analysis["chart_data"] == {"x": [1]}
+    assert analysis["total_ms"] == 12.5
+    assert recorder.stats()["written"] == 3
+
+
+def test_background_flush_and_final_flush_on_stop(store):
+    async def scenario():
+        recorder = ResultRecorder(store, flush_interval_s=60, batch_size=3)
+        await recorder.start()
+        for _ in range(3):
+            recorder.record_triage(_result())
+        # A full batch wakes the flusher without waiting for the interval
+        for _ in range(100):
+            if not recorder.pending():
+                break
+            await asyncio.sleep(0.01)
+        assert recorder.written == 3
+
+        recorder.record_triage(_result())
+        await recorder.stop()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.pending() == 0
+    assert len(store.query_triage(limit=10)["items"]) == 4
+
+
+def test_full_buffer_drops_the_oldest_records(store):
+    recorder = ResultRecorder(store, max_buffer=2)
+    before = RESULT_RECORDS.value(TRIAGE, "dropped")
+    for cri in (10, 20, 30):
+        recorder.record_triage(_result(cri=cri))
+    assert recorder.dropped == 1
+    assert RESULT_RECORDS.value(TRIAGE, "dropped") == before + 1
+    recorder.flush_now()
+    assert sorted(r["final_cri"] for r in store.query_triage()["items"]) == [20, 30]
+
+
+def test_disabled_recorder_keeps_nothing(store):
+    recorder = ResultRecorder(store, enabled=False)
+    recorder.record_triage(_result())
+    assert recorder.pending() == 0
+
+
+def test_keyset_pages_cover_every_row_once(store):
+    # Equal timestamps make the id tie-breaker matter
+    store.insert_many([(TRIAGE, _row(1000.0 + i // 3, level="High" if i % 2 else "Low")) for i in range(25)])
+    seen, cursor = [], None
+    while True:
+        page = store.query_triage(limit=4, cursor=cursor)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 25 and len(set(seen)) == 25
+    assert seen == sorted(seen, reverse=True)
+
+    # New rows arriving mid-scan don't shift later pages
+    first = store.query_triage(triage_level="High", limit=5)
+    store.insert_many([(TRIAGE, _row(2000.0, level="High"))])
+    second = store.query_triage(triage_level="High", limit=5, cursor=first["next_cursor"])
+    assert {i["id"] for i in first["items"]}.isdisjoint(i["id"] for i in second["items"])
+    assert [i["id"] for i in second["items"]] == [14, 12, 10, 8, 6]
+
+
+def test_filters(store):
+    store.insert_many([
+        (TRIAGE, _row(100.0, "lung", "High", 80)),
+        (TRIAGE, _row(200.0, "lung", "Low", 10)),
+        (TRIAGE, _row(300.0, "breast", "High", 75)),
+    ])
+    assert [r["final_cri"] for r in store.query_triage(cancer_type="lung")["items"]] == [10, 80]
+    assert [r["cancer_type"] for r in store.query_triage(triage_level="High", min_cri=78)["items"]] == ["lung"]
+    assert [r["created_at"] for r in store.query_triage(since=150, until=300)["items"]] == [200.0]
+    with pytest.raises(ValueError):
+        store.query_triage(cursor="not-a-cursor")
+
+
+@pytest.mark.parametrize("filters, index", [
+    ("cancer_type = ?", "idx_triage_cancer_created"),
+    ("triage_level = ?", "idx_triage_level_created"),
+    ("created_at >= ?", "idx_triage_created"),
+])
+def test_queries_use_an_index(store, filters, index):
+    plan = " ".join(store.query_plan(
+        f"SELECT * FROM triage_results WHERE {filters} AND (created_at, id) < (?, ?) "
+        f"ORDER BY created_at DESC, id DESC LIMIT 50", ("x", 1.0, 1)
+    ))
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_cri_range_uses_the_cri_index(store):
+    plan = " ".join(store.query_plan(
+        "SELECT * FROM triage_results WHERE final_cri >= ? AND final_cri <= ? "
+        "ORDER BY created_at DESC, id DESC LIMIT 50", (90, 95)
+    ))
+    assert "idx_triage_cri_created" in plan and "SCAN" not in plan
+
+
+def test_completed_triage_is_recorded(monkeypatch, _isolated_results_store):
+    monkeypatch.setattr(triage_rules, "enabled", True)
+    case = PatientInput(cancer_type="lung", age=45, symptoms=[], risk_factors=[])
+    start = time.perf_counter()
+    asyncio.run(pipeline.complete_triage(case, PerceptionOutput(prediction="normal", confidence=0.9), 0))
+    assert time.perf_counter() - start < 1.0
+    assert pipeline.result_recorder.pending() == 1
+    pipeline.result_recorder.flush_now()
+    assert _isolated_results_store.query_triage()["items"][0]["triage_level"] == "Low"
+
+
+def test_results_endpoints(_isolated_results_store):
+    _isolated_results_store.insert_many([(TRIAGE, _row(float(i))) for i in range(1, 6)])
+    client = TestClient(app)
+    first = client.get("/api/v1/results/triage", params={"limit": 3}).json()
+    assert len(first["items"]) == 3
+    second = client.get("/api/v1/results/triage", params={"limit": 3, "cursor": first["next_cursor"]}).json()
+    assert [i["created_at"] for i in second["items"]] == [2.0, 1.0]
+    assert second["next_cursor"] is None
+
+    since = client.get("/api/v1/results/triage", params={"since": "1970-01-01T00:00:04Z"}).json()
+    assert len(since["items"]) == 2
+    assert client.get("/api/v1/results/triage", params={"cursor": "bogus"}).status_code == 400
+    assert client.get("/api/v1/results/ai-analyses").json() == {"items": [], "next_cursor": None}
+    assert client.get("/api/v1/results/stats").json()["enabled"] is True
@@ -0,0 +1,397 @@
+import asyncio
+import io
+import struct
+import tracemalloc
+import zlib
+
+import numpy as np
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from main import app
+from app.api.routes import analysis
+from app.core.config import settings
+from app.services.ingestion import ingest_image, ingest_scan
+from app.services.perception import perception_service
+from app.services.tiling import (
+    DICOM, TIFF, DicomSource, MappedFile, Tile, TiffSource, UnsupportedScanError, open_scan, select_regions,
+    sniff_format, tissue_score,
+)
+
+EXPLICIT_LE = b"1.2.840.10008.1.2.1\x00"
+IMPLICIT_LE = b"1.2.840.10008.1.2\x00"
+
+
+# --- Synthetic files -------------------------------------------------------------------------
+
+def _element(group, element, vr, value, explicit=True):
+    if len(value) % 2:
+        value += b" " if vr in (b"CS", b"DS", b"IS") else b"\x00"
+    if not explicit:
+        return struct.pack("<HHI", group, element, len(value)) + value
+    if vr in (b"OB", b"OW", b"SQ", b"UN"):
+        return struct.pack("<HH", group, element) + vr + b"\x00\x00" + struct.pack("<I", len(value)) + value
+    return struct.pack("<HH", group, element) + vr + struct.pack("<H", len(value)) + value
+
+
+def write_dicom(path, frames, explicit=True, window=None, intercept=-1024, photometric=b"MONOCHROME2"):
+    """Multi-frame uncompressed DICOM of int16 `frames` (N, rows, cols) stored as raw + `intercept`."""
+    syntax = EXPLICIT_LE if explicit else IMPLICIT_LE
+    meta = _element(0x0002, 0x0010, b"UI", syntax)
+    meta = _element(0x0002, 0x0000, b"UL", struct.pack("<I", len(meta))) + meta
+    us = lambda v: struct.pack("<H", v)
+    n, rows, cols = frames.shape
+    # An undefined-length sequence with a nested item, to be skipped
+    item = _element(0x0008, 0x1150, b"UI", b"1.2.3\x00", explicit)
+    sequence = (struct.pack("<HH", 0x0008, 0x1140) + (b"SQ\x00\x00" if explicit else b"") + struct.pack("<I", 0xFFFFFFFF)
+                + struct.pack("<HHI", 0xFFFE, 0xE000, 0xFFFFFFFF) + item + struct.pack("<HHI", 0xFFFE, 0xE00D, 0)
+                + struct.pack("<HHI", 0xFFFE, 0xE0DD, 0))
+    dataset = [
+        sequence,
+        _element(0x0028, 0x0002, b"US", us(1), explicit),
+        _element(0x0028, 0x0004, b"CS", photometric, explicit),
+        _element(0x0028, 0x0008, b"IS", str(n).encode(), explicit),
+        _element(0x0028, 0x0010, b"US", us(rows), explicit),
+        _element(0x0028, 0x0011, b"US", us(cols), explicit),
+        _element(0x0028, 0x0100, b"US", us(16), explicit),
+        _element(0x0028, 0x0103, b"US", us(1), explicit),
+    ]
+    if window is not None:
+        dataset.append(_element(0x0028, 0x1050, b"DS", f"{window[0]}\\{window[0]}".encode(), explicit))
+        dataset.append(_element(0x0028, 0x1051, b"DS", str(window[1]).encode(), explicit))
+    dataset.append(_element(0x0028, 0x1052, b"DS", str(intercept).encode(), explicit))
+    dataset.append(_element(0x0028, 0x1053, b"DS", b"1", explicit))
+    pixels = (frames.astype(np.int32) - intercept).astype("<i2").tobytes()
+    dataset.append(_element(0x7FE0, 0x0010, b"OW", pixels, explicit))
+    with open(path, "wb") as f:
+        f.write(b"\x00" * 128 + b"DICM" + meta + b"".join(dataset))
+    return path
+
+
+def write_tiff(path, height, width, tile=None, compression=1, predictor=1, tile_fn=None, pixels=None, samples=3):
+    """
+    Classic little-endian TIFF, tiled (`tile`) or a single uncompressed strip per
+    row band. Tiles come from `tile_fn(x, y, w, h)` (written one at a time, so
+    big files never exist in memory) or are cut from `pixels`.
+    """
+    if tile_fn is None:
+        def tile_fn(x, y, w, h):
+            return pixels[y:y + h, x:x + w].reshape(h, w, samples)
+
+    entries, offsets, counts = [], [], []
+    with open(path, "wb") as f:
+        f.write(b"II*\x00" + struct.pack("<I", 0))
+        if tile:
+            for y in range(0, height, tile):
+                for x in range(0, width, tile):
+                    block = np.zeros((tile, tile, samples), np.uint8)
+                    h, w = min(tile, height - y), min(tile, width - x)
+                    block[:h, :w] = tile_fn(x, y, w, h)
+                    if predictor == 2:
+                        block = np.diff(block, axis=1, prepend=np.zeros((tile, 1, samples), np.uint8))
+                    data = block.tobytes()
+                    if compression == 8:
+                        data = zlib.compress(data)
+                    offsets.append(f.tell())
+                    counts.append(len(data))
+                    f.write(data)
+        else:
+            rows = 16
+            for y in range(0, height, rows):
+                h = min(rows, height - y)
+                data = np.ascontiguousarray(tile_fn(0, y, width, h), np.uint8).tobytes()
+                offsets.append(f.tell())
+                counts.append(len(data))
+                f.write(data)
+
+        def array(values):
+            position = f.tell()
+            f.write(struct.pack(f"<{len(values)}I", *values))
+            return position
+
+        bits = array([8] * samples) if samples > 2 else None
+        offset_table, count_table = array(offsets), array(counts)
+        entries = [(256, 4, 1, width), (257, 4, 1, height),
+                   (258, 3, samples, bits if bits is not None else 8),
+                   (259, 3, 1, compression), (262, 3, 1, 2 if samples == 3 else 1), (277, 3, 1, samples)]
+        if tile:
+            entries += [(317, 3, 1, predictor), (322, 3, 1, tile), (323, 3, 1, tile),
+                        (324, 4, len(offsets), offset_table), (325, 4, len(counts), count_table)]
+        else:
+            entries += [(273, 4, len(offsets), offset_table), (278, 3, 1, 16), (279, 4, len(counts), count_table)]
+        if len(offsets) == 1:
+            entries = [(t, k, c, offsets[0] if t in (273, 324) else counts[0] if t in (279, 325) else v)
+                       for t, k, c, v in entries]
+        ifd = f.tell()
+        f.write(struct.pack("<H", len(entries)))
+        for tag, kind, count, value in sorted(entries):
+            packed = struct.pack("<H", value) + b"\x00\x00" if kind == 3 and count == 1 else struct.pack("<I", value)
+            f.write(struct.pack("<HHI", tag, kind, count) + packed)
+        f.write(struct.pack("<I", 0))
+        f.seek(4)
+        f.write(struct.pack("<I", ifd))
+    return path
+
+
+def slide_tile(tissue):
+    """Whole-slide-like content: white glass, with stained tissue in the (x, y) tiles of `tissue`."""
+    def tile_fn(x, y, w, h):
+        block = np.full((h, w, 3), 245, np.uint8)
+        if (x // 512, y // 512) in tissue:
+            rng = np.random.default_rng(x * 7 + y)
+            block[:] = rng.integers(0, 80, (h, w, 3), dtype=np.uint8) + np.array([140, 60, 130], np.uint8)
+        return block
+    return tile_fn
+
+
+def ct_series(n=40, size=64):
+    """HU volume: air everywhere, with a noisy soft-tissue disc in frames 12-27."""
+    frames = np.full((n, size, size), -1000, np.int16)
+    yy, xx = np.mgrid[:size, :size]
+    disc = (yy - size / 2) ** 2 + (xx - size / 2) ** 2 < (size / 3) ** 2
+    rng = np.random.default_rng(0)
+    for i in range(12, min(28, n)):
+        frames[i][disc] = rng.integers(-50, 150, disc.sum())
+    return frames
+
+
+def _open(path, kind):
+    with open(path, "rb") as f:
+        mapped = MappedFile(f)
+    return mapped, open_scan(mapped.buffer, kind)
+
+
+# --- Readers -------------------------------------------------------------------------------
+
+def test_sniffing():
+    assert sniff_format(b"\x00" * 128 + b"DICM") == DICOM
+    assert sniff_format(b"II*\x00rest") == TIFF and sniff_format(b"MM\x00+") == TIFF
+    assert sniff_format(b"\x89PNG\r\n") is None
+
+
+@pytest.mark.parametrize("explicit", [True, False])
+def test_dicom_frames_are_windowed_lazily(tmp_path, explicit):
+    frames = ct_series()
+    path = write_dicom(tmp_path / "ct.dcm", frames, explicit=explicit, window=(40, 400))
+    mapped, source = _open(path, DICOM)
+    try:
+        assert isinstance(source, DicomSource)
+        assert (source.frames, source.width, source.height) == (40, 64, 64)
+        air = source.read_tile(Tile(0, 0, 0, 64, 64))
+        assert air.dtype == np.uint8 and air.max() == 0
+        body = source.read_tile(Tile(20, 0, 0, 64, 64))
+        # Window 40/400 maps -160..240 HU onto 0..255
+        assert body[32, 32] == int(np.clip((int(frames[20, 32, 32]) + 160) * 255 / 400, 0, 255))
+    finally:
+        source.close()
+        mapped.close()
+
+
+def test_monochrome1_is_inverted(tmp_path):
+    path = write_dicom(tmp_path / "cr.dcm", ct_series(n=2), window=(40, 400), photometric=b"MONOCHROME1")
+    mapped, source = _open(path, DICOM)
+    try:
+        assert source.read_tile(Tile(0, 0, 0, 64, 64)).min() == 255
+    finally:
+        source.close()
+        mapped.close()
+
+
+@pytest.mark.parametrize("tile, compression, predictor", [(None, 1, 1), (64, 1, 1), (64, 8, 1), (64, 8, 2)])
+def test_tiff_regions_match_the_pixels(tmp_path, tile, compression, predictor):
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 255, (300, 210, 3), dtype=np.uint8)
+    path = write_tiff(tmp_path / "slide.tif", 300, 210, tile=tile, compression=compression, predictor=predictor,
+                      pixels=pixels)
+    mapped, source = _open(path, TIFF)
+    try:
+        assert isinstance(source, TiffSource)
+        source.tile_size = 100
+        for region in source.tiles():
+            expected = pixels[region.y:region.y + region.height, region.x:region.x + region.width]
+            assert np.array_equal(source.read_tile(region), expected)
+    finally:
+        source.close()
+        mapped.close()
+
+
+def test_pillow_written_tiff_is_read_lazily(tmp_path):
+    image = Image.fromarray(np.random.default_rng(2).integers(0, 255, (120, 90), dtype=np.uint8), mode="L")
+    path = tmp_path / "scan.tif"
+    image.save(path, format="TIFF")
+    mapped, source = _open(path, TIFF)
+    try:
+        assert np.array_equal(source.read_tile(Tile(0, 0, 0, 90, 120)), np.asarray(image))
+    finally:
+        source.close()
+        mapped.close()
+
+
+def test_unsupported_layouts_are_reported(tmp_path):
+    path = tmp_path / "lzw.tif"
+    Image.new("RGB", (64, 64), (200, 10, 10)).save(path, format="TIFF", compression="tiff_lzw")
+    with pytest.raises(UnsupportedScanError):
+        _open(path, TIFF)
+    with pytest.raises(UnsupportedScanError):
+        _open(write_tiff(tmp_path / "short.dcm", 8, 8, pixels=np.zeros((8, 8, 3), np.uint8)), DICOM)
+
+
+
+def test_deeply_nested_dicom_sequences_are_rejected(tmp_path):
+    meta = _element(0x0002, 0x0010, b"UI", EXPLICIT_LE)
+    meta = _element(0x0002, 0x0000, b"UL", struct.pack("<I", len(meta))) + meta
+    level = (struct.pack("<HH", 0x0008, 0x1140) + b"SQ\x00\x00" + struct.pack("<I", 0xFFFFFFFF)
+             + struct.pack("<HHI", 0xFFFE, 0xE000, 0xFFFFFFFF))
+    path = tmp_path / "nested.dcm"
+    # Deep enough to overflow the stack of a recursive parser
+    path.write_bytes(b"\x00" * 128 + b"DICM" + meta + level * 5000)
+    with pytest.raises(UnsupportedScanError, match="nested"):
+        _open(path, DICOM)
+
+
+# --- Region selection ----------------------------------------------------------------------
+
+def test_tissue_score_prefers_stained_tissue():
+    glass = np.full((64, 64, 3), 245, np.uint8)
+    tissue = np.random.default_rng(0).integers(60, 200, (64, 64, 3), dtype=np.uint8)
+    tissue[..., 1] //= 2
+    assert tissue_score(glass) == 0.0
+    assert tissue_score(tissue) > 0.5
+    assert tissue_score(np.zeros((64, 64), np.uint8)) == 0.0
+
+
+def test_slide_selection_finds_separate_tissue_regions(tmp_path):
+    tissue = {(1, 1), (2, 1), (5, 6), (6, 2)}
+    path = write_tiff(tmp_path / "slide.tif", 4096, 4096, tile=512, tile_fn=slide_tile(tissue))
+    mapped, source = _open(path, TIFF)
+    try:
+        selection = select_regions(source, count=3, overview_side=256)
+    finally:
+        source.close()
+        mapped.close()
+    chosen = [(t.x // 512, t.y // 512) for t, _, _ in selection.regions]
+    assert len(chosen) == 3 and set(chosen) <= tissue
+    # (1, 1) and (2, 1) are neighbours: only one of them is picked
+    assert len({(1, 1), (2, 1)} & set(chosen)) == 1
+    assert selection.overview.shape == (256, 256, 3)
+    assert selection.tiles_scored == selection.tiles_total == 64
+
+
+def test_scoring_budget_samples_a_grid(tmp_path):
+    path = write_tiff(tmp_path / "slide.tif", 4096, 4096, tile=512, tile_fn=slide_tile({(0, 0)}))
+    mapped, source = _open(path, TIFF)
+    try:
+        selection = select_regions(source, count=2, max_scored=16)
+    finally:
+        source.close()
+        mapped.close()
+    assert selection.tiles_scored == 16
+    assert selection.regions[0][0] == Tile(0, 0, 0, 512, 512)
+
+
+def test_series_selection_spreads_over_the_body(tmp_path):
+    path = write_dicom(tmp_path / "ct.dcm", ct_series(), window=(40, 400))
+    mapped, source = _open(path, DICOM)
+    try:
+        selection = select_regions(source, count=4)
+    finally:
+        source.close()
+        mapped.close()
+    frames = [t.frame for t, _, _ in selection.regions]
+    assert len(set(frames)) == 4 and all(12 <= f <= 27 for f in frames)
+    # The best frames come first and lie at least a slab (40 // 8 frames) apart
+    assert abs(frames[0] - frames[1]) >= 5
+    assert selection.overview is None
+
+
+# --- Ingestion -----------------------------------------------------------------------------
+
+def _peak_ingest(path) -> int:
+    with open(path, "rb") as f:
+        tracemalloc.start()
+        try:
+            ingest_scan(f, TIFF)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def test_peak_memory_does_not_grow_with_the_file(tmp_path):
+    tissue = {(0, 0), (3, 3)}
+    small = write_tiff(tmp_path / "small.tif", 2048, 2048, tile=512, tile_fn=slide_tile(tissue))
+    large = write_tiff(tmp_path / "large.tif", 6144, 6144, tile=512, tile_fn=slide_tile(tissue))
+    small_peak, large_peak = _peak_ingest(small), _peak_ingest(large)
+    assert large.stat().st_size > 100 * 1024 * 1024
+    assert large_peak < small_peak * 1.5
+    assert large_peak < large.stat().st_size / 10
+
+
+def test_ingest_image_reduces_scans_to_regions(tmp_path):
+    path = write_dicom(tmp_path / "ct.dcm", ct_series(), window=(40, 400))
+    with open(path, "rb") as f:
+        ingested = asyncio.run(ingest_image(UploadFile(io.BytesIO(f.read()), filename="ct.dcm")))
+    assert ingested.scan["source"] == DICOM and ingested.scan["frames"] == 40
+    assert len(ingested.regions) == settings.scan_regions
+    assert len(ingested.blobs()) == len(ingested.regions) + 1
+    assert ingested.perception_inputs() == [r.data for r in ingested.regions]
+    assert Image.open(io.BytesIO(ingested.data)).size == (64, 64)
+
+
+def test_unsupported_small_tiff_falls_back_to_pillow(tmp_path):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 10, 10)).save(buffer, format="TIFF", compression="tiff_lzw")
+    buffer.seek(0)
+    ingested = asyncio.run(ingest_image(UploadFile(buffer, filename="scan.tif")))
+    assert ingested.regions == [] and ingested.scan is None
+    assert ingested.original_size == (64, 48)
+
+
+def test_ordinary_tiffs_are_decoded_whole(monkeypatch):
+    buffer = io.BytesIO()
+    pixels = np.random.default_rng(3).integers(0, 255, (1500, 2000, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(buffer, format="TIFF")
+
+    def ingest():
+        buffer.seek(0)
+        return asyncio.run(ingest_image(UploadFile(buffer, filename="photo.tif", size=len(buffer.getvalue()))))
+
+    photo = ingest()
+    assert photo.regions == [] and photo.scan is None
+    assert photo.original_size == (2000, 1500)
+
+    # Past SCAN_MIN_PIXELS the same file is a scan
+    monkeypatch.setattr(settings, "scan_min_pixels", 1000 * 1000)
+    assert ingest().scan["source"] == TIFF
+
+
+def test_endpoints_send_the_selected_regions(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "scan_min_pixels", 1024 * 1024)
+    path = write_tiff(tmp_path / "slide.tif", 2048, 2048, tile=512, tile_fn=slide_tile({(0, 0), (2, 0), (0, 3), (3, 2)}))
+    received, perceived = [], []
+
+    async def run_ai_analysis(content_parts):
+        received.append(content_parts)
+        return {"is_relevant": True}
+
+    async def predict_case_async(images, cancer_type):
+        perceived.append(images)
+        return await perception_service.predict_async(images[0], cancer_type)
+
+    monkeypatch.setattr(analysis, "run_ai_analysis", run_ai_analysis)
+    monkeypatch.setattr(perception_service, "predict_case_async", predict_case_async)
+    client = TestClient(app)
+    with open(path, "rb") as f:
+        assert client.post("/api/v1/ai-analyze", files={"file": ("slide.tif", f, "image/tiff")}).status_code == 200
+    assert len(received[0]) == 1 + settings.scan_regions
+    assert all(part["mime_type"] == "image/jpeg" for part in received[0])
+
+    with open(path, "rb") as f:
+        response = client.post(
+            "/api/v1/analyze",
+            params={"cancer_type": "breast", "age": 50, "symptoms": "[]", "risk_factors": "[]"},
+            files={"file": ("slide.tif", f, "image/tiff")},
+        )
+    assert response.status_code == 200
+    assert len(perceived[0]) == settings.scan_regions
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import pytest
+from pydantic import BaseModel
+
+from app.core.metrics import LLM_PARSE_FAILURES, LLM_STRUCTURED_OUTPUTS
+from app.models.schemas import ChartData, LLMOutput, OncologyAnalysis, RelevanceOutput
+from app.services import gemini_service
+from app.services.streaming import AnalysisStreamParser, parse_analysis
+from app.services.structured import StructuredOutputError, parse_structured, response_schema
+
+CHART = {"cancer_types_probability": {"Benign/Normal": 0.7, "Malignant (General)": 0.3},
+         "risk_factors": {"Age": 4.0, "Lifestyle": 2.0}}
+MARKDOWN = 'Findings: "spiculated" margins, {size} 2 cm \\ café \U0001F52C\n\n- CT follow-up\n'
+STRUCTURED = json.dumps({
+    "analysis": MARKDOWN,
+    "chart_data": {key: [{"label": k, "value": v} for k, v in values.items()] for key, values in CHART.items()},
+})
+
+
+class RecordingModel:
+    def __init__(self, text):
+        self.text = text
+
+    async def generate_content_async(self, contents, generation_config=None):
+        return SimpleNamespace(text=self.text, usage_metadata=None)
+
+
+def _split_randomly(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 40)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_response_schemas_use_the_gemini_subset():
+    schema = response_schema(LLMOutput)
+    assert schema["type"] == "OBJECT"
+    assert schema["properties"]["triage_level"]["enum"] == ["Low", "Moderate", "High", "Critical"]
+    assert schema["properties"]["risk_adjustment"]["type"] == "INTEGER"
+    assert set(schema["required"]) == set(LLMOutput.model_fields)
+
+    analysis = response_schema(OncologyAnalysis)
+    chart = analysis["properties"]["chart_data"]
+    assert chart["properties"]["risk_factors"]["items"]["properties"]["value"] == {"type": "NUMBER"}
+    # Model docstrings stay out of what the model is sent
+    assert chart["description"] == OncologyAnalysis.model_fields["chart_data"].description
+    assert "$ref" not in json.dumps(analysis) and "title" not in json.dumps(analysis)
+
+
+def test_optional_fields_are_nullable_and_maps_are_rejected():
+    class WithOptional(BaseModel):
+        note: Optional[str] = None
+
+    class WithMap(BaseModel):
+        scores: Dict[str, float]
+
+    assert response_schema(WithOptional)["properties"]["note"] == {"type": "STRING", "nullable": True}
+    with pytest.raises(ValueError):
+        response_schema(WithMap)
+
+
+def test_parse_structured_outcomes():
+    before = {o: LLM_STRUCTURED_OUTPUTS.value("test", o) for o in ("schema", "recovered", "failed")}
+    failures = LLM_PARSE_FAILURES.value("test")
+
+    assert parse_structured("test", '{"is_relevant": true, "reason": "ok"}', RelevanceOutput).is_relevant
+    # Prose around the object, braces inside strings and a decoy object before it
+    text = 'Sure {not json}. ```json\n{"is_relevant": false, "reason": "a {cat} photo"}\n``` Done }'
+    assert parse_structured("test", text, RelevanceOutput).reason == "a {cat} photo"
+    with pytest.raises(StructuredOutputError):
+        parse_structured("test", '{"is_relevant": "maybe"', RelevanceOutput)
+
+    after = {o: LLM_STRUCTURED_OUTPUTS.value("test", o) for o in before}
+    assert after == {o: before[o] + 1 for o in before}
+    assert LLM_PARSE_FAILURES.value("test") == failures + 1
+
+
+def test_structured_stream_decodes_analysis_under_any_chunking():
+    rng = random.Random(3)
+    for text in (STRUCTURED, json.dumps(json.loads(STRUCTURED), ensure_ascii=False, indent=2)):
+        for _ in range(100):
+            parser = AnalysisStreamParser("test")
+            emitted = "".join(parser.feed(chunk) for chunk in _split_randomly(text, rng))
+            remaining, chart = parser.finish()
+            assert parser.mode == "json"
+            assert emitted + remaining == MARKDOWN
+            assert chart == CHART
+
+
+def test_structured_stream_emits_analysis_as_it_arrives():
+    parser = AnalysisStreamParser("test")
+    assert parser.feed('  {"analysis": "## Fin') == "## Fin"
+    assert parser.feed('dings\\n\\u00e') == "dings\n"
+    assert parser.feed('9", "chart_data"') == "é"
+    assert parser.feed(': {"risk_factors": [{"label": "x", "value": 1}]}}') == ""
+
+
+def test_free_text_answers_are_recovered():
+    recovered = LLM_STRUCTURED_OUTPUTS.value("analysis", "recovered")
+    fenced = MARKDOWN + "```json\n" + json.dumps(CHART) + "\n```\n"
+    assert parse_analysis(fenced) == (MARKDOWN + "\n", CHART)
+    # The whole structured answer inside a fence
+    assert parse_analysis("```json\n" + STRUCTURED + "\n```") == (MARKDOWN, CHART)
+    assert LLM_STRUCTURED_OUTPUTS.value("analysis", "recovered") == recovered + 2
+
+
+def test_unparseable_chart_data_is_counted():
+    failures = LLM_PARSE_FAILURES.value("analysis")
+    assert parse_analysis("text ```json\n{not json}\n```") == ("text ", None)
+    assert parse_analysis('{"analysis": "cut off mid-') == ("cut off mid-", None)
+    assert parse_analysis("no chart at all") == ("no chart at all", None)
+    assert LLM_PARSE_FAILURES.value("analysis") == failures + 3
+
+
+def test_chart_data_accepts_both_forms():
+    listed = ChartData.model_validate(json.loads(STRUCTURED)["chart_data"])
+    assert listed == ChartData.model_validate(CHART)
+    assert listed.as_chart() == CHART
+
+
+def test_gemini_calls_return_separate_fields(monkeypatch):
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_service, "model_flash", RecordingModel('{"is_relevant": true, "reason": "scan"}'))
+    monkeypatch.setattr(gemini_service, "model_pro", RecordingModel(STRUCTURED))
+    assert asyncio.run(gemini_service.check_relevance(["cough"])) == (True, "scan")
+    assert asyncio.run(gemini_service.analyze_oncology(["cough"])) == (MARKDOWN, CHART)
+
+    for _, options in gemini_service.warmup_models():
+        assert options["generation_config"]["response_mime_type"] == "application/json"
+        assert "response_schema" in options["generation_config"]
+
+
+def test_unparseable_guardrail_answer_proceeds(monkeypatch):
+    monkeypatch.setattr(gemini_service, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_service, "model_flash", RecordingModel("I think so"))
+    is_relevant, reason = asyncio.run(gemini_service.check_relevance(["cough"]))
+    assert is_relevant is True
+    assert "Could not parse" in reason
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.models.schemas import LLMInput, LLMOutput, PatientInput, PerceptionOutput
+from app.services import pipeline
+from app.services.cognitive import cognitive_service
+from app.services.triage_rules import (
+    TriageRule, TriageRuleEngine, evaluate, load_recorded_cases, load_rules, record_case, triage_rules,
+)
+
+
+def _input(cri, confidence=0.9, symptoms=1, age=50):
+    return LLMInput(
+        cancer_type="lung", ml_confidence=confidence, preliminary_cri=cri,
+        symptoms=[f"s{i}" for i in range(symptoms)], age=age, risk_factors=[]
+    )
+
+
+def test_clear_cut_bands_skip_the_llm():
+    engine = TriageRuleEngine(load_rules())
+    critical = engine.decide(_input(95, confidence=0.95, symptoms=6))
+    assert critical.triage_level == "Critical"
+    assert "95/100" in critical.explanation
+    assert engine.decide(_input(5, symptoms=0)).triage_level == "Low"
+
+    # Borderline cases, and low scores in elderly patients, go to the LLM
+    assert engine.decide(_input(55)) is None
+    assert engine.decide(_input(5, age=80)) is None
+
+    stats = engine.stats()
+    assert stats["fast_path"] == 2
+    assert stats["escalated"] == 2
+    assert stats["fast_path_ratio"] == 0.5
+    assert stats["by_rule"] == {"critical_band": 1, "low_band": 1}
+
+
+def test_first_matching_rule_wins_and_disabled_engine_defers():
+    rules = [
+        TriageRule("a", {"min_cri": 50}, "High", 2, "a", "a"),
+        TriageRule("b", {"min_cri": 0}, "Low", 0, "b", "b"),
+    ]
+    engine = TriageRuleEngine(rules)
+    assert engine.decide(_input(60)).explanation == "a"
+    assert engine.decide(_input(10)).explanation == "b"
+    engine.enabled = False
+    assert engine.decide(_input(60)) is None
+
+
+@pytest.mark.parametrize("rule", [
+    {"when": {"min_score": 1}},
+    {"when": {}},
+    {"triage_level": "Urgent"},
+    {"risk_adjustment": 20},
+])
+def test_invalid_rules_are_rejected(rule):
+    base = {"name": "r", "when": {"min_cri": 90}, "triage_level": "Critical", "risk_adjustment": 5,
+            "explanation": "e", "recommendation": "r"}
+    with pytest.raises(ValueError):
+        TriageRule(**{**base, **rule})
+
+
+def test_agreement_with_the_llm_on_recorded_cases():
+    report = evaluate(TriageRuleEngine(load_rules()), load_recorded_cases())
+    assert report["cases"] >= 40
+    # Triaging a case lower than the LLM would is the costly mistake.
+    assert report["under_triage"] == 0
+    assert report["agreement"] >= 0.9
+    assert report["coverage"] >= 0.4
+
+
+def test_recorded_cases_round_trip(tmp_path):
+    path = str(tmp_path / "cases.jsonl")
+    output = LLMOutput(triage_level="High", risk_adjustment=3, explanation="e", recommendation="r")
+    record_case(path, _input(60), output)
+    record_case(path, _input(70), output)
+    cases = load_recorded_cases(path)
+    assert [c[0].preliminary_cri for c in cases] == [60, 70]
+    assert cases[0][1] == output
+
+
+def test_fast_path_case_never_calls_the_cognitive_service(monkeypatch):
+    calls = []
+
+    async def analyze_async(data):
+        calls.append(data)
+        return LLMOutput(triage_level="High", risk_adjustment=2, explanation="llm", recommendation="llm")
+
+    monkeypatch.setattr(cognitive_service, "analyze_async", analyze_async)
+    monkeypatch.setattr(triage_rules, "enabled", True)
+    case = PatientInput(cancer_type="lung", age=45, symptoms=[], risk_factors=[])
+
+    clear = asyncio.run(pipeline.complete_triage(case, PerceptionOutput(prediction="normal", confidence=0.9), 0))
+    assert clear.triage_level == "Low"
+    assert calls == []
+
+    borderline = asyncio.run(pipeline.complete_triage(case, PerceptionOutput(prediction="suspected", confidence=0.7), 55))
+    assert borderline.explanation == "llm"
+    assert borderline.final_cri == 57
+    assert len(calls) == 1
+
+
+def test_stats_endpoint():
+    response = TestClient(app).get("/api/v1/analyze/stats")
+    assert response.status_code == 200
+    assert set(json.loads(response.text)["triage_rules"]) >= {"fast_path", "escalated", "fast_path_ratio"}
@@ -0,0 +1,104 @@
+"""
+Builds the tiny bundled perception models in data/models/.
+
+These are hand-initialized test models, not clinically trained: fixed edge
+and texture filters feed a linear head that maps low texture energy to
+"normal", high energy to "suspected" and the band in between to
+"inconclusive". Each cancer type gets a slightly different head so the
+per-type model plumbing is exercised. Writes an .npz for the NumPy backend
+and, when the `onnx` package is installed, an equivalent .onnx graph.
+
+Usage (from backend/):
+    python tools/build_perception_models.py
+"""
+import os
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "models")
+
+# (edge gain, decision midpoint) per model
+HEADS = {
+    "brain": (110.0, 0.028),
+    "lung": (100.0, 0.030),
+    "breast": (105.0, 0.029),
+    "default": (100.0, 0.030),
+}
+
+
+def build_weights(gain: float, midpoint: float) -> dict:
+    sobel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]], dtype=np.float32) / 4
+    laplacian = np.array([[0, 1, 0], [1, -4, 1], [0, 1, 0]], dtype=np.float32) / 4
+    conv_w = np.stack([
+        np.full((3, 3), 1 / 9, dtype=np.float32),  # local brightness
+        sobel_x, -sobel_x, sobel_x.T, -sobel_x.T,    # edges in four directions
+        laplacian, -laplacian,                       # blobs / spots
+        np.array([[1, 0, -1], [0, 0, 0], [-1, 0, 1]], dtype=np.float32) / 4,  # diagonal texture
+    ])
+    conv_b = np.zeros(len(conv_w), dtype=np.float32)
+
+    # Features: [mean(8), max(8)]; texture energy = mean of the edge/blob/texture channels
+    energy = np.zeros(16, dtype=np.float32)
+    energy[1:8] = 1 / 7
+    fc_w = np.stack([
+        -gain * energy,                      # normal
+        gain * energy,                       # suspected
+        np.zeros(16, dtype=np.float32),      # inconclusive
+    ])
+    offset = gain * midpoint
+    fc_b = np.array([offset, -offset, 0.75], dtype=np.float32)
+    return {"conv_w": conv_w, "conv_b": conv_b, "fc_w": fc_w, "fc_b": fc_b}
+
+
+def export_onnx(weights: dict, path: str):
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    initializers = [
+        numpy_helper.from_array(weights["conv_w"][:, None, :, :], "conv_w"),
+        numpy_helper.from_array(weights["conv_b"], "conv_b"),
+        numpy_helper.from_array(weights["fc_w"], "fc_w"),
+        numpy_helper.from_array(weights["fc_b"], "fc_b"),
+    ]
+    nodes = [
+        helper.make_node("Conv", ["image", "conv_w", "conv_b"], ["conv"], kernel_shape=[3, 3]),
+        helper.make_node("Relu", ["conv"], ["act"]),
+        helper.make_node("GlobalAveragePool", ["act"], ["avg"]),
+        helper.make_node("GlobalMaxPool", ["act"], ["max"]),
+        helper.make_node("Concat", ["avg", "max"], ["pooled"], axis=1),
+        helper.make_node("Flatten", ["pooled"], ["features"], axis=1),
+        helper.make_node("Gemm", ["features", "fc_w", "fc_b"], ["logits"], transB=1),
+        helper.make_node("Softmax", ["logits"], ["probabilities"], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes, "perception",
+        [helper.make_tensor_value_info("image", TensorProto.FLOAT, ["batch", 1, 64, 64])],
+        [helper.make_tensor_value_info("probabilities", TensorProto.FLOAT, ["batch", 3])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+
+
+def main():
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    try:
+        import onnx  # noqa: F401
+        with_onnx = True
+    except ImportError:
+        with_onnx = False
+        print("onnx not installed; skipping .onnx export")
+
+    for name, (gain, midpoint) in HEADS.items():
+        weights = build_weights(gain, midpoint)
+        base = os.path.join(MODEL_DIR, f"perception_{name}")
+        np.savez(f"{base}.npz", **weights)
+        if with_onnx:
+            export_onnx(weights, f"{base}.onnx")
+        print(f"Wrote {base}")
+
+
+if __name__ == "__main__":
+    main()
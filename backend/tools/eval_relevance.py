@@ -0,0 +1,33 @@
+"""
+Offline accuracy of the local relevance pre-classifier.
+
+Usage (from backend/):
+    python tools/eval_relevance.py [--data data/relevance_eval.jsonl]
+        [--classifier lexicon] [--accept 0.9] [--reject 0.1]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.config import settings  # noqa: E402
+from app.services.relevance import RelevancePrefilter, evaluate, load_classifier, load_labeled_examples  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=None, help="Labeled JSONL file ({'text', 'label'} per line)")
+    parser.add_argument("--classifier", default=settings.relevance_classifier)
+    parser.add_argument("--accept", type=float, default=settings.relevance_accept_threshold)
+    parser.add_argument("--reject", type=float, default=settings.relevance_reject_threshold)
+    args = parser.parse_args()
+
+    prefilter = RelevancePrefilter(load_classifier(args.classifier), accept_threshold=args.accept, reject_threshold=args.reject)
+    report = evaluate(prefilter, load_labeled_examples(args.data))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
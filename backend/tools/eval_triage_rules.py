@@ -0,0 +1,31 @@
+"""
+Offline agreement between the rule-based triage fast path and the LLM, on
+recorded cases (set TRIAGE_RECORD_PATH to record live LLM answers).
+
+Usage (from backend/):
+    python tools/eval_triage_rules.py [--data data/triage_eval.jsonl] [--rules data/triage_rules.json]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.config import settings  # noqa: E402
+from app.services.triage_rules import TriageRuleEngine, evaluate, load_recorded_cases, load_rules  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=None, help="Recorded JSONL file ({'input', 'llm'} per line)")
+    parser.add_argument("--rules", default=settings.triage_rules_path, help="Rules JSON file")
+    args = parser.parse_args()
+
+    engine = TriageRuleEngine(load_rules(args.rules))
+    report = evaluate(engine, load_recorded_cases(args.data))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
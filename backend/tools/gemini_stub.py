@@ -0,0 +1,178 @@
+"""
+Local stand-in for the Gemini API, for load tests and benchmarks.
+
+Answers the requests made by app.services.llm.StubModel with canned
+responses after a configurable latency, and fails a configurable fraction of
+them with HTTP 500. Point the backend at it with GEMINI_STUB_URL.
+
+Usage (from backend/):
+    python tools/gemini_stub.py [--port 8081] [--latency lognormal:800:0.4]
+                                [--error-rate 0.01] [--responses canned.json] [--seed 0]
+
+Latency specs (milliseconds):
+    fixed:MS              every call takes MS
+    uniform:LOW:HIGH      uniformly distributed between LOW and HIGH
+    lognormal:MEDIAN:SIGMA  long-tailed, like real LLM calls
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHART_BLOCK = {
+    "cancer_types_probability": {"Benign/Normal": 0.55, "Malignant (General)": 0.35, "Specific Type A (if applicable)": 0.1},
+    "risk_factors": {"Age": 5, "Family History": 3, "Lifestyle": 4, "Visual Evidence": 6},
+}
+
+ANALYSIS_MARKDOWN = (
+    "## Detailed Analysis\n\nStub analysis of the provided case. The findings are non-specific "
+    "and warrant further evaluation.\n\n## Probability Assessment\n\nThis is an AI assessment, "
+    "not a confirmed diagnosis.\n\n## Recommendations\n\n- Contrast-enhanced CT\n- Specialist referral\n\n"
+)
+
+# Canned answers, keyed by the kind of call (see classify_request). "analysis_structured"
+# answers analysis calls that ask for JSON (response_mime_type), like the backend's.
+DEFAULT_RESPONSES = {
+    "relevance": json.dumps({"is_relevant": True, "reason": "Stub guardrail: medical content."}),
+    "triage": json.dumps({
+        "triage_level": "High",
+        "risk_adjustment": 3,
+        "explanation": "Stub explanation: imaging confidence and symptoms are consistent.",
+        "recommendation": "Consult a specialist within 24-48 hours.",
+    }),
+    "analysis": ANALYSIS_MARKDOWN + "```json\n" + json.dumps(CHART_BLOCK, indent=4) + "\n```\n",
+    "analysis_structured": json.dumps({
+        "analysis": ANALYSIS_MARKDOWN,
+        "chart_data": {key: [{"label": k, "value": v} for k, v in values.items()] for key, values in CHART_BLOCK.items()},
+    }),
+    "default": "Stub response.",
+}
+
+
+def classify_request(contents: list, system_instruction: Optional[str] = None) -> str:
+    """Which of the backend's prompts this is, judged by its system instruction (or first text part)."""
+    text = system_instruction or next((p.get("text", "") for p in contents if p.get("text")), "")
+    if "content filter" in text:
+        return "relevance"
+    if "triage decision-support" in text:
+        return "triage"
+    if "Oncologist" in text:
+        return "analysis"
+    return "default"
+
+
+@dataclass
+class StubConfig:
+    latency: str = "fixed:0"
+    error_rate: float = 0.0
+    stream_chunks: int = 8
+    responses: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_RESPONSES))
+    seed: Optional[int] = None
+
+
+def estimate_usage(body: dict, text: str) -> dict:
+    """Token counts at ~4 characters per token, so clients see usage metadata like Gemini's."""
+    prompt_chars = len(body.get("system_instruction") or "")
+    prompt_chars += sum(len(p.get("text", "")) for p in body.get("contents", []))
+    images = sum(1 for p in body.get("contents", []) if "data" in p)
+    return {
+        "prompt_token_count": -(-prompt_chars // 4) + 258 * images,
+        "candidates_token_count": -(-len(text) // 4),
+    }
+
+
+def parse_latency(spec: str):
+    """Returns `sample(rng) -> seconds` for a latency spec (see module docstring)."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000.0
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(max(values[0], 1e-6))
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000.0
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def create_app(config: Optional[StubConfig] = None) -> FastAPI:
+    config = config or StubConfig()
+    sample_latency = parse_latency(config.latency)
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Gemini stand-in")
+    app.state.config = config
+    app.state.calls = {}
+
+    @app.post("/v1/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        kind = classify_request(body.get("contents", []), body.get("system_instruction"))
+        app.state.calls[kind] = app.state.calls.get(kind, 0) + 1
+        delay = sample_latency(rng)
+        fail = rng.random() < config.error_rate
+        structured = (body.get("generation_config") or {}).get("response_mime_type") == "application/json"
+        if structured and f"{kind}_structured" in config.responses:
+            text = config.responses[f"{kind}_structured"]
+        else:
+            text = config.responses.get(kind, config.responses.get("default", ""))
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            if fail:
+                return JSONResponse(status_code=500, content={"error": "stub: injected failure"})
+            return {"text": text, "usage": estimate_usage(body, text)}
+
+        if fail:
+            await asyncio.sleep(delay)
+            return JSONResponse(status_code=500, content={"error": "stub: injected failure"})
+
+        async def chunks():
+            # Spread the total latency across the chunks, like token-by-token generation
+            count = max(1, config.stream_chunks)
+            size = -(-len(text) // count)
+            for i in range(0, len(text), size):
+                await asyncio.sleep(delay / count)
+                chunk = {"text": text[i:i + size]}
+                if i + size >= len(text):
+                    # Like Gemini, the final chunk carries usage for the whole response
+                    chunk["usage"] = estimate_usage(body, text)
+                yield json.dumps(chunk) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.get("/v1/stats")
+    async def stats():
+        return {"calls": app.state.calls}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:800:0.4", help="Latency spec in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 500")
+    parser.add_argument("--stream-chunks", type=int, default=8)
+    parser.add_argument("--responses", help="JSON file mapping relevance/triage/analysis/analysis_structured/default to canned text")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    responses = dict(DEFAULT_RESPONSES)
+    if args.responses:
+        with open(args.responses, "r") as f:
+            responses.update(json.load(f))
+
+    import uvicorn
+    config = StubConfig(args.latency, args.error_rate, args.stream_chunks, responses, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 'use client';
 
 import React, { useState, ChangeEvent } from 'react';
-import axios from 'axios';
 import dynamic from 'next/dynamic';
 import { Upload, FileText, AlertCircle, CheckCircle, Activity, Brain } from 'lucide-react';
 
@@ -47,15 +46,59 @@ export default function AnalysisPage() {
         if (text) formData.append('text', text);
 
         try {
-            const response = await axios.post('http://localhost:8000/api/v1/ai-analyze', formData, {
-                headers: {
-                    'Content-Type': 'multipart/form-data',
-                },
+            // Stream the analysis (server-sent events) so text renders while Gemini is still generating
+            const response = await fetch('http://localhost:8000/api/v1/ai-analyze/stream', {
+                method: 'POST',
+                body: formData,
             });
-            setResult(response.data);
+            if (!response.ok || !response.body) {
+                const body = await response.json().catch(() => null);
+                throw new Error(body?.detail || 'An error occurred during analysis.');
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let current: AnalysisResult = { is_relevant: true, reason: '', analysis: '' };
+
+            const handleEvent = (raw: string) => {
+                let event = 'message';
+                let data = '';
+                for (const line of raw.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (!data) return;
+                const payload = JSON.parse(data);
+
+                if (event === 'relevance') {
+                    current = { ...current, is_relevant: payload.is_relevant, reason: payload.reason };
+                } else if (event === 'chunk') {
+                    current = { ...current, analysis: (current.analysis || '') + payload.text };
+                } else if (event === 'chart') {
+                    current = { ...current, chart_data: payload.chart_data };
+                } else if (event === 'error') {
+                    setError(payload.detail);
+                    return;
+                } else {
+                    return;
+                }
+                setResult(current);
+            };
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    handleEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+            }
         } catch (err: any) {
             console.error(err);
-            setError(err.response?.data?.detail || 'An error occurred during analysis.');
+            setError(err.message || 'An error occurred during analysis.');
         } finally {
             setLoading(false);
         }